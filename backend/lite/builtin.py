@@ -21,6 +21,7 @@ from collections import OrderedDict
 from venture.lite.sp_registry import registerBuiltinSP
 from venture.lite.sp_registry import builtInSPs
 from venture.lite.sp_registry import builtInSPsIter
+from venture.lite.sp_registry import numBuiltInSPs
 import venture.lite.value as v
 
 # These modules actually define the PSPs.
@@ -55,3 +56,20 @@ def builtInValues():
     ("false", v.VentureBool(False)),
     ("nil", v.VentureNil()),
   ])
+
+_bindings = None
+
+def builtInBindings():
+  """All the builtin values and SPs by name, in one OrderedDict.
+
+The dict is built once per process (and again only if more SPs are
+registered) and shared by every Lite trace, so it must not be
+mutated."""
+  global _bindings
+  values = builtInValues()
+  if _bindings is None or len(_bindings) != len(values) + numBuiltInSPs():
+    bindings = values
+    for name, sp in builtInSPsIter():
+      bindings[name] = sp
+    _bindings = bindings
+  return _bindings
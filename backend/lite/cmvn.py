@@ -18,7 +18,10 @@
 import math
 from scipy.special import gammaln
 import numpy as np
+import scipy.linalg as la
 
+from venture.lite.mvnormal import cholesky_downdate
+from venture.lite.mvnormal import cholesky_update
 from venture.lite.psp import DeterministicMakerAAAPSP
 from venture.lite.psp import NullRequestPSP
 from venture.lite.psp import RandomPSP
@@ -42,7 +45,19 @@ def mvtLogDensity(x,mu,Sigma,v):
   nterm1 = gammaln(v / 2.)
   nterm2 = (p / 2.) * math.log(v * math.pi)
   nterm3 = 0.5 * np.linalg.slogdet(Sigma)[1]
-  nterm4 = ((v + p) / 2.) * math.log1p((1. / v) * (x - mu).T * np.linalg.inv(Sigma) * (x - mu))
+  nterm4 = ((v + p) / 2.) * math.log1p((1. / v) * np.dot(x - mu, np.linalg.solve(Sigma, x - mu)))
+  return pterm1 - (nterm1 + nterm2 + nterm3 + nterm4)
+
+def mvtLogDensityCholesky(x,mu,L,v):
+  # Same as mvtLogDensity, given the lower Cholesky factor L of Sigma,
+  # in O(p^2).
+  p = np.size(x)
+  pterm1 = gammaln((v + p) / 2.)
+  nterm1 = gammaln(v / 2.)
+  nterm2 = (p / 2.) * math.log(v * math.pi)
+  nterm3 = np.sum(np.log(np.diag(L)))
+  z = la.solve_triangular(L, x - mu, lower=True)
+  nterm4 = ((v + p) / 2.) * math.log1p((1. / v) * np.dot(z, z))
   return pterm1 - (nterm1 + nterm2 + nterm3 + nterm4)
 
 def mvtSample(mu,Sigma,N,rng):
@@ -50,19 +65,25 @@ def mvtSample(mu,Sigma,N,rng):
   # enough to make search non trivial
   '''
   Output:
-  Produce M samples of d-dimensional multivariate t distribution
+  Produce a sample of d-dimensional multivariate t distribution
   Input:
   mu = mean (d dimensional numpy array or scalar)
   Sigma = scale matrix (dxd numpy array)
   N = degrees of freedom
-  M = # of samples to produce
   '''
 
   d = len(Sigma)
-  g = np.tile(rng.gamma(N/2., 2./N, 1), (d, 1))
-  Z = rng.multivariate_normal(np.zeros(d), Sigma, 1)
+  g = rng.gamma(N/2., 2./N)
+  Z = rng.multivariate_normal(np.zeros(d), Sigma)
+
+  return mu + Z/np.sqrt(g)
 
-  return mu + (Z.T)/np.sqrt(g)
+def mvtSampleCholesky(mu,L,N,rng):
+  # Same as mvtSample, given the lower Cholesky factor L of Sigma.
+  d = len(L)
+  g = rng.gamma(N/2., 2./N)
+  Z = np.dot(L, rng.standard_normal(d))
+  return mu + Z/np.sqrt(g)
 
 
 ### Collapsed Multivariate Normal
@@ -74,20 +95,119 @@ def mvtSample(mu,Sigma,N,rng):
 
 # TODO: I remember there being mistakes in this section (wrt dividing by N)
 
+class CMVNPosterior(object):
+  """Posterior parameters mN, kN, vN of a collapsed multivariate
+  normal, with the lower Cholesky factor L of the posterior scale
+  matrix SN.
+
+  Adding an observation x changes SN by the rank-one term
+  kN/(kN+1) (x - mN) (x - mN)^T, so the factor is maintained under
+  incorporation and unincorporation of single observations in O(d^2)
+  rather than refactored in O(d^3).  Instances are immutable, so
+  copies of a CMVNSPAux may share one.
+  """
+
+  def __init__(self, psp, N, mN, kN, vN, L):
+    self.psp = psp
+    self.N = N
+    self.mN = mN
+    self.kN = kN
+    self.vN = vN
+    self.L = L
+
+  @staticmethod
+  def of_aux(psp, aux):
+    """Factor the posterior scale matrix afresh.
+
+    Returns None if it is not numerically positive-definite.
+    """
+    (mN,kN,vN,SN) = psp.updatedParams(aux)
+    try:
+      L = la.cholesky(SN, lower=True)
+    except la.LinAlgError:
+      return None
+    return CMVNPosterior(psp, aux.N, mN, kN, vN, L)
+
+  def valid_for(self, psp, aux):
+    # The output PSP is replaced wholesale, rather than mutated, when
+    # the hyperparameters change.
+    return self.psp is psp and self.N == aux.N
+
+  def incorporate(self, x):
+    """Posterior with x added."""
+    kN = self.kN
+    L = cholesky_update(self.L, math.sqrt(kN / (kN + 1.)) * (x - self.mN))
+    mN = (kN * self.mN + x) / (kN + 1.)
+    return CMVNPosterior(self.psp, self.N + 1, mN, kN + 1, self.vN + 1, L)
+
+  def unincorporate(self, x):
+    """Posterior with x removed, or None if not positive-definite."""
+    kN = self.kN
+    try:
+      L = cholesky_downdate(self.L, math.sqrt(kN / (kN - 1.)) * (x - self.mN))
+    except la.LinAlgError:
+      return None
+    mN = (kN * self.mN - x) / (kN - 1.)
+    return CMVNPosterior(self.psp, self.N - 1, mN, kN - 1, self.vN - 1, L)
+
+  def mvtParams(self):
+    """Location, lower Cholesky factor of the scale matrix, and degrees
+    of freedom of the posterior predictive multivariate t."""
+    d = len(self.L)
+    scale = float(self.kN + 1) / (self.kN * (self.vN - d + 1))
+    return self.mN, math.sqrt(scale) * self.L, self.vN - d + 1
+
+  def logDetSN(self):
+    return 2 * np.sum(np.log(np.diag(self.L)))
+
 class CMVNSPAux(SPAux):
   def __init__(self,d):
     self.N = 0
-    self.STotal = np.mat(np.zeros((d,d)))
-    self.xTotal = np.mat(np.zeros((d,1)))
+    self.STotal = np.zeros((d,d))
+    self.xTotal = np.zeros(d)
     self.d = d
+    # CMVNPosterior of the current observations under the
+    # hyperparameters of the last PSP that used it, or None if it must
+    # be recomputed.
+    self.posterior = None
 
   def copy(self):
     aux = CMVNSPAux(self.d)
     aux.N = self.N
     aux.STotal = np.copy(self.STotal)
     aux.xTotal = np.copy(self.xTotal)
+    aux.posterior = self.posterior
     return aux
 
+  def incorporate(self, psp, x):
+    if self._posterior_current(psp):
+      self.posterior = self.posterior.incorporate(x)
+    else:
+      self.posterior = None
+    self.N += 1
+    self.xTotal += x
+    self.STotal += np.outer(x, x)
+
+  def unincorporate(self, psp, x):
+    if self._posterior_current(psp):
+      self.posterior = self.posterior.unincorporate(x)
+    else:
+      self.posterior = None
+    self.N -= 1
+    self.xTotal -= x
+    self.STotal -= np.outer(x, x)
+
+  def _posterior_current(self, psp):
+    return self.posterior is not None and self.posterior.valid_for(psp, self)
+
+  def posterior_for(self, psp):
+    """CMVNPosterior of the current observations under psp's
+    hyperparameters, or None if the posterior scale matrix is not
+    numerically positive-definite."""
+    if not self._posterior_current(psp):
+      self.posterior = CMVNPosterior.of_aux(psp, self)
+    return self.posterior
+
 class CMVNSP(SP):
   def __init__(self,requestPSP,outputPSP,d):
     super(CMVNSP,self).__init__(requestPSP,outputPSP)
@@ -98,7 +218,8 @@ class CMVNSP(SP):
 class MakeCMVNOutputPSP(DeterministicMakerAAAPSP):
   def simulate(self,args):
     (m0,k0,v0,S0) = args.operandValues()
-    m0 = np.mat(m0).transpose()
+    m0 = np.asarray(m0, dtype=float)
+    S0 = np.asarray(S0, dtype=float)
 
     d = np.size(m0)
     output = TypedPSP(CMVNOutputPSP(d,m0,k0,v0,S0), SPType([], t.HomogeneousArrayType(t.NumberType())))
@@ -120,7 +241,7 @@ class CMVNOutputPSP(RandomPSP):
     mN = ((self.k0 * self.m0 + spaux.xTotal) / (self.k0 + spaux.N))
     kN = self.k0 + spaux.N
     vN = self.v0 + spaux.N
-    SN = self.S0 + spaux.STotal + (self.k0 * self.m0 * self.m0.T) - (kN * mN * mN.T)
+    SN = self.S0 + spaux.STotal + (self.k0 * np.outer(self.m0, self.m0)) - (kN * np.outer(mN, mN))
 
     return (mN,kN,vN,SN)
 
@@ -134,35 +255,43 @@ class CMVNOutputPSP(RandomPSP):
     return self.mvtParams(*self.updatedParams(spaux))
 
   def simulate(self,args):
-    (mu, Sigma, N) = self.getMVTParams(args.spaux())
-    x = mvtSample(mu, Sigma, N, args.np_prng())
-    return x.A1
+    aux = args.spaux()
+    posterior = aux.posterior_for(self)
+    if posterior is None:
+      (mu, Sigma, N) = self.getMVTParams(aux)
+      return mvtSample(mu, Sigma, N, args.np_prng())
+    (mu, L, N) = posterior.mvtParams()
+    return mvtSampleCholesky(mu, L, N, args.np_prng())
 
   def logDensity(self,x,args):
-    x = np.mat(x).reshape((self.d,1))
-    return mvtLogDensity(x, *self.getMVTParams(args.spaux()))
+    x = np.asarray(x, dtype=float).reshape(self.d)
+    aux = args.spaux()
+    posterior = aux.posterior_for(self)
+    if posterior is None:
+      return mvtLogDensity(x, *self.getMVTParams(aux))
+    return mvtLogDensityCholesky(x, *posterior.mvtParams())
 
   def incorporate(self,x,args):
-    x = np.mat(x).reshape((self.d,1))
-    aux = args.spaux()
-    aux.N += 1
-    aux.xTotal += x
-    aux.STotal += x * x.T
+    x = np.asarray(x, dtype=float).reshape(self.d)
+    args.spaux().incorporate(self, x)
 
   def unincorporate(self,x,args):
-    x = np.mat(x).reshape((self.d,1))
-    aux = args.spaux()
-    aux.N -= 1
-    aux.xTotal -= x
-    aux.STotal -= x * x.T
+    x = np.asarray(x, dtype=float).reshape(self.d)
+    args.spaux().unincorporate(self, x)
 
   def logDensityOfData(self,aux):
-    (mN,kN,vN,SN) = self.updatedParams(aux)
+    posterior = aux.posterior_for(self)
+    if posterior is None:
+      (_mN,kN,vN,SN) = self.updatedParams(aux)
+      logDetSN = np.linalg.slogdet(SN)[1] # first is sign
+    else:
+      (kN,vN) = (posterior.kN,posterior.vN)
+      logDetSN = posterior.logDetSN()
     term1 = - (aux.N * self.d * math.log(math.pi)) / 2.
     term2 = logGenGamma(self.d, vN / 2.)
     term3 = - logGenGamma(self.d, self.v0 / 2.)
     term4 = (self.v0 / 2.) * np.linalg.slogdet(self.S0)[1] # first is sign
-    term5 = -(vN / 2.) * np.linalg.slogdet(SN)[1]
+    term5 = -(vN / 2.) * logDetSN
     term6 = (self.d / 2.) * math.log(float(self.k0) / kN)
     return term1 + term2 + term3 + term4 + term5 + term6
 
@@ -346,6 +346,19 @@ class NormalOutputPSP(RandomPSP):
   def logDensity(self, x, args):
     return self.logDensityNumeric(x,args.operandValues())
 
+  def logDensityBatch(self, xs, argsList):
+    (mu, sigma) = np.array([args.operandValues() for args in argsList],
+                           dtype=float).T
+    if np.any(sigma <= 0):
+      # Let the scalar path complain
+      return super(NormalOutputPSP, self).logDensityBatch(xs, argsList)
+    deviation = np.array(xs, dtype=float) - mu
+    return - np.log(sigma) - HALF_LOG2PI \
+      - (0.5 * deviation * deviation / (sigma * sigma))
+
+  def canBatchLogDensity(self):
+    return True
+
   def logDensityBound(self, x, args):
     return self.logDensityBoundNumeric(x, *args.operandValues())
 
@@ -382,6 +395,9 @@ class NormalvvOutputPSP(RandomPSP):
   def logDensity(self, x, args):
     return sum(scipy.stats.norm.logpdf(x, *args.operandValues()))
 
+  def canBatchLogDensity(self):
+    return True
+
   def gradientOfLogDensity(self,x,args):
     (mu, sigma) = args.operandValues()
     x = np.array(x); mu = np.array(mu); sigma = np.array(sigma)
@@ -403,6 +419,9 @@ class NormalsvOutputPSP(RandomPSP):
   def logDensity(self, x, args):
     return sum(scipy.stats.norm.logpdf(x, *args.operandValues()))
 
+  def canBatchLogDensity(self):
+    return True
+
   def gradientOfLogDensity(self, x, args):
     (mu, sigma) = args.operandValues()
     x = np.array(x); sigma = np.array(sigma)
@@ -423,6 +442,9 @@ class NormalvsOutputPSP(RandomPSP):
   def logDensity(self, x, args):
     return sum(scipy.stats.norm.logpdf(x, *args.operandValues()))
 
+  def canBatchLogDensity(self):
+    return True
+
   def gradientOfLogDensity(self, x, args):
     (mu, sigma) = args.operandValues()
     x = np.array(x); mu = np.array(mu)
@@ -864,6 +886,14 @@ class BetaOutputPSP(RandomPSP):
   def logDensity(self, x, args):
     return self.logDensityNumeric(x,args.operandValues())
 
+  def logDensityBatch(self, xs, argsList):
+    (alpha, beta) = np.array([args.operandValues() for args in argsList],
+                             dtype=float).T
+    return scipy.stats.beta.logpdf(np.array(xs, dtype=float), alpha, beta)
+
+  def canBatchLogDensity(self):
+    return True
+
   def gradientOfLogDensity(self, x, args):
     (alpha, beta) = args.operandValues()
     gradX = ((float(alpha) - 1) / x) - ((float(beta) - 1) / (1 - x))
@@ -1208,6 +1238,14 @@ class GammaOutputPSP(RandomPSP):
   def logDensity(self, x, args):
     return self.logDensityNumeric(x,*args.operandValues())
 
+  def logDensityBatch(self, xs, argsList):
+    (alpha, beta) = np.array([args.operandValues() for args in argsList],
+                             dtype=float).T
+    return self.logDensityNumeric(np.array(xs, dtype=float), alpha, beta)
+
+  def canBatchLogDensity(self):
+    return True
+
   def gradientOfLogDensity(self, x, args):
     (alpha, beta) = args.operandValues()
     gradX = ((alpha - 1) / float(x)) - beta
@@ -1246,6 +1284,19 @@ class StudentTOutputPSP(RandomPSP):
     shape = vals[2] if len(vals) > 1 else 1
     return self.logDensityNumeric(x,vals[0],loc,shape)
 
+  def logDensityBatch(self, xs, argsList):
+    def params(vals):
+      if len(vals) > 1:
+        return [vals[0], vals[1], vals[2]]
+      else:
+        return [vals[0], 0, 1]
+    (nu, loc, shape) = np.array(
+      [params(args.operandValues()) for args in argsList], dtype=float).T
+    return self.logDensityNumeric(np.array(xs, dtype=float), nu, loc, shape)
+
+  def canBatchLogDensity(self):
+    return True
+
   def gradientOfLogDensity(self, x, args):
     vals = args.operandValues()
     nu = vals[0]
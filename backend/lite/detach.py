@@ -15,6 +15,7 @@
 # You should have received a copy of the GNU General Public License
 # along with Venture.  If not, see <http://www.gnu.org/licenses/>.
 
+from collections import OrderedDict
 import math
 
 from venture.lite.node import isConstantNode
@@ -45,8 +46,17 @@ def detachAndExtractAtBorder(trace, border, scaffold, compute_gradient = False):
   serving as tape."""
   weight = 0
   omegaDB = OmegaDB()
+  if compute_gradient:
+    batched = set()
+  else:
+    # The parents of the absorbing nodes are only extracted after
+    # those nodes are unabsorbed, so all the absorbing nodes that can
+    # be unabsorbed in batches may as well be unabsorbed up front.
+    (weight, batched) = unabsorbBatches(trace, border, scaffold)
   for node in reversed(border):
-    if scaffold.isAbsorbing(node):
+    if node in batched:
+      weight += extractParents(trace, node, scaffold, omegaDB, compute_gradient)
+    elif scaffold.isAbsorbing(node):
       weight += detach(trace, node, scaffold, omegaDB, compute_gradient)
     else:
       if node.isObservation: weight += getAndUnconstrain(trace,node)
@@ -73,6 +83,8 @@ def unabsorb(trace, node, omegaDB, compute_gradient = False):
   # we need to pass groundValue here in case the return value is an SP
   # in which case the node would only contain an SPRef
   psp,args,gvalue = trace.pspAt(node),trace.argsAt(node),trace.groundValueAt(node)
+  if trace.phase_profile is not None:
+    trace.phase_profile.countPSP(psp, "unabsorb")
   maybeUnregisterRandomChoiceInScope(trace, node)
   psp.unincorporate(gvalue,args)
   weight = psp.logDensity(gvalue,args)
@@ -82,6 +94,29 @@ def unabsorb(trace, node, omegaDB, compute_gradient = False):
     omegaDB.addPartials(args.operandNodes + trace.esrParentsAt(node), grad)
   return weight
 
+def unabsorbBatches(trace, border, scaffold):
+  batches = OrderedDict() # psp -> absorbing nodes to unabsorb together
+  for node in reversed(border):
+    if scaffold.isAbsorbing(node):
+      psp = trace.pspAt(node)
+      if psp.canBatchLogDensity():
+        batches.setdefault(psp, []).append(node)
+  weight = 0
+  batched = set()
+  for (psp, nodes) in batches.iteritems():
+    if len(nodes) == 1:
+      continue # Not worth batching
+    if trace.phase_profile is not None:
+      trace.phase_profile.countPSP(psp, "unabsorb", len(nodes))
+    argsList = [trace.argsAt(node) for node in nodes]
+    gvalues = [trace.groundValueAt(node) for node in nodes]
+    for (node, gvalue, args) in zip(nodes, gvalues, argsList):
+      maybeUnregisterRandomChoiceInScope(trace, node)
+      psp.unincorporate(gvalue, args)
+    weight += sum(psp.logDensityBatch(gvalues, argsList))
+    batched.update(nodes)
+  return (weight, batched)
+
 def extractParents(trace, node, scaffold, omegaDB, compute_gradient = False):
   weight = 0
   for parent in reversed(trace.esrParentsAt(node)):
@@ -164,6 +199,8 @@ def teardownMadeSP(trace,node,isAAA):
 
 def unapplyPSP(trace, node, scaffold, omegaDB, compute_gradient = False):
   psp,args = trace.pspAt(node),trace.argsAt(node)
+  if trace.phase_profile is not None:
+    trace.phase_profile.countPSP(psp, "unapply")
   maybeUnregisterRandomChoiceInScope(trace, node)
   if psp.isRandom(): trace.unregisterRandomChoice(node)
   if isinstance(trace.valueAt(node),SPRef) and trace.valueAt(node).makerNode == node:
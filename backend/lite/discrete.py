@@ -18,6 +18,7 @@
 import math
 from collections import OrderedDict
 
+import numpy as np
 import scipy
 import scipy.special
 
@@ -44,6 +45,7 @@ from venture.lite.utils import logit
 from venture.lite.utils import sampleLogCategorical
 from venture.lite.utils import simulateCategorical
 from venture.lite.value import VentureInteger
+from venture.lite.value import venture_numeric_types
 import venture.lite.types as t
 
 
@@ -66,6 +68,15 @@ class BernoulliOutputPSP(DiscretePSP):
     else:
       return log1p(-p)
 
+  def logDensityBatch(self, vals, argsList):
+    ps = np.array([(args.operandValues() or [0.5])[0] for args in argsList],
+                  dtype=float)
+    with np.errstate(divide='ignore'):
+      return np.where(np.array(vals, dtype=bool), np.log(ps), np.log1p(-ps))
+
+  def canBatchLogDensity(self):
+    return True
+
   def gradientOfLogDensity(self, val, args):
     vals = args.operandValues()
     if len(vals) > 0:
@@ -226,6 +237,30 @@ class CategoricalOutputPSP(DiscretePSP):
     else:
       return logDensityCategorical(val,*vals)
 
+  def logDensityBatch(self, vals, argsList):
+    operands = [args.operandValues() for args in argsList]
+    widths = set(len(ops[0]) for ops in operands)
+    if any(len(ops) != 1 for ops in operands) or len(widths) != 1 or \
+       0 in widths or \
+       any(type(val) not in venture_numeric_types for val in vals):
+      # Only choices among the same number of default outputs are
+      # vectorized.
+      return super(CategoricalOutputPSP, self).logDensityBatch(vals, argsList)
+    ps = np.array([ops[0] for ops in operands], dtype=float)
+    totals = np.sum(ps, axis=1)
+    ps = np.where(totals[:, np.newaxis] > 0,
+                  ps / np.where(totals > 0, totals, 1)[:, np.newaxis],
+                  1.0 / ps.shape[1])
+    xs = np.array([val.getNumber() for val in vals])
+    valid = (xs == np.floor(xs)) & (0 <= xs) & (xs < ps.shape[1])
+    indexes = np.where(valid, xs, 0).astype(int)
+    p = np.where(valid, ps[np.arange(len(xs)), indexes], 0)
+    with np.errstate(divide='ignore'):
+      return np.log(p)
+
+  def canBatchLogDensity(self):
+    return True
+
   def enumerateValues(self, args):
     vals = args.operandValues()
     indexes = [i for i, p in enumerate(vals[0]) if p > 0]
@@ -346,6 +381,13 @@ class PoissonOutputPSP(DiscretePSP):
   def logDensity(self, val, args):
     return scipy.stats.poisson.logpmf(val, args.operandValues()[0])
 
+  def logDensityBatch(self, vals, argsList):
+    lams = np.array([args.operandValues()[0] for args in argsList], dtype=float)
+    return scipy.stats.poisson.logpmf(np.array(vals), lams)
+
+  def canBatchLogDensity(self):
+    return True
+
   def description(self, name):
     return '  %s(mu) samples a Poisson with rate mu' % name
 
@@ -116,6 +116,48 @@ class VentureEnvironment(VentureValue, tp.Generic[T]):
       # Skip the top frame, which is presumably the global environment
       self.outerEnv.printEnv()
 
+class BuiltinEnvironment(VentureEnvironment):
+  """The outermost frame of a Lite trace's global environment.
+
+Binds every builtin, but creates a builtin's node only when it is
+first looked up.  All traces share one table of builtins (see
+builtin.builtInBindings), so a new trace costs no more than its
+empty frame, and a trace only ever holds the nodes of the builtins
+its program uses.  The nodes themselves cannot be shared between
+traces, because the trace records children, SP families and aux
+on them."""
+  __slots__ = ('trace', 'builtins')
+  def __init__(self, trace, builtins):
+    super(BuiltinEnvironment, self).__init__()
+    self.trace = trace
+    self.builtins = builtins
+
+  def addBinding(self,sym,val):
+    if sym in self.builtins:
+      raise VentureError("Symbol '%s' already bound" % sym)
+    super(BuiltinEnvironment, self).addBinding(sym, val)
+
+  def removeBinding(self,sym):
+    assert isinstance(sym, str)
+    if not self.symbolBound(sym):
+      raise VentureError("Cannot unbind unbound symbol '%s'" % sym)
+    # Shadow rather than delete, so that the builtin is not recreated
+    self.frame[sym] = None
+
+  def findSymbol(self,sym):
+    if sym in self.frame: ret = self.frame[sym]
+    elif sym in self.builtins:
+      ret = self.trace.createBuiltinNode(sym, self.builtins[sym])
+      self.frame[sym] = ret
+    else: ret = None
+    if ret is None:
+      raise VentureError("Cannot find symbol '%s'" % sym)
+    return ret
+
+  def symbolBound(self, sym):
+    if sym in self.frame: return self.frame[sym] is not None
+    else: return sym in self.builtins
+
 registerVentureType(VentureEnvironment, "environment")
 # Exec is appropriate for metaprogramming
 exec(standard_venture_type("Environment", value_classname="VentureEnvironment")) # pylint: disable=exec-used
@@ -19,6 +19,7 @@ import copy
 from collections import OrderedDict
 
 import numpy as np
+import scipy.linalg as la
 
 from venture.lite.function import ParamLeaf
 from venture.lite.function import parameter_nest
@@ -40,12 +41,12 @@ import venture.lite.types as t
 import venture.lite.value as v
 import venture.value.dicts as vv
 
-def _gp_sample(mean, covariance, samples, xs, np_rng):
-  mu, sigma = _gp_mvnormal(mean, covariance, samples, xs)
+def _gp_sample(mean, covariance, samples, xs, np_rng, cholesky=None):
+  mu, sigma = _gp_mvnormal(mean, covariance, samples, xs, cholesky)
   return np_rng.multivariate_normal(mu, sigma)
 
-def _gp_logDensity(mean, covariance, samples, xs, os):
-  mu, sigma = _gp_mvnormal(mean, covariance, samples, xs)
+def _gp_logDensity(mean, covariance, samples, xs, os, cholesky=None):
+  mu, sigma = _gp_mvnormal(mean, covariance, samples, xs, cholesky)
   return mvnormal.logpdf(np.asarray(os).reshape(len(xs),), mu, sigma)
 
 def _gp_gradientOfLogDensity(mean, covariance, samples, xs, os):
@@ -93,12 +94,14 @@ def _gp_gradientOfLogDensity(mean, covariance, samples, xs, os):
 
   return np.array(dos1), [np.array(dxs1)]
 
-def _gp_logDensityOfData(mean, covariance, samples):
+def _gp_logDensityOfData(mean, covariance, samples, cholesky=None):
   if len(samples) == 0:
     return 0
   xs = np.asarray(samples.keys())
   os = np.asarray(samples.values())
   mu = mean.f(xs)
+  if cholesky is not None:
+    return mvnormal.logpdf(os, mu, None, covf=cholesky.factor())
   sigma = covariance.f(xs, xs)
   return mvnormal.logpdf(os, mu, sigma)
 
@@ -114,7 +117,9 @@ def _gp_gradientOfLogDensityOfData(mean, covariance, samples):
     mvnormal.dlogpdf(os, dos, mu, dmu, sigma, dsigma)
   return [dlogp_dmu_j, dlogp_dsigma_k]
 
-def _gp_mvnormal(mean, covariance, samples, xs):
+def _gp_mvnormal(mean, covariance, samples, xs, cholesky=None):
+  # If given, cholesky is a GPCholesky of the kernel matrix at the
+  # inputs of samples, which saves recomputing and refactoring it.
   xs = np.asarray(xs)
   if len(samples) == 0:
     mu = mean.f(xs)
@@ -127,26 +132,97 @@ def _gp_mvnormal(mean, covariance, samples, xs):
     sigma11 = covariance.f(xs, xs)
     sigma12 = covariance.f(xs, x2s)
     sigma21 = covariance.f(x2s, xs)
-    sigma22 = covariance.f(x2s, x2s)
+    if cholesky is None:
+      sigma22 = covariance.f(x2s, x2s)
+      covf22 = None
+    else:
+      sigma22 = None
+      covf22 = cholesky.factor()
     mu, sigma = mvnormal.conditional(
-      o2s, mu1, mu2, sigma11, sigma12, sigma21, sigma22)
+      o2s, mu1, mu2, sigma11, sigma12, sigma21, sigma22, covf22=covf22)
   return mu, sigma
 
+def _gp_key(x):
+  return tuple(x) if isinstance(x, np.ndarray) else x
+
+class GPCholesky(object):
+  """Lower Cholesky factor of a GP's kernel matrix at its observed inputs.
+
+  Maintained under incorporation and unincorporation of single inputs
+  by O(n^2) rank-one updates, rather than recomputed from scratch in
+  O(n^3).  Instances are immutable, so copies of a GPSPAux may share
+  one.
+  """
+
+  def __init__(self, mean, covariance, keys, L):
+    self.mean = mean
+    self.covariance = covariance
+    self.keys = keys
+    self.L = L
+
+  @staticmethod
+  def of_samples(mean, covariance, samples):
+    """Factor the kernel matrix at the inputs of samples afresh.
+
+    Returns None if the kernel matrix is not numerically
+    positive-definite.
+    """
+    keys = samples.keys()
+    if len(keys) == 0:
+      return GPCholesky(mean, covariance, keys, np.zeros((0, 0)))
+    xs = np.asarray(keys)
+    try:
+      L = la.cholesky(covariance.f(xs, xs), lower=True)
+    except la.LinAlgError:
+      return None
+    return GPCholesky(mean, covariance, keys, L)
+
+  def valid_for(self, mean, covariance, samples):
+    # The mean and covariance are replaced wholesale, rather than
+    # mutated, when the GP's hyperparameters change.
+    return self.mean is mean and self.covariance is covariance \
+      and len(self.keys) == len(samples)
+
+  def factor(self):
+    return mvnormal.Covariance_Cholesky.from_lower(self.L)
+
+  def append(self, key):
+    """Factor with the input key added, or None if not positive-definite."""
+    x = np.asarray([key])
+    k22 = self.covariance.f(x, x)[0, 0]
+    if len(self.keys) == 0:
+      k12 = np.zeros(0)
+    else:
+      k12 = self.covariance.f(np.asarray(self.keys), x)[:, 0]
+    try:
+      L = mvnormal.cholesky_append(self.L, k12, k22)
+    except la.LinAlgError:
+      return None
+    return GPCholesky(self.mean, self.covariance, self.keys + [key], L)
+
+  def delete(self, key):
+    """Factor with the input key removed."""
+    i = self.keys.index(key)
+    L = mvnormal.cholesky_delete(self.L, i)
+    keys = self.keys[:i] + self.keys[i+1:]
+    return GPCholesky(self.mean, self.covariance, keys, L)
+
 class GPOutputPSP(RandomPSP):
   def __init__(self, mean, covariance):
     self.mean = mean
     self.covariance = covariance
 
   def simulate(self, args):
-    samples = args.spaux().samples
+    aux = args.spaux()
     xs = args.operandValues()[0]
-    return _gp_sample(self.mean, self.covariance, samples, xs,
-                      args.np_prng())
+    return _gp_sample(self.mean, self.covariance, aux.samples, xs,
+                      args.np_prng(), self._cholesky(aux))
 
   def logDensity(self, os, args):
-    samples = args.spaux().samples
+    aux = args.spaux()
     xs = args.operandValues()[0]
-    return _gp_logDensity(self.mean, self.covariance, samples, xs, os)
+    return _gp_logDensity(self.mean, self.covariance, aux.samples, xs, os,
+                          self._cholesky(aux))
 
   def gradientOfLogDensity(self, os, args):
     samples = args.spaux().samples
@@ -155,38 +231,42 @@ class GPOutputPSP(RandomPSP):
       self.mean, self.covariance, samples, xs, os)
 
   def logDensityOfData(self, aux):
-    ans = _gp_logDensityOfData(self.mean, self.covariance, aux.samples)
+    ans = _gp_logDensityOfData(self.mean, self.covariance, aux.samples,
+                               self._cholesky(aux))
     assert not np.isnan(ans), \
       "GP got NaN log density of data at %s, %s, %s" \
       % (self.mean, self.covariance, aux.samples)
     return ans
 
   def incorporate(self, os, args):
-    samples = args.spaux().samples
+    aux = args.spaux()
     xs = args.operandValues()[0]
-
     for x, o in zip(xs, os):
-      samples[tuple(x) if isinstance(x, np.ndarray) else x] = o
+      aux.incorporate(self.mean, self.covariance, _gp_key(x), o)
 
   def unincorporate(self, _os, args):
-    samples = args.spaux().samples
+    aux = args.spaux()
     xs = args.operandValues()[0]
     for x in xs:
-      del samples[tuple(x) if isinstance(x, np.ndarray) else x]
+      aux.unincorporate(self.mean, self.covariance, _gp_key(x))
+
+  def _cholesky(self, aux):
+    return aux.cholesky_for(self.mean, self.covariance)
 
 class GPOutputPSP1(GPOutputPSP):
   # version of GPOutputPSP that accepts and returns scalars.
 
   def simulate(self, args):
-    samples = args.spaux().samples
+    aux = args.spaux()
     x = args.operandValues()[0]
-    return _gp_sample(self.mean, self.covariance, samples, [x],
-                      args.np_prng())[0]
+    return _gp_sample(self.mean, self.covariance, aux.samples, [x],
+                      args.np_prng(), self._cholesky(aux))[0]
 
   def logDensity(self, o, args):
-    samples = args.spaux().samples
+    aux = args.spaux()
     x = args.operandValues()[0]
-    return _gp_logDensity(self.mean, self.covariance, samples, [x], [o])
+    return _gp_logDensity(self.mean, self.covariance, aux.samples, [x], [o],
+                          self._cholesky(aux))
 
   def gradientOfLogDensity(self, o, args):
     samples = args.spaux().samples
@@ -195,14 +275,12 @@ class GPOutputPSP1(GPOutputPSP):
       self.mean, self.covariance, samples, [x], [o])
 
   def incorporate(self, o, args):
-    samples = args.spaux().samples
     x = args.operandValues()[0]
-    samples[x] = o
+    args.spaux().incorporate(self.mean, self.covariance, x, o)
 
   def unincorporate(self, _o, args):
-    samples = args.spaux().samples
     x = args.operandValues()[0]
-    del samples[x]
+    args.spaux().unincorporate(self.mean, self.covariance, x)
 
 gpType = SPType(
   [t.ArrayUnboxedType(t.NumericArrayType())],
@@ -212,11 +290,41 @@ gp1Type = SPType([t.NumberType()], t.NumberType())
 
 class GPSPAux(SPAux):
 
-  def __init__(self, samples):
+  def __init__(self, samples, cholesky=None):
     self.samples = samples
+    # GPCholesky of the kernel matrix at the inputs of samples, or
+    # None if it must be recomputed.
+    self.cholesky = cholesky
 
   def copy(self):
-    return GPSPAux(copy.copy(self.samples))
+    return GPSPAux(copy.copy(self.samples), self.cholesky)
+
+  def incorporate(self, mean, covariance, x, o):
+    if x not in self.samples:
+      if self._cholesky_current(mean, covariance):
+        self.cholesky = self.cholesky.append(x)
+      else:
+        self.cholesky = None
+    self.samples[x] = o
+
+  def unincorporate(self, mean, covariance, x):
+    if self._cholesky_current(mean, covariance):
+      self.cholesky = self.cholesky.delete(x)
+    else:
+      self.cholesky = None
+    del self.samples[x]
+
+  def _cholesky_current(self, mean, covariance):
+    return self.cholesky is not None and \
+      self.cholesky.valid_for(mean, covariance, self.samples)
+
+  def cholesky_for(self, mean, covariance):
+    """GPCholesky for the current samples under the given mean and
+    covariance, or None if the kernel matrix is not numerically
+    positive-definite."""
+    if not self._cholesky_current(mean, covariance):
+      self.cholesky = GPCholesky.of_samples(mean, covariance, self.samples)
+    return self.cholesky
 
   def asVentureValue(self):
     def encode(xy):
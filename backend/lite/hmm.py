@@ -39,22 +39,65 @@ def npSampleVector(pVec, np_rng):
   return np_rng.multinomial(1, pVec)
 def npIndexOfOne(pVec):
   return np.where(pVec == 1)[0][0]
-def npMakeDiag(colvec):
-  return np.diag(np.array(colvec))
 def npNormalizeVector(vec): return vec / np.sum(vec)
 
+class HMMForwardFilter(object):
+  """Normalized forward messages of an UncollapsedHMMSP.
+
+  fs[i] is the filtering distribution of the state at time i given the
+  observations up to i, and log_weights[i] is the log marginal
+  probability of those observations.  Message i depends only on the
+  observations up to time i, so the filter is extended incrementally
+  as the state sequence grows and truncated when an observation is
+  added or removed.
+  """
+
+  def __init__(self, sp):
+    self.sp = sp
+    self.fs = []
+    self.log_weights = []
+
+  def copy(self):
+    ans = HMMForwardFilter(self.sp)
+    ans.fs = copy(self.fs)
+    ans.log_weights = copy(self.log_weights)
+    return ans
+
+  def truncate(self, n):
+    del self.fs[n:]
+    del self.log_weights[n:]
+
 class HMMSPAux(SPAux):
   def __init__(self):
     super(HMMSPAux, self).__init__()
     self.xs = [] # [ x_n ],
     self.os = OrderedDict() #  { n => [o_n1, ... ,o_nK] }
+    # HMMForwardFilter of the os under the parameters of the last SP
+    # that filtered them, or None.
+    self.filter = None
 
   def copy(self):
     ans = HMMSPAux()
     ans.xs = copy(self.xs)
     ans.os = OrderedDict((k, copy(v)) for k, v in self.os.iteritems())
+    if self.filter is not None:
+      ans.filter = self.filter.copy()
     return ans
 
+  def forwardFilter(self, sp):
+    """HMMForwardFilter for the current observations under sp's
+    parameters, extended to cover every time step in xs."""
+    if self.filter is None or self.filter.sp is not sp:
+      self.filter = HMMForwardFilter(sp)
+    sp.extendForwardFilter(self.filter, self)
+    return self.filter
+
+  def invalidateFrom(self, n):
+    """Forget the forward messages that depend on the observations at
+    time n."""
+    if self.filter is not None:
+      self.filter.truncate(n)
+
 class MakeUncollapsedHMMOutputPSP(RandomPSP):
   def childrenCanAAA(self):
     return True
@@ -145,52 +188,43 @@ class UncollapsedHMMSP(SP):
         assert len(aux.xs) == maxObservation + 1
     return 0
 
-  def forwardBackwardSample(self, aux, np_rng):
-    # called by UncollapsedHMMAAALKernel.simulate
-    if not aux.os: return
-
-    # forward filtering
-    fs = []
-    for i in range(len(aux.xs)):
+  def extendForwardFilter(self, filt, aux):
+    # Each new message costs one vector-matrix product for the
+    # transition and an elementwise product per observation.
+    for i in range(len(filt.fs), len(aux.xs)):
       if i == 0:
-        f = self.p0
+        f = np.asarray(self.p0, dtype=float)
+        weight = 0
       else:
-        f = np.dot(fs[i-1], self.T)
+        f = np.dot(filt.fs[i-1], self.T)
+        weight = filt.log_weights[i-1]
       if i in aux.os:
         for o in aux.os[i]:
-          f = np.dot(f, npMakeDiag(self.O[:, o]))
+          f = f * self.O[:, o]
 
-      fs.append(npNormalizeVector(f))
+      total = np.sum(f)
+      filt.fs.append(f / total)
+      filt.log_weights.append(weight + np.log(total))
+
+  def forwardBackwardSample(self, aux, np_rng):
+    # called by UncollapsedHMMAAALKernel.simulate
+    if not aux.os: return
+
+    fs = aux.forwardFilter(self).fs
 
     # backwards sampling
-    aux.xs[-1] = npSampleVector(fs[-1], np_rng)
+    aux.xs[-1] = npSampleVector(fs[len(aux.xs)-1], np_rng)
     for i in range(len(aux.xs) - 2, -1, -1):
       index = npIndexOfOne(aux.xs[i+1])
-      T_i = npMakeDiag(self.T[:, index])
-      gamma = npNormalizeVector(np.dot(fs[i], T_i))
+      gamma = npNormalizeVector(fs[i] * self.T[:, index])
       aux.xs[i] = npSampleVector(gamma, np_rng)
 
   def forwardMarginalWeight(self, aux):
-    # called by UncollapsedHMMAAALKernel.weight
-    # TODO: cache redundant work between this and forwardBackwardSample?
-
+    # called by UncollapsedHMMAAALKernel.weight, which reuses the
+    # forward pass of the preceding simulate.
     if not aux.os: return 0
 
-    weight = 0
-    fs = []
-    for i in range(len(aux.xs)):
-      if i == 0:
-        f = self.p0
-      else:
-        f = np.dot(fs[i-1], self.T)
-      if i in aux.os:
-        for o in aux.os[i]:
-          f = np.dot(f, npMakeDiag(self.O[:, o]))
-
-      weight += np.log(np.sum(f))
-      fs.append(npNormalizeVector(f))
-
-    return weight
+    return aux.forwardFilter(self).log_weights[len(aux.xs)-1]
 
 class UncollapsedHMMOutputPSP(RandomPSP):
 
@@ -219,12 +253,14 @@ class UncollapsedHMMOutputPSP(RandomPSP):
     os = args.spaux().os
     if n not in os: os[n] = []
     os[n].append(value)
+    args.spaux().invalidateFrom(n)
 
   def unincorporate(self, value, args):
     n = args.operandValues()[0]
     os = args.spaux().os
     del os[n][os[n].index(value)]
     if not os[n]: del os[n]
+    args.spaux().invalidateFrom(n)
 
 class UncollapsedHMMRequestPSP(DeterministicPSP):
   def simulate(self, args): return Request([], [args.operandValues()[0]])
@@ -17,11 +17,14 @@
 
 from collections import OrderedDict
 import numbers
+import time
 
 from venture.lite.detach import detachAndExtract
 from venture.lite.infer.draw_scaffold import drawScaffold
 from venture.lite.infer.egibbs import EnumerativeGibbsOperator
 from venture.lite.infer.egibbs import EnumerativeMAPOperator
+from venture.lite.infer.hmc import AdaptiveHamiltonianMonteCarloOperator
+from venture.lite.infer.hmc import HMCAdaptation
 from venture.lite.infer.hmc import HamiltonianMonteCarloOperator
 from venture.lite.infer.map_gradient import GradientAscentOperator
 from venture.lite.infer.map_gradient import NesterovAcceleratedGradientAscentOperator
@@ -110,8 +113,12 @@ def transloop(trace, transitions, operate):
   ct = 0
   for _ in range(transitions):
     ct += operate()
+    profile = trace.phase_profile
+    if profile is not None and trace.aes: start = time.time()
     for node in trace.aes:
       trace.madeSPAt(node).AEInfer(trace.madeSPAuxAt(node), trace.np_rng)
+    if profile is not None and trace.aes:
+      profile.recordTime("ae_kernels", time.time() - start)
     ct += len(trace.aes)
 
   if transitions > 0:
@@ -172,6 +179,25 @@ def primitive_infer(trace, exp):
     def doit(scaffolder):
       return mixMH(trace, scaffolder, HamiltonianMonteCarloOperator(epsilon, int(L)))
     return transloop(trace, transitions, scaffolder_loop(scaffolders, doit))
+  elif operator == "adaptive_hmc":
+    (scaffolders, transitions, (L, warmup)) = dispatch_arguments(trace, exp)
+    assert isinstance(L, numbers.Number)
+    assert isinstance(warmup, numbers.Number)
+    # Adaptation carries across invocations on the same scope and
+    # block; subproblems found by search adapt afresh in each one.
+    adaptations = {}
+    def doit(scaffolder):
+      if isinstance(scaffolder, BlockScaffoldIndexer):
+        (table, key) = (trace.hmcAdaptations,
+                        (scaffolder.scope, scaffolder.block))
+      else:
+        (table, key) = (adaptations, id(scaffolder))
+      adaptation = table.get(key)
+      if adaptation is None or adaptation.warmup != int(warmup):
+        adaptation = table[key] = HMCAdaptation(int(warmup))
+      oper = AdaptiveHamiltonianMonteCarloOperator(int(L), adaptation)
+      return mixMH(trace, scaffolder, oper)
+    return transloop(trace, transitions, scaffolder_loop(scaffolders, doit))
   elif operator == "gibbs":
     (scaffolders, transitions, _) = dispatch_arguments(trace, exp)
     def doit(scaffolder):
@@ -16,13 +16,22 @@
 # along with Venture.  If not, see <http://www.gnu.org/licenses/>.
 
 from collections import OrderedDict
+import math
+import numbers
 
+import numpy as np
+
+from ..exception import VentureValueError
 from ..omegadb import OmegaDB
 from ..orderedset import OrderedSet
 from ..regen import regenAndAttach
 from ..detach import detachAndExtract
 from ..scaffold import constructScaffold
 from ..utils import FixedRandomness
+from ..value import VentureMatrix
+from ..value import VentureNumber
+from ..value import VentureSimplex
+from ..value import VentureSymmetricMatrix
 from ..value import vv_dot_product
 from venture.lite.infer.mh import InPlaceOperator
 from venture.lite.infer.mh import getCurrentValues
@@ -166,3 +175,264 @@ class HamiltonianMonteCarloOperator(InPlaceOperator):
     return q, self.kinetic(p)
 
   def name(self): return "hamiltonian monte carlo"
+
+
+class AdaptiveHamiltonianMonteCarloOperator(InPlaceOperator):
+  """Hamiltonian Monte Carlo that tunes itself while warming up.
+
+  Runs the leapfrog integrator on the reals of all the principal
+  nodes at once, as one NumPy vector, with a diagonal mass matrix.
+  The step size and mass matrix come from the given HMCAdaptation,
+  which the operator updates after each proposal while that is still
+  warming up."""
+
+  def __init__(self, num_steps, adaptation):
+    self.num_steps = num_steps
+    self.adaptation = adaptation
+
+  def propose(self, trace, scaffold):
+    pnodes = scaffold.getPrincipalNodes()
+    currentValues = getCurrentValues(trace, pnodes)
+    flattening = _Flattening(currentValues)
+
+    # So the initial detach will get the gradient right
+    registerDeterministicLKernels(trace, scaffold, pnodes, currentValues)
+    rhoWeight = self.prepare(trace, scaffold, True) # Gradient is in self.rhoDB
+
+    start_q = flattening.flatten(currentValues)
+    inv_mass = self.adaptation.inv_mass_for(len(start_q))
+    momenta = trace.np_rng.standard_normal(len(start_q)) / np.sqrt(inv_mass)
+    start_K = self.kinetic(momenta, inv_mass)
+
+    grad = GradientOfRegen(trace, scaffold, pnodes)
+    def grad_potential(q):
+      # The potential function we want is - log density
+      return -flattening.flatten_gradient(grad(flattening.unflatten(q)))
+
+    # Might as well save a gradient computation, since the initial
+    # detach does it
+    start_grad_pot = -flattening.flatten_gradient(
+      [self.rhoDB.getPartial(pnode) for pnode in pnodes])
+
+    # Smashes the trace but leaves it a torus
+    (q, end_K) = self.evolve(trace.np_rng, grad_potential, start_q,
+                             start_grad_pot, momenta, inv_mass)
+
+    if np.all(np.isfinite(q)) and not math.isnan(end_K):
+      xiWeight = grad.regen(flattening.unflatten(q)) # Mutates the trace
+      logAlpha = xiWeight - rhoWeight + start_K - end_K
+    else:
+      # The integrator diverged; regenerate the current state so
+      # that rejecting restores it
+      q = start_q
+      grad.regen(flattening.unflatten(q))
+      logAlpha = float('-inf')
+    if math.isnan(logAlpha):
+      logAlpha = float('-inf')
+    self.start_q = start_q
+    self.proposed_q = q
+    self.adaptation.adapt_step_size(logAlpha)
+    return (trace, logAlpha)
+
+  def accept(self):
+    ans = super(AdaptiveHamiltonianMonteCarloOperator, self).accept()
+    self.adaptation.finish_proposal(self.proposed_q)
+    return ans
+
+  def reject(self):
+    ans = super(AdaptiveHamiltonianMonteCarloOperator, self).reject()
+    self.adaptation.finish_proposal(self.start_q)
+    return ans
+
+  def kinetic(self, momenta, inv_mass):
+    # This is the log density of sampling these momenta, up to an
+    # additive constant
+    return 0.5 * np.dot(momenta * momenta, inv_mass)
+
+  def evolve(self, np_rng, grad_U, start_q, start_grad_q, start_p, inv_mass):
+    epsilon = self.adaptation.epsilon
+    num_steps = np_rng.randint(int(self.num_steps))+1
+    q = start_q
+    # The initial momentum half-step
+    p = start_p - (epsilon / 2.0) * start_grad_q
+
+    for i in range(num_steps):
+      # Position step
+      q = q + epsilon * inv_mass * p
+
+      # Momentum step, except at the end
+      if i < num_steps - 1:
+        p = p - epsilon * grad_U(q)
+
+    # The final momentum half-step
+    p = p - (epsilon / 2.0) * grad_U(q)
+
+    # The momenta would be negated here to make the proposal
+    # symmetric, but the kinetic energy is symmetric anyway.
+    return q, self.kinetic(p, inv_mass)
+
+  def name(self): return "adaptive hamiltonian monte carlo"
+
+class HMCAdaptation(object):
+  """The step size and diagonal mass matrix of adaptive HMC, and the
+  state of tuning them.
+
+  The first `warmup` proposals adapt the step size by the dual
+  averaging scheme of Hoffman and Gelman (2014), aiming for the
+  target acceptance rate, and set the inverse mass matrix to the
+  (regularized) variance of the positions visited in the middle of
+  warm-up, following Stan's schedule.  Adaptation breaks detailed
+  balance, so only the proposals after warm-up are valid MCMC.
+
+  The trace keeps one of these per scope and block in hmcAdaptations,
+  so warm-up carries across invocations of adaptive_hmc.  If the
+  number of reals changes between proposals, the mass matrix goes
+  back to the identity."""
+
+  # Dual averaging constants, as recommended by Hoffman and Gelman
+  GAMMA = 0.05
+  T0 = 10
+  KAPPA = 0.75
+
+  def __init__(self, warmup, epsilon=0.1, target_accept=0.8):
+    self.warmup = warmup
+    self.epsilon = epsilon
+    self.target_accept = target_accept
+    self.inv_mass = None
+    self.proposals = 0
+    # Positions are collected for the mass matrix between the initial
+    # 15% and the final 10% of warm-up, during which only the step
+    # size adapts.
+    self.window = (int(0.15 * warmup), int(0.9 * warmup))
+    self.positions = _RunningVariance()
+    self._restart_step_size_adaptation()
+
+  def _restart_step_size_adaptation(self):
+    self.mu = math.log(10 * self.epsilon)
+    self.h_bar = 0.0
+    self.log_epsilon_bar = 0.0
+    self.adaptations = 0
+
+  def warming_up(self):
+    return self.proposals < self.warmup
+
+  def inv_mass_for(self, size):
+    if self.inv_mass is None or len(self.inv_mass) != size:
+      self.inv_mass = np.ones(size)
+      self.positions = _RunningVariance()
+    return self.inv_mass
+
+  def adapt_step_size(self, logAlpha):
+    if not self.warming_up():
+      return
+    alpha = math.exp(min(0.0, logAlpha))
+    self.adaptations += 1
+    m = self.adaptations
+    w = 1.0 / (m + self.T0)
+    self.h_bar = (1 - w) * self.h_bar + w * (self.target_accept - alpha)
+    log_epsilon = self.mu - math.sqrt(m) / self.GAMMA * self.h_bar
+    eta = m ** -self.KAPPA
+    self.log_epsilon_bar = eta * log_epsilon + (1 - eta) * self.log_epsilon_bar
+    self.epsilon = math.exp(log_epsilon)
+
+  def finish_proposal(self, q):
+    if not self.warming_up():
+      return
+    (start, end) = self.window
+    if start <= self.proposals < end:
+      self.positions.add(q)
+      if self.proposals == end - 1 and self.positions.count > 1:
+        n = self.positions.count
+        # Shrink toward a small multiple of the identity, as Stan does
+        self.inv_mass = (n / (n + 5.0)) * self.positions.variance() + \
+                        1e-3 * (5.0 / (n + 5.0))
+        self._restart_step_size_adaptation()
+    self.proposals += 1
+    if self.proposals == self.warmup:
+      self.epsilon = math.exp(self.log_epsilon_bar)
+
+class _RunningVariance(object):
+  """Welford's streaming mean and variance of a sequence of vectors."""
+  def __init__(self):
+    self.count = 0
+    self.mean = None
+    self.m2 = None
+
+  def add(self, x):
+    self.count += 1
+    if self.mean is None:
+      self.mean = np.array(x, dtype=float)
+      self.m2 = np.zeros(len(x))
+    else:
+      delta = x - self.mean
+      self.mean += delta / self.count
+      self.m2 += delta * (x - self.mean)
+
+  def variance(self):
+    return self.m2 / (self.count - 1)
+
+class _Flattening(object):
+  """Converts between a list of values and one vector of all their
+  real components.  Values with no real components (such as discrete
+  ones) take no room and are left as they are."""
+  def __init__(self, templates):
+    for value in templates:
+      if isinstance(value, (VentureSimplex, VentureSymmetricMatrix)):
+        raise VentureValueError(
+          "Adaptive HMC cannot move constrained values like %s" % value)
+    self.templates = templates
+    self.sizes = [len(_reals(value)) for value in templates]
+
+  def flatten(self, values):
+    return np.array([x for value in values for x in _reals(value)],
+                    dtype=float)
+
+  def flatten_gradient(self, partials):
+    pieces = []
+    for (partial, size) in zip(partials, self.sizes):
+      reals = _reals(partial)
+      if len(reals) != size:
+        if reals == [0]:
+          # The omegadb's symbolic zero, for a value with no gradient
+          reals = np.zeros(size)
+        else:
+          raise VentureValueError(
+            "Gradient of size %d for a value of size %d" % (len(reals), size))
+      pieces.append(np.array(reals, dtype=float))
+    if not pieces:
+      return np.zeros(0)
+    return np.concatenate(pieces)
+
+  def unflatten(self, q):
+    ans = []
+    start = 0
+    for (template, size) in zip(self.templates, self.sizes):
+      ans.append(_with_reals(template, q[start:start + size]))
+      start += size
+    return ans
+
+def _reals(value):
+  if isinstance(value, numbers.Number):
+    return [value]
+  elif isinstance(value, np.ndarray):
+    return list(value.ravel())
+  elif isinstance(value, VentureNumber):
+    return [value.getNumber()]
+  elif isinstance(value, VentureMatrix):
+    return list(value.matrix.ravel())
+  ans = []
+  def visit(x):
+    ans.append(x)
+    return x
+  value.map_real(visit)
+  return ans
+
+def _with_reals(template, reals):
+  if len(reals) == 0:
+    return template
+  elif isinstance(template, VentureNumber):
+    return VentureNumber(float(reals[0]))
+  elif isinstance(template, VentureMatrix):
+    return VentureMatrix(np.reshape(reals, template.matrix.shape))
+  reals = iter(reals)
+  return template.map_real(lambda _: float(next(reals)))
@@ -59,6 +59,10 @@ def registerDeterministicLKernelsByAddress(
 def mixMH(trace, indexer, operator):
   start = time.time()
   index = indexer.sampleIndex(trace)
+  profile = trace.phase_profile
+  if profile is not None:
+    profile.recordTime("scaffold", time.time() - start)
+    profile.recordScaffold(index)
 
   # record node addresses and values for the benefit of the profiler
   if trace.profiling_enabled:
@@ -86,6 +90,8 @@ def mixMH(trace, indexer, operator):
   # print "Alpha", alpha, "= xiMix", xiMix, "+ proposal alpha", \
   #   logAlpha, "- rhoMix", rhoMix, "; logU", logU
   assert not math.isnan(alpha), "Corrected acceptance ratio should never be NaN"
+  if profile is not None:
+    decided = time.time()
   if logU < alpha:
 #    sys.stdout.write(".")
     ans = operator.accept() # May mutate trace
@@ -94,6 +100,9 @@ def mixMH(trace, indexer, operator):
 #    sys.stdout.write("!")
     ans = operator.reject() # May mutate trace
     accepted = False
+  if profile is not None:
+    profile.recordTime("accept" if accepted else "reject",
+                       time.time() - decided)
 
   if trace.profiling_enabled:
     trace.recordProposal(
@@ -146,6 +155,10 @@ class BlockScaffoldIndexer(object):
 
   def sampleIndex(self, trace):
     setsOfPNodes = self.getSetsOfPNodes(trace)
+    if trace.scaffoldCache is not None and \
+       not self.useDeltaKernels and not self.updateValues:
+      return trace.scaffoldCache.scaffold(
+        trace, (self.scope, self.block), setsOfPNodes)
     return constructScaffold(
       trace, setsOfPNodes,
       useDeltaKernels=self.useDeltaKernels,
@@ -170,7 +183,10 @@ class InPlaceOperator(object):
     detach along the scaffold and return the weight thereof."""
     self.trace = trace
     self.scaffold = scaffold
+    profile = trace.phase_profile
+    if profile is not None: start = time.time()
     rhoWeight, self.rhoDB = detachAndExtract(trace, scaffold, compute_gradient)
+    if profile is not None: profile.recordTime("detach", time.time() - start)
     return rhoWeight
 
   def accept(self):
@@ -186,7 +202,10 @@ class InPlaceOperator(object):
 class MHOperator(InPlaceOperator):
   def propose(self, trace, scaffold):
     rhoWeight = self.prepare(trace, scaffold)
+    profile = trace.phase_profile
+    if profile is not None: start = time.time()
     xiWeight = regenAndAttach(trace, scaffold, False, self.rhoDB, OrderedDict())
+    if profile is not None: profile.recordTime("regen", time.time() - start)
     if rhoWeight == float('-inf') and xiWeight == float('-inf'):
       # Proposed a move from one impossible state to another.  What to
       # do here is a policy choice; I think chosing to accept makes
@@ -215,9 +234,15 @@ class FuncMHOperator(object):
     self.trace = trace
     self.scaffold = scaffold
     from ..particle import Particle
+    profile = trace.phase_profile
+    if profile is not None: start = time.time()
     rhoWeight, self.rhoDB = detachAndExtract(trace, scaffold)
+    if profile is not None:
+      regenStart = time.time()
+      profile.recordTime("detach", regenStart - start)
     self.particle = Particle(trace)
     xiWeight = regenAndAttach(self.particle, scaffold, False, self.rhoDB, OrderedDict())
+    if profile is not None: profile.recordTime("regen", time.time() - regenStart)
     return self.particle, xiWeight - rhoWeight
 
   def accept(self):
@@ -27,11 +27,13 @@ from ..exception import (SubsampledScaffoldError,
                          SubsampledScaffoldNotApplicableWarning,
                          SubsampledScaffoldStaleNodesWarning)
 from ..value import SPRef
+from ..regen import check_weight
 from ..regen import regenAndAttach
 from ..detach import detachAndExtract
-from ..node import isLookupNode, isOutputNode
-from ..orderedset import OrderedSet
-from ..scaffold import constructScaffold, updateValuesAtScaffold
+from ..node import isLookupNode, isOutputNode, iterChildren
+from ..psp import NullRequestPSP
+from ..orderedset import OrderedFrozenSet, OrderedSet
+from ..scaffold import Scaffold, constructScaffold, updateValuesAtScaffold
 from venture.lite.infer.mh import BlockScaffoldIndexer
 from venture.lite.infer.mh import InPlaceOperator
 
@@ -102,8 +104,9 @@ def subsampledMixMH(trace,indexer,operator,Nbatch,k0,epsilon):
     mu_0 = (log_u - alpha) / N
     perm_local_roots = trace.np_rng.permutation(global_index.local_roots)
 
-    accept, n, _ = sequentialTest(mu_0, k0, Nbatch, N, epsilon,
-        lambda i: operator.evalOneLocalSection(indexer, perm_local_roots[i]))
+    accept, n, _ = sequentialBatchTest(mu_0, k0, Nbatch, N, epsilon,
+        lambda start, end: operator.evalLocalSections(
+          indexer, perm_local_roots[start:end]))
 
   if accept:
     return operator.accept() # May mutate trace
@@ -116,6 +119,15 @@ def subsampledMixMH(trace,indexer,operator,Nbatch,k0,epsilon):
 
 # Sequential Testing.
 def sequentialTest(mu_0, k0, Nbatch, N, epsilon, fun_dllh):
+  # Same as sequentialBatchTest, with fun_dllh giving the difference of
+  # log-likelihood of one local section at a time.
+  return sequentialBatchTest(mu_0, k0, Nbatch, N, epsilon,
+      lambda start, end: [fun_dllh(i) for i in xrange(start, end)])
+
+def sequentialBatchTest(mu_0, k0, Nbatch, N, epsilon, fun_dllh_batch):
+  # fun_dllh_batch(start, end) gives the differences of log-likelihood
+  # of local sections start through end - 1, so that a whole minibatch
+  # is evaluated at once.
   # Sequentially do until termination condition is met.
   Nbatch = float(Nbatch)
   N = float(N)
@@ -131,10 +143,9 @@ def sequentialTest(mu_0, k0, Nbatch, N, epsilon, fun_dllh):
     # Process k'th subset of local variables subsampled w/o replacement.
     n_start = n
     n_end = min(n + Nbatch, N)
-    for i in xrange(int(n_start), int(n_end)):
-      dllh = fun_dllh(i)
-      cum_dllh  += dllh
-      cum_dllh2 += dllh * dllh
+    dllh = np.asarray(fun_dllh_batch(int(n_start), int(n_end)), dtype=float)
+    cum_dllh  += np.sum(dllh)
+    cum_dllh2 += np.dot(dllh, dllh)
 
     # Update k, n, mx, mx2
     k += 1
@@ -171,6 +182,12 @@ def sequentialTest(mu_0, k0, Nbatch, N, epsilon, fun_dllh):
   return accept, n, tstat
 
 class SubsampledBlockScaffoldIndexer(BlockScaffoldIndexer):
+  def __init__(self, *args, **kwargs):
+    super(SubsampledBlockScaffoldIndexer, self).__init__(*args, **kwargs)
+    # LocalSectionTemplates of the local sections seen so far, by the
+    # shape of their roots.
+    self.localTemplates = {}
+
   def sampleGlobalIndex(self,trace):
     setsOfPNodes = self.getSetsOfPNodes(trace)
 
@@ -201,6 +218,15 @@ class SubsampledBlockScaffoldIndexer(BlockScaffoldIndexer):
          len(globalBorder) == 1 and
          not trace.pspAt(local_root).canAbsorb(trace, local_root, globalBorder[0]))):
       raise SubsampledScaffoldError("Invalid local root node.")
+    # Local sections are usually copies of one another, so try to
+    # build the scaffold from one constructed for an earlier local root.
+    shape = _rootShape(trace, local_root)
+    templates = self.localTemplates.setdefault(shape, [])
+    for template in templates:
+      index = template.instantiate(trace, local_root)
+      if index is not None:
+        return index
+
     setsOfPNodes = [OrderedSet([local_root])]
     # Set updateValues = False because we'll update values in evalOneLocalSection.
     index = constructScaffold(trace,setsOfPNodes,updateValues=False)
@@ -208,6 +234,9 @@ class SubsampledBlockScaffoldIndexer(BlockScaffoldIndexer):
     # Local section should not have brush.
     if index.brush:
       raise SubsampledScaffoldError("Local section should not have brush.")
+    if len(templates) < _MAX_TEMPLATES_PER_SHAPE and \
+       isBatchableLocalSection(trace, index):
+      templates.append(LocalSectionTemplate(trace, index))
     return index
 
   # Raise three types of warnings:
@@ -373,14 +402,54 @@ class SubsampledBlockScaffoldIndexer(BlockScaffoldIndexer):
 # When accepting/rejecting a proposal, only accept/restore the global section.
 # The local sections are left in the state when returned from subsampledMixMH.
 class SubsampledInPlaceOperator(InPlaceOperator):
+  def prepare(self, trace, scaffold, compute_gradient = False):
+    # Local scaffolds built during this transition, by local root.
+    # Local sections have no brush, so detach and regen leave their
+    # scaffolds as they were and they can be reused until the
+    # transition is accepted or rejected.
+    self.local_scaffolds = {}
+    # Whether each local scaffold can take the batched path of
+    # evalLocalSections, by local root.
+    self.batchable = {}
+    return super(SubsampledInPlaceOperator, self).prepare(
+      trace, scaffold, compute_gradient)
+
+  def localScaffold(self, indexer, local_root):
+    local_scaffold = self.local_scaffolds.get(local_root)
+    if local_scaffold is None:
+      local_scaffold = indexer.sampleLocalIndex(
+        self.trace, local_root, self.scaffold.globalBorder)
+      self.local_scaffolds[local_root] = local_scaffold
+      self.batchable[local_root] = isBatchableLocalSection(
+        self.trace, local_scaffold)
+    return local_scaffold
+
   # Compute diff of log-likelihood for a local section with the root node local_root.
   def evalOneLocalSection(self, indexer, local_root, compute_gradient = False):
+    return self.evalLocalSections(indexer, [local_root], compute_gradient)[0]
+
+  # Compute diffs of log-likelihood for a minibatch of local sections,
+  # as an array.  The global border is switched to its old value and
+  # back once for the whole minibatch rather than once per section.
+  #
+  # Sections that isBatchableLocalSection accepts skip detach and regen:
+  # their deterministic nodes are updated to the old and then the new
+  # border value, and the densities of their absorbing nodes are
+  # computed for the whole minibatch with one logDensityBatch call per
+  # PSP at each value.  The other sections are detached and
+  # regenerated one at a time.
+  def evalLocalSections(self, indexer, local_roots, compute_gradient = False):
     trace = self.trace
     globalBorder = self.scaffold.globalBorder
     assert len(globalBorder) == 1
 
-    # Construct a local scaffold section.
-    local_scaffold = indexer.sampleLocalIndex(trace, local_root, globalBorder)
+    # Construct the local scaffold sections.
+    local_scaffolds = [self.localScaffold(indexer, local_root)
+                       for local_root in local_roots]
+    if compute_gradient:
+      batched = [False for _ in local_roots]
+    else:
+      batched = [self.batchable[local_root] for local_root in local_roots]
 
     # Get the single node.
     globalBorderNode = globalBorder[0]
@@ -398,15 +467,38 @@ class SubsampledInPlaceOperator(InPlaceOperator):
     # Update with the old value.
     proposed_value = trace.valueAt(globalBorderNode)
     trace.setValueAt(globalBorderNode, self.rhoDB.getValue(globalBorderNode))
-    updateValuesAtScaffold(trace,local_scaffold,OrderedSet(globalBorder))
-
-    # Detach and extract
-    rhoWeight,local_rhoDB = detachAndExtract(trace, local_scaffold, compute_gradient)
+    rhoWeights = np.zeros(len(local_scaffolds))
+    local_rhoDBs = [None for _ in local_scaffolds]
+    # psp -> ([absorbing node], [index of its section]), for the
+    # batched sections
+    groups = OrderedDict()
+    for i, local_scaffold in enumerate(local_scaffolds):
+      updateValuesAtScaffold(trace,local_scaffold,OrderedSet(globalBorder))
+
+      if batched[i]:
+        for node in local_scaffold.border[0]:
+          psp = trace.pspAt(node)
+          if not isinstance(psp, NullRequestPSP):
+            (nodes, sections) = groups.setdefault(psp, ([], []))
+            nodes.append(node)
+            sections.append(i)
+      else:
+        # Detach and extract
+        rhoWeights[i],local_rhoDBs[i] = detachAndExtract(trace, local_scaffold, compute_gradient)
+    for (psp, (nodes, sections)) in groups.iteritems():
+      np.add.at(rhoWeights, sections, unabsorbLocalBatch(trace, psp, nodes))
 
     # Regen and attach with the new value
     trace.setValueAt(globalBorderNode, proposed_value)
-    xiWeight = regenAndAttach(trace,local_scaffold,False,local_rhoDB,OrderedDict())
-    return xiWeight - rhoWeight
+    xiWeights = np.zeros(len(local_scaffolds))
+    for i, local_scaffold in enumerate(local_scaffolds):
+      if batched[i]:
+        updateValuesAtScaffold(trace,local_scaffold,OrderedSet(globalBorder))
+      else:
+        xiWeights[i] = regenAndAttach(trace,local_scaffold,False,local_rhoDBs[i],OrderedDict())
+    for (psp, (nodes, sections)) in groups.iteritems():
+      np.add.at(xiWeights, sections, absorbLocalBatch(trace, psp, nodes))
+    return xiWeights - rhoWeights
 
   def reject(self, indexer, perm_local_roots, n):
     # Restore the global section.
@@ -416,8 +508,7 @@ class SubsampledInPlaceOperator(InPlaceOperator):
     globalBorder = self.scaffold.globalBorder
     if globalBorder:
       for i in range(int(n)):
-        local_root = perm_local_roots[i]
-        local_scaffold = indexer.sampleLocalIndex(self.trace, local_root, globalBorder)
+        local_scaffold = self.localScaffold(indexer, perm_local_roots[i])
         updateValuesAtScaffold(self.trace,local_scaffold,OrderedSet(globalBorder))
 
     return ans
@@ -454,6 +545,146 @@ class SubsampledInPlaceOperator(InPlaceOperator):
     else:
       return 0
 
+# Whether the local section can be evaluated without detach and regen:
+# every resampling node is a lookup or the application of a
+# deterministic, non-AAA procedure, which updateValuesAtScaffold
+# recomputes exactly as regen would, and every border node absorbs,
+# either trivially (a request with no requests to make) or with a PSP
+# whose densities can be computed in a batch.
+def isBatchableLocalSection(trace, scaffold):
+  if scaffold.brush or scaffold.aaa or scaffold.lkernels:
+    return False
+  for node in scaffold.regenCounts:
+    if isLookupNode(node):
+      continue
+    if not isOutputNode(node):
+      return False
+    psp = trace.pspAt(node)
+    if psp.isRandom() or psp.childrenCanAAA() or \
+       isinstance(trace.valueAt(node), SPRef) or trace.esrParentsAt(node):
+      return False
+  for node in scaffold.border[0]:
+    if not scaffold.isAbsorbing(node):
+      return False
+    psp = trace.pspAt(node)
+    if not (isinstance(psp, NullRequestPSP) or psp.canBatchLogDensity()):
+      return False
+  return True
+
+# Unabsorb the given absorbing nodes, all applications of psp, and
+# return the array of their log densities.
+def unabsorbLocalBatch(trace, psp, nodes):
+  argsList = [trace.argsAt(node) for node in nodes]
+  gvalues = [trace.groundValueAt(node) for node in nodes]
+  weights = np.asarray(psp.logDensityBatch(gvalues, argsList), dtype=float)
+  for (gvalue, args) in zip(gvalues, argsList):
+    psp.unincorporate(gvalue, args)
+  return weights
+
+# Absorb the given nodes again, at the current values of their
+# parents, and return the array of their log densities.
+def absorbLocalBatch(trace, psp, nodes):
+  argsList = [trace.argsAt(node) for node in nodes]
+  gvalues = [trace.groundValueAt(node) for node in nodes]
+  weights = np.asarray(psp.logDensityBatch(gvalues, argsList), dtype=float)
+  if np.any(np.isnan(weights)):
+    for (gvalue, args) in zip(gvalues, argsList):
+      check_weight(psp.logDensity(gvalue, args), psp, args)
+  for (gvalue, args) in zip(gvalues, argsList):
+    psp.incorporate(gvalue, args)
+  return weights
+
+# Local sections whose roots have the same shape but which differ
+# further down are constructed afresh after this many templates.
+_MAX_TEMPLATES_PER_SHAPE = 4
+
+class LocalSectionTemplate(object):
+  """The shape of a local section, from which the scaffolds of
+  structurally identical local sections are built without
+  constructScaffold.
+
+  The shape is the order in which the nodes of the section are
+  reached from its root along the child edges of its resampling
+  nodes, with the PSP of each node and which argument of the child
+  each edge supplies.  Every decision constructScaffold makes depends
+  on just these, so a section with the same shape has the same
+  scaffold, node for node.  Only sections that isBatchableLocalSection
+  accepts are made templates, which rules out brush, AAA nodes and
+  kernels."""
+
+  def __init__(self, trace, scaffold):
+    root = scaffold.getPNode()
+    nodes = [root]
+    positions = {root: 0}
+    # (index of a resampling node, [(index of its child, slot)]) in
+    # the order the nodes were reached
+    self.expansions = []
+    for (i, node) in enumerate(nodes): # Grows as it goes
+      if scaffold.isResampling(node):
+        edges = []
+        for child in iterChildren(node):
+          if child not in positions:
+            positions[child] = len(nodes)
+            nodes.append(child)
+          edges.append((positions[child], _parentSlot(child, node)))
+        self.expansions.append((i, edges))
+    assert len(nodes) == len(scaffold.regenCounts) + len(scaffold.absorbing)
+    self.kinds = [_nodeKind(trace, n) for n in nodes]
+    self.regenCounts = [(positions[n], count)
+                        for (n, count) in scaffold.regenCounts.iteritems()]
+    self.absorbing = [positions[n] for n in scaffold.absorbing]
+    self.border = [positions[n] for n in scaffold.border[0]]
+    self.drg = [positions[n] for n in scaffold.drg]
+
+  def instantiate(self, trace, root):
+    """The scaffold of the local section at root, or None if that
+    section does not have this shape."""
+    nodes = [root]
+    positions = {root: 0}
+    for (i, edges) in self.expansions:
+      node = nodes[i]
+      children = list(iterChildren(node))
+      if len(children) != len(edges):
+        return None
+      for (child, (j, slot)) in zip(children, edges):
+        if j == len(nodes):
+          if child in positions:
+            return None
+          positions[child] = j
+          nodes.append(child)
+        elif nodes[j] is not child:
+          return None
+        if _parentSlot(child, node) != slot:
+          return None
+    for (node, kind) in zip(nodes, self.kinds):
+      if _nodeKind(trace, node) != kind:
+        return None
+    return Scaffold([OrderedFrozenSet([root])],
+                    OrderedDict((nodes[i], count)
+                                for (i, count) in self.regenCounts),
+                    OrderedFrozenSet(nodes[i] for i in self.absorbing),
+                    None, [[nodes[i] for i in self.border]], None, None,
+                    OrderedFrozenSet(nodes[i] for i in self.drg))
+
+def _nodeKind(trace, node):
+  if isLookupNode(node):
+    return (type(node), None)
+  return (type(node), trace.pspAt(node))
+
+def _rootShape(trace, root):
+  return _nodeKind(trace, root) + (len(trace.childrenAt(root)),)
+
+# Which argument of the node the parent supplies.
+def _parentSlot(node, parent):
+  if isLookupNode(node):
+    return 0
+  if parent is node.operatorNode:
+    return -1
+  if isOutputNode(node) and parent is node.requestNode:
+    return -2
+  return tuple(i for (i, operand) in enumerate(node.operandNodes)
+               if operand is parent)
+
 #### Subsampled_MH Operator
 #### Resampling from the prior
 
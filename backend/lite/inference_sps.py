@@ -424,6 +424,37 @@ The ``transitions`` argument specifies how many times to do this.
 Returns the average number of nodes touched per transition in each particle.
 """)
 
+register_trace_method_sp("adaptive_hmc",
+                  transition_oper_type([t.IntegerType("steps : int"), t.IntegerType("warmup : int")]),
+                  desc="""\
+Run a Hamiltonian Monte Carlo transition kernel that tunes itself.
+
+Like `hmc`, except that the integrator runs on one array of all the
+real components of the scope-block pair, with a diagonal mass
+matrix, and the step size and mass matrix are chosen automatically.
+
+Not available in the Puma backend.  Discrete random choices are not
+moved, as with `hmc`; simplices and symmetric matrices are not
+supported.
+
+The ``steps`` argument gives the largest number of steps to take in
+each HMC trajectory.
+
+The first ``warmup`` transitions on a given scope and block adapt the
+step size toward an acceptance rate of 0.8 by dual averaging, and set
+the mass matrix from the variance of the states visited in the middle
+of the warm-up.  Those transitions do not leave the posterior
+invariant.  The adapted step size and mass matrix are kept with the
+model, so warm-up continues across invocations and later invocations
+use the tuned kernel; invoking with a different ``warmup`` starts
+adaptation afresh.
+
+The ``transitions`` argument specifies how many times to do this,
+counting any warm-up.
+
+Returns the average number of nodes touched per transition in each particle.
+""")
+
 register_trace_method_sp("rejection", transition_oper_type([t.AnyType("density_bound : maybe number"), t.NumberType("attempt_bound : number")], min_req_args=1), desc="""\
 Sample from the local conditional by rejection sampling.
 
@@ -534,7 +565,7 @@ Returns the average number of nodes touched per transition in each particle.
 """)
 
 register_engine_method_sp("resample",
-                   infer_action_maker_type([t.IntegerType("particles : int")]),
+                   infer_action_maker_type([t.IntegerType("particles : int"), t.SymbolType("scheme : symbol")], min_req_args=1),
                    desc="""\
 Perform an SMC-style resampling step.
 
@@ -547,11 +578,30 @@ relative to each other by the relative likelihoods of observing those
 values in those particles.  The resampling step respects those
 weights.
 
+The optional `scheme` argument selects how the new particles' parents
+are chosen: ``multinomial`` (the default) draws each parent
+independently, while ``stratified``, ``systematic`` and ``residual``
+correlate the draws to reduce the variance the resampling step adds.
+All take time linear in the number of particles.
+
 The new particles will be handled in series.  See the next procedures
 for alternatives.""")
 
+register_engine_method_sp("resample_if_needed",
+                   infer_action_maker_type([t.IntegerType("particles : int"), t.NumberType("threshold : number"), t.SymbolType("scheme : symbol")], t.BoolType(), min_req_args=1),
+                   desc="""\
+Resample only if the particle weights have degenerated.
+
+Compute the effective sample size of the current particles, and
+perform a `resample` to the given number of particles if it is less
+than `threshold` (default 0.5) times the current number of particles.
+The `scheme` (default ``systematic``) is as for `resample`, and the
+current parallelism mode is kept.
+
+Returns whether resampling took place.""")
+
 register_engine_method_sp("resample_multiprocess",
-                   infer_action_maker_type([t.IntegerType("particles : int"), t.IntegerType("max_processes : int")], min_req_args=1),
+                   infer_action_maker_type([t.IntegerType("particles : int"), t.IntegerType("max_processes : int"), t.SymbolType("scheme : symbol")], min_req_args=1),
                    desc="""\
 Like `resample`, but fork multiple OS processes to simulate the
 resulting particles in parallel.
@@ -568,7 +618,7 @@ replacement for `resample`, as the former will handle internal
 states that cannot be serialized, whereas the latter will not.  """)
 
 register_engine_method_sp("resample_serializing",
-                   infer_action_maker_type([t.IntegerType("particles : int")]),
+                   infer_action_maker_type([t.IntegerType("particles : int"), t.SymbolType("scheme : symbol")], min_req_args=1),
                    desc="""\
 Like `resample`, but performs serialization the same way `resample_multiprocess` does.
 
@@ -576,7 +626,7 @@ Use this to debug serialization problems without messing with actually
 spawning multiple processes.  """)
 
 register_engine_method_sp("resample_threaded",
-                   infer_action_maker_type([t.IntegerType("particles : int")]),
+                   infer_action_maker_type([t.IntegerType("particles : int"), t.SymbolType("scheme : symbol")], min_req_args=1),
                    desc="""\
 Like `resample_multiprocess` but uses threads rather than actual processes, and does not serialize, transmitting objects in shared memory instead.
 
@@ -588,7 +638,7 @@ with serialization and multiprocessing, but we expect such problems to
 be rare. """)
 
 register_engine_method_sp("resample_thread_ser",
-                   infer_action_maker_type([t.IntegerType("particles : int")]),
+                   infer_action_maker_type([t.IntegerType("particles : int"), t.SymbolType("scheme : symbol")], min_req_args=1),
                    desc="""\
 Like `resample_threaded`, but serializes the same way `resample_multiprocess` does.
 
@@ -805,18 +855,25 @@ register_engine_method_sp("increment_particle_log_weights",
 Add the given array to the weights of the particles pointwise.  It is an error if the length of the array differs from the number of particles. """)
 
 register_engine_method_sp("for_each_particle",
-                   infer_action_maker_type([t.AnyType("<action>")], t.ListType()), desc="""\
+                   infer_action_maker_type([t.AnyType("<action>"), t.BoolType("in_workers : bool")], t.ListType(), min_req_args=1), desc="""\
 Run the given inference action once for each particle in the
 model. The inference action is evaluated independently for each
 particle, and is not allowed to contain modeling commands (``assume``,
 ``observe``, ``predict``, ``forget``, ``freeze``).
+
+The ``in_workers`` argument, if true, and if the particles are held in
+parallel (see `resample_multiprocess`), runs the action in the workers
+holding them, each with its own inference trace, as long as the action
+can be sent there.  Callbacks cannot be called from such an action.
 """)
 
 register_engine_method_sp("on_particle",
-                   infer_action_maker_type([t.IntegerType(), t.AnyType("<action>")], t.AnyType()), desc="""\
+                   infer_action_maker_type([t.IntegerType(), t.AnyType("<action>"), t.BoolType("in_workers : bool")], t.AnyType(), min_req_args=2), desc="""\
 Run the given inference action on the particle with the given index.
 The inference action is not allowed to contain modeling commands (``assume``,
 ``observe``, ``predict``, ``forget``, ``freeze``).
+
+The ``in_workers`` argument is as for `for_each_particle`.
 """)
 
 register_engine_method_sp("load_plugin", infer_action_maker_type([t.SymbolType("filename")], return_type=t.AnyType(), variadic=True), desc="""\
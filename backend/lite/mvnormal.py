@@ -46,6 +46,12 @@ def _covariance_factor(Sigma):
 class Covariance_Cholesky(object):
   def __init__(self, Sigma):
     self._cholesky = la.cho_factor(Sigma)
+  @staticmethod
+  def from_lower(L):
+    """Covariance factor from a lower Cholesky factor L of Sigma."""
+    covf = Covariance_Cholesky.__new__(Covariance_Cholesky)
+    covf._cholesky = (L, True) # pylint: disable=protected-access
+    return covf
   def solve(self, Y):
     return la.cho_solve(self._cholesky, Y)
   def inverse(self):
@@ -73,8 +79,90 @@ class Covariance_Loser(object):
   def logsqrtdet(self):
     return (1/2)*np.log(la.det(self._Sigma))
 
-def logpdf(X, Mu, Sigma):
-  """Multivariate normal log pdf."""
+def cholesky_update(L, x):
+  """Lower Cholesky factor of L L^T + x x^T, computed in O(n^2)."""
+  # Givens-style rank-one update, column by column; see, e.g., Golub
+  # and Van Loan, Matrix Computations, Sec. 6.5.4.
+  L = np.array(L, dtype=float)
+  x = np.array(x, dtype=float)
+  n = len(x)
+  for k in xrange(n):
+    r = np.hypot(L[k, k], x[k])
+    c = r / L[k, k]
+    s = x[k] / L[k, k]
+    L[k, k] = r
+    if k + 1 < n:
+      L[k+1:, k] = (L[k+1:, k] + s*x[k+1:]) / c
+      x[k+1:] = c*x[k+1:] - s*L[k+1:, k]
+  return L
+
+def cholesky_downdate(L, x):
+  """Lower Cholesky factor of L L^T - x x^T, computed in O(n^2).
+
+  Raises LinAlgError if the result is not numerically
+  positive-definite.
+  """
+  # The inverse of the rotations in cholesky_update.
+  L = np.array(L, dtype=float)
+  x = np.array(x, dtype=float)
+  n = len(x)
+  for k in xrange(n):
+    r2 = L[k, k]**2 - x[k]**2
+    if not r2 > 0:
+      raise la.LinAlgError('matrix is not positive definite')
+    r = np.sqrt(r2)
+    c = r / L[k, k]
+    s = x[k] / L[k, k]
+    L[k, k] = r
+    if k + 1 < n:
+      L[k+1:, k] = (L[k+1:, k] - s*x[k+1:]) / c
+      x[k+1:] = c*x[k+1:] - s*L[k+1:, k]
+  return L
+
+def cholesky_append(L, Sigma12, Sigma22):
+  """Lower Cholesky factor of [Sigma11, Sigma12; Sigma12^T, Sigma22].
+
+  L is the lower Cholesky factor of Sigma11, Sigma12 is an n-vector,
+  and Sigma22 is a scalar.  Computed in O(n^2).  Raises LinAlgError
+  if the extended matrix is not numerically positive-definite.
+  """
+  n = L.shape[0]
+  if n > 0:
+    l12 = la.solve_triangular(L, Sigma12, lower=True)
+  else:
+    l12 = np.zeros(0)
+  d = Sigma22 - np.dot(l12, l12)
+  if not d > 0:
+    raise la.LinAlgError('matrix is not positive definite')
+  ans = np.zeros((n + 1, n + 1))
+  ans[:n, :n] = L
+  ans[n, :n] = l12
+  ans[n, n] = np.sqrt(d)
+  return ans
+
+def cholesky_delete(L, i):
+  """Lower Cholesky factor of Sigma with row and column i deleted.
+
+  L is the lower Cholesky factor of Sigma.  Computed in O(n^2).
+  """
+  # With L partitioned around row i as
+  #
+  #     [L11, 0, 0; l21^T, l22, 0; L31, l32, L33],
+  #
+  # deleting row and column i of Sigma leaves the factor
+  # [L11, 0; L31, L33'] where L33' L33'^T = L33 L33^T + l32 l32^T.
+  n = L.shape[0]
+  ans = np.delete(np.delete(L, i, axis=0), i, axis=1)
+  if i < n - 1:
+    ans[i:, i:] = cholesky_update(L[i+1:, i+1:], L[i+1:, i])
+  return ans
+
+def logpdf(X, Mu, Sigma, covf=None):
+  """Multivariate normal log pdf.
+
+  If covf is supplied, it must be a factor of Sigma as returned by
+  _covariance_factor, and Sigma itself is not consulted.
+  """
   # This is the multivariate normal log pdf for an array X of n
   # outputs, an array Mu of n means, and an n-by-n positive-definite
   # covariance matrix Sigma.  The direct-space density is:
@@ -93,13 +181,14 @@ def logpdf(X, Mu, Sigma):
   n = len(X)
   assert X.shape == (n,)
   assert Mu.shape == (n,)
-  assert Sigma.shape == (n, n)
   assert np.all(np.isfinite(X))
   assert np.all(np.isfinite(Mu))
-  assert np.all(np.isfinite(Sigma))
+  if covf is None:
+    assert Sigma.shape == (n, n)
+    assert np.all(np.isfinite(Sigma))
+    covf = _covariance_factor(Sigma)
 
   X_ = X - Mu
-  covf = _covariance_factor(Sigma)
 
   logp = -np.dot(X_.T, covf.solve(X_)/2.)
   logp -= (n/2.)*np.log(2*np.pi)
@@ -244,8 +333,13 @@ def dlogpdf(X, dX, Mu, dMu, Sigma, dSigma):
 
   return (dlogP_dt, dlogP_dp, dlogP_dq)
 
-def conditional(X2, Mu1, Mu2, Sigma11, Sigma12, Sigma21, Sigma22):
-  """Parameters of conditional multivariate normal."""
+def conditional(X2, Mu1, Mu2, Sigma11, Sigma12, Sigma21, Sigma22,
+    covf22=None):
+  """Parameters of conditional multivariate normal.
+
+  If covf22 is supplied, it must be a factor of Sigma22 as returned by
+  _covariance_factor, and Sigma22 itself is not consulted.
+  """
   # The conditional distribution of a multivariate normal given some
   # fixed values of some variables is itself a multivariate normal on
   # the remaining values, with a slightly different mean and
@@ -271,16 +365,16 @@ def conditional(X2, Mu1, Mu2, Sigma11, Sigma12, Sigma21, Sigma22):
   assert Sigma11.shape == (d1, d1)
   assert Sigma12.shape == (d1, d2)
   assert Sigma21.shape == (d2, d1)
-  assert Sigma22.shape == (d2, d2)
   assert np.all(np.isfinite(X2))
   assert np.all(np.isfinite(Mu1))
   assert np.all(np.isfinite(Mu2))
   assert np.all(np.isfinite(Sigma11))
   assert np.all(np.isfinite(Sigma12))
   assert np.all(np.isfinite(Sigma21))
-  assert np.all(np.isfinite(Sigma22))
-
-  covf22 = _covariance_factor(Sigma22)
+  if covf22 is None:
+    assert Sigma22.shape == (d2, d2)
+    assert np.all(np.isfinite(Sigma22))
+    covf22 = _covariance_factor(Sigma22)
   Mu_ = Mu1 + np.dot(Sigma12, covf22.solve(X2 - Mu2))
   Sigma_ = Sigma11 - np.dot(Sigma12, covf22.solve(Sigma21))
   return (Mu_, Sigma_)
@@ -15,6 +15,7 @@
 # You should have received a copy of the GNU General Public License
 # along with Venture.  If not, see <http://www.gnu.org/licenses/>.
 
+from venture.lite.orderedset import OrderedFrozenSet
 from venture.lite.orderedset import OrderedSet
 from venture.lite.psp import IArgs
 from venture.lite.request import Request
@@ -29,13 +30,13 @@ class Node(object):
     assert address is not None
     self.address = address
     self.value = None
-    self.children = OrderedSet()
+    self.children = None # See childrenOf
     self.isObservation = False
     self.observedValue = None
     self.madeSPRecord = None
     self.aaaMadeSPAux = None
     self.numRequests = 0
-    self.esrParents = []
+    self.esrParents = None # A list, once there are any
     self.isFrozen = False
 
   def observe(self,val):
@@ -92,7 +93,7 @@ class RequestNode(ApplicationNode):
 
   def registerOutputNode(self,outputNode):
     self.outputNode = outputNode
-    self.children.add(outputNode)
+    addChild(self, outputNode)
 
   def definiteParents(self): return [self.operatorNode] + self.operandNodes
 
@@ -111,7 +112,7 @@ class OutputNode(ApplicationNode):
     self.isFrozen = False
 
   def definiteParents(self): return [self.operatorNode] + self.operandNodes + [self.requestNode]
-  def parents(self): return self.definiteParents() + self.esrParents
+  def parents(self): return self.definiteParents() + (self.esrParents or [])
   def relevantPSP(self, sp): return sp.outputPSP
 
 
@@ -166,3 +167,84 @@ class TraceNodeArgs(IArgs):
 
   def __repr__(self):
     return "%s(%r)" % (self.__class__, self.__dict__)
+
+# Most nodes have at most one child, and an OrderedSet (an OrderedDict
+# underneath) apiece would dominate the memory of a large trace.  So a
+# node's children slot holds None, the one child itself, a ChildTuple
+# tuple of up to _SMALL_CHILDREN children, or, past that, an
+# OrderedSet.  Each form keeps the children in the order they were
+# added.
+
+_SMALL_CHILDREN = 8
+
+class ChildTuple(tuple):
+  """A few children, in order, with the read-only set operations that
+callers of Trace.childrenAt use."""
+  __slots__ = ()
+  def isdisjoint(self, other):
+    return not any(x in other for x in self)
+  def union(self, *others):
+    return OrderedFrozenSet(self).union(*others)
+  def intersection(self, *others):
+    return OrderedFrozenSet(self).intersection(*others)
+
+_NO_CHILDREN = ChildTuple()
+
+def childrenOf(node):
+  """The children of the node, as an ordered set that the caller must
+not mutate."""
+  children = node.children
+  if children is None:
+    return _NO_CHILDREN
+  elif isinstance(children, (ChildTuple, OrderedSet)):
+    return children
+  else:
+    return ChildTuple((children,))
+
+def iterChildren(node):
+  children = node.children
+  if children is None:
+    return iter(())
+  elif isinstance(children, (ChildTuple, OrderedSet)):
+    return iter(children)
+  else:
+    return iter((children,))
+
+def addChild(node, child):
+  """Add the child to the node's children; return whether it was new."""
+  children = node.children
+  if children is None:
+    node.children = child
+  elif isinstance(children, OrderedSet):
+    if child in children: return False
+    children.add(child)
+  elif isinstance(children, ChildTuple):
+    if child in children: return False
+    if len(children) < _SMALL_CHILDREN:
+      node.children = ChildTuple(children + (child,))
+    else:
+      node.children = OrderedSet(children + (child,))
+  else:
+    if children is child: return False
+    node.children = ChildTuple((children, child))
+  return True
+
+def removeChild(node, child):
+  children = node.children
+  if isinstance(children, OrderedSet):
+    children.remove(child)
+    if len(children) == 0:
+      node.children = None
+    elif len(children) == 1:
+      node.children = next(iter(children))
+    elif len(children) <= _SMALL_CHILDREN:
+      node.children = ChildTuple(children)
+  elif isinstance(children, ChildTuple):
+    if child not in children:
+      raise KeyError(child)
+    rest = [c for c in children if c is not child]
+    node.children = rest[0] if len(rest) == 1 else ChildTuple(rest)
+  elif children is child:
+    node.children = None
+  else:
+    raise KeyError(child)
@@ -17,7 +17,6 @@
 
 import random
 import numpy.random as npr
-from collections import OrderedDict
 
 from venture.lite.node import Node
 from venture.lite.sp import VentureSPRecord
@@ -34,6 +33,14 @@ def node_key(node):
 
 class Particle(Trace):
 
+  # Particles are short-lived, so they construct their scaffolds and
+  # block extents afresh rather than tracking their structure.  The base trace
+  # notices the structural changes a particle makes when it is
+  # committed.
+  scaffoldCache = None
+  extentCache = None
+  def noteStructureChange(self): pass
+
   # The trace is expected to be a torus, with the chosen scaffold
   # already detached, or a particle.
   def __init__(self, trace):
@@ -48,6 +55,7 @@ class Particle(Trace):
   # Note: using "copy()" informally for both legit_copy and persistent_copy
   def initFromParticle(self, particle):
     self.base = particle.base
+    self.phase_profile = particle.phase_profile
 
     # (1) Persistent stuff
     self.rcs = particle.rcs
@@ -69,13 +77,17 @@ class Particle(Trace):
     self.py_rng = random.Random(prng.randint(1, 2**31 - 1))
     self.np_rng = npr.RandomState(prng.randint(1, 2**31 - 1))
 
-    # (2) Maps to things that change outside of particle methods
-    self.madeSPAuxs = OrderedDict(
-      (node, spaux.copy())
-      for node, spaux in particle.madeSPAuxs.iteritems())
+    # (2) Maps to things that change outside of particle methods.
+    # The auxes are shared copy-on-write: whichever of the two
+    # particles next asks for one gets its own copy (see madeSPAuxAt),
+    # so forking costs nothing per aux.
+    self.madeSPAuxs = particle.madeSPAuxs
+    self.ownedAuxs = set()
+    particle.ownedAuxs = set()
 
   def initFromTrace(self, trace):
     self.base = trace
+    self.phase_profile = trace.phase_profile
 
     # (1) Persistent stuff
     self.rcs = PSet(node_key) # PSet Node
@@ -99,7 +111,8 @@ class Particle(Trace):
     self.np_rng = npr.RandomState(prng.randint(1, 2**31 - 1))
 
     # (2) Maps to things that change outside of particle methods
-    self.madeSPAuxs = OrderedDict()
+    self.madeSPAuxs = PMap(node_key) # PMap Node SPAux
+    self.ownedAuxs = set() # Nodes whose aux no other particle shares
 
 
   ### Random choices and scopes
@@ -152,7 +165,8 @@ class Particle(Trace):
 
   def setMadeSPRecordAt(self, node, spRecord):
     self.madeSPs = self.madeSPs.insert(node, spRecord.sp)
-    self.madeSPAuxs[node] = spRecord.spAux
+    self.madeSPAuxs = self.madeSPAuxs.insert(node, spRecord.spAux)
+    self.ownedAuxs.add(node)
     self.newMadeSPFamilies = self.newMadeSPFamilies.insert(node, PMap())
 
   def madeSPAt(self, node):
@@ -256,16 +270,25 @@ class Particle(Trace):
   ### Regular maps
 
   def madeSPAuxAt(self, node):
-    if node not in self.madeSPAuxs:
-      if self.base.madeSPAuxAt(node) is not None:
-        self.madeSPAuxs[node] = self.base.madeSPAuxAt(node).copy()
-      else: return None
-    return self.madeSPAuxs[node]
+    # Callers may mutate the aux, so hand out only one this particle
+    # owns, copying it from the base or a sibling on first access.
+    if node in self.ownedAuxs:
+      return self.madeSPAuxs.lookup(node)
+    if node in self.madeSPAuxs:
+      spaux = self.madeSPAuxs.lookup(node)
+    else:
+      spaux = self.base.madeSPAuxAt(node)
+      if spaux is None: return None
+    spaux = spaux.copy()
+    self.madeSPAuxs = self.madeSPAuxs.insert(node, spaux)
+    self.ownedAuxs.add(node)
+    return spaux
 
   def setMadeSPAuxAt(self, node, aux):
     assert node not in self.madeSPAuxs
     assert self.base.madeSPAuxAt(node) is None
-    self.madeSPAuxs[node] = aux
+    self.madeSPAuxs = self.madeSPAuxs.insert(node, aux)
+    self.ownedAuxs.add(node)
 
   ### Miscellaneous bookkeeping
 
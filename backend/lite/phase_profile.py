@@ -0,0 +1,110 @@
+# Copyright (c) 2016 MIT Probabilistic Computing Project.
+#
+# This file is part of Venture.
+#
+# Venture is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Venture is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Venture.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Opt-in aggregate profiling of the phases of Lite's transitions.
+
+A PhaseProfile accumulates, over any number of transitions, how long
+each phase took (constructing the scaffold, detaching, regenerating,
+accepting, restoring on rejection, and running AE kernels), how large
+the scaffolds were, and how many times PSPs of each class were
+applied, unapplied, absorbed and unabsorbed.  Durations and sizes are
+kept as histograms with power-of-two buckets, so the memory a profile
+takes does not grow with the number of transitions.
+
+"""
+
+from collections import OrderedDict
+import math
+
+from venture.lite.psp import TypedPSP
+
+class Histogram(object):
+  """The distribution of a nonnegative quantity, bucketed by powers of two."""
+  def __init__(self):
+    self.count = 0
+    self.total = 0
+    self.min = None
+    self.max = None
+    # Exponent e -> number of samples x with 2**(e-1) <= x < 2**e;
+    # None -> number of zeros.
+    self.buckets = {}
+
+  def add(self, x):
+    self.count += 1
+    self.total += x
+    if self.min is None or x < self.min: self.min = x
+    if self.max is None or x > self.max: self.max = x
+    e = math.frexp(x)[1] if x > 0 else None
+    self.buckets[e] = self.buckets.get(e, 0) + 1
+
+  def quantile(self, q):
+    """An upper bound on the q-th quantile, tight to a factor of two."""
+    if self.count == 0: return None
+    target = q * self.count
+    seen = 0
+    for e in sorted(self.buckets): # None, for zero, sorts first
+      seen += self.buckets[e]
+      if seen >= target:
+        return 0 if e is None else min(math.ldexp(1, e), self.max)
+    return self.max
+
+class PhaseProfile(object):
+  def __init__(self):
+    self.phases = OrderedDict() # phase name -> Histogram of seconds
+    self.sizes = OrderedDict() # node set name -> Histogram of sizes
+    self.pspCalls = OrderedDict() # (PSP class name, operation) -> count
+
+  def recordTime(self, phase, seconds):
+    _histogram(self.phases, phase).add(seconds)
+
+  def recordScaffold(self, scaffold):
+    sizes = [("principal", sum(len(pnodes) for pnodes in scaffold.setsOfPNodes)),
+             ("drg", len(scaffold.drg)),
+             ("absorbing", len(scaffold.absorbing)),
+             ("aaa", len(scaffold.aaa)),
+             ("brush", len(scaffold.brush))]
+    for (name, size) in sizes:
+      _histogram(self.sizes, name).add(size)
+
+  def countPSP(self, psp, operation, times=1):
+    while isinstance(psp, TypedPSP):
+      psp = psp.psp
+    key = (type(psp).__name__, operation)
+    self.pspCalls[key] = self.pspCalls.get(key, 0) + times
+
+  def rows(self):
+    """The profile as records, one per phase, node set, and PSP class
+and operation, suitable for a DataFrame."""
+    ans = []
+    for (category, table) in [("time", self.phases), ("size", self.sizes)]:
+      for (name, hist) in table.iteritems():
+        ans.append(dict(category=category, name=name, operation=None,
+                        count=hist.count, total=hist.total,
+                        mean=float(hist.total) / hist.count,
+                        min=hist.min, median=hist.quantile(0.5),
+                        p90=hist.quantile(0.9), max=hist.max))
+    for ((name, operation), count) in self.pspCalls.iteritems():
+      ans.append(dict(category="psp", name=name, operation=operation,
+                      count=count, total=count, mean=None, min=None,
+                      median=None, p90=None, max=None))
+    return ans
+
+def _histogram(table, name):
+  hist = table.get(name)
+  if hist is None:
+    hist = table[name] = Histogram()
+  return hist
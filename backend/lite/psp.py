@@ -15,6 +15,8 @@
 # You should have received a copy of the GNU General Public License
 # along with Venture.  If not, see <http://www.gnu.org/licenses/>.
 
+from collections import OrderedDict
+
 from venture.lite.env import VentureEnvironment
 from venture.lite.exception import VentureBuiltinSPMethodError
 from venture.lite.lkernel import DefaultVariationalLKernel
@@ -165,6 +167,29 @@ class PSP(object):
     raise VentureBuiltinSPMethodError("Cannot compute log density of %s",
       type(self))
 
+  def logDensityBatch(self, values, argsList):
+    """Return the log-densities of simulating each of the given values
+    from the corresponding args, as a sequence of numbers.
+
+    The default calls logDensity on each pair in turn.  PSPs whose
+    log density has a simple closed form may override this to
+    evaluate the whole batch at once, e.g., with NumPy.  See also
+    canBatchLogDensity.
+    """
+    return [self.logDensity(value, args)
+            for (value, args) in zip(values, argsList)]
+
+  def canBatchLogDensity(self):
+    """Return whether the log densities of several applications of this
+    PSP may be computed together with logDensityBatch.
+
+    This holds if the log density at any application does not depend
+    on what was incorporated at the others.  If it does, absorbing
+    applications of this PSP in a scaffold are absorbed in one batch
+    rather than one at a time.
+    """
+    return False
+
   def gradientOfLogDensity(self, _value, _args):
     """Return the gradient of this PSP's logDensity function.  This method
     is needed only for gradient-based methods (currently Hamiltonian
@@ -515,6 +540,14 @@ class TypedPSP(PSP):
     return self.psp.logDensity(
       self.f_type.unwrap_return(value), self.f_type.unwrap_args(args))
 
+  def logDensityBatch(self, values, argsList):
+    return self.psp.logDensityBatch(
+      [self.f_type.unwrap_return(value) for value in values],
+      [self.f_type.unwrap_args(args) for args in argsList])
+
+  def canBatchLogDensity(self):
+    return self.psp.canBatchLogDensity()
+
   def gradientOfLogDensity(self, value, args):
     (dvalue, dargs) = self.psp.gradientOfLogDensity(
       self.f_type.unwrap_return(value), self.f_type.unwrap_args(args))
@@ -605,6 +638,22 @@ class DispatchingPSP(PSP):
   def logDensity(self, value, args):
     return self._disptach(args).logDensity(value, args)
 
+  def logDensityBatch(self, values, argsList):
+    # Batch together the applications that dispatch to the same PSP.
+    groups = OrderedDict()
+    for (i, args) in enumerate(argsList):
+      groups.setdefault(self._disptach(args), []).append(i)
+    ans = [None for _ in values]
+    for (psp, indexes) in groups.iteritems():
+      batch = psp.logDensityBatch([values[i] for i in indexes],
+                                  [argsList[i] for i in indexes])
+      for (i, weight) in zip(indexes, batch):
+        ans[i] = weight
+    return ans
+
+  def canBatchLogDensity(self):
+    return all(psp.canBatchLogDensity() for psp in self.psps)
+
   def gradientOfLogDensity(self, value, args):
     return self._disptach(args).gradientOfLogDensity(value, args)
 
@@ -59,14 +59,22 @@ def regenAndAttachAtBorder(trace, border, scaffold,
                            shouldRestore, omegaDB, gradients):
   weight = 0
   constraintsToPropagate = OrderedDict()
+  batches = OrderedDict() # psp -> absorbing nodes to absorb together
   for node in border:
 #    print "regenAndAttach...", node
     if scaffold.isAbsorbing(node):
-      weight += attach(trace, node, scaffold, shouldRestore, omegaDB, gradients)
+      weight += regenParents(trace, node, scaffold, shouldRestore, omegaDB, gradients)
+      psp = trace.pspAt(node)
+      if psp.canBatchLogDensity():
+        batches.setdefault(psp, []).append(node)
+      else:
+        weight += absorb(trace, node)
     else:
       weight += regen(trace, node, scaffold, shouldRestore, omegaDB, gradients)
       if node.isObservation:
         weight += getAndConstrain(trace, node, constraintsToPropagate)
+  for (psp, nodes) in batches.iteritems():
+    weight += absorbBatch(trace, psp, nodes)
   propagateConstraints(trace, constraintsToPropagate)
 
   return ensure_python_float(weight)
@@ -119,6 +127,8 @@ def attach(trace, node, scaffold, shouldRestore, omegaDB, gradients):
 
 def absorb(trace, node):
   psp, args = trace.pspAt(node), trace.argsAt(node)
+  if trace.phase_profile is not None:
+    trace.phase_profile.countPSP(psp, "absorb")
   gvalue = trace.groundValueAt(node)
   weight = psp.logDensity(gvalue, args)
   check_weight(weight, psp, args)
@@ -126,6 +136,22 @@ def absorb(trace, node):
   maybeRegisterRandomChoiceInScope(trace, node)
   return ensure_python_float(weight)
 
+def absorbBatch(trace, psp, nodes):
+  if len(nodes) == 1:
+    return absorb(trace, nodes[0])
+  if trace.phase_profile is not None:
+    trace.phase_profile.countPSP(psp, "absorb", len(nodes))
+  argsList = [trace.argsAt(node) for node in nodes]
+  gvalues = [trace.groundValueAt(node) for node in nodes]
+  weight = sum(psp.logDensityBatch(gvalues, argsList))
+  if math.isnan(weight):
+    for (gvalue, args) in zip(gvalues, argsList):
+      check_weight(psp.logDensity(gvalue, args), psp, args)
+  for (node, gvalue, args) in zip(nodes, gvalues, argsList):
+    psp.incorporate(gvalue, args)
+    maybeRegisterRandomChoiceInScope(trace, node)
+  return ensure_python_float(weight)
+
 def regenParents(trace, node, scaffold, shouldRestore, omegaDB, gradients):
   weight = 0
   for parent in trace.definiteParentsAt(node):
@@ -256,6 +282,8 @@ def applyPSP(trace, node, scaffold, shouldRestore, omegaDB, gradients):
   weight = 0
   psp, args = trace.pspAt(node), trace.argsAt(node)
   assert isinstance(psp, PSP)
+  if trace.phase_profile is not None:
+    trace.phase_profile.countPSP(psp, "apply")
 
   if omegaDB.hasValueFor(node): oldValue = omegaDB.getValue(node)
   else: oldValue = None
@@ -172,6 +172,46 @@ def constructScaffold(trace, setsOfPNodes, useDeltaKernels=False, deltaKernelArg
 
   return scaffold
 
+class ScaffoldCache(object):
+  """Scaffolds already constructed on a trace, keyed by their
+  principal nodes.
+
+  Constructing a scaffold depends only on the structure of the trace
+  (its nodes, their child and ESR edges, and which SP each
+  application node applies), not on the values of random choices.
+  The trace's structureKey changes whenever that structure does,
+  whereupon the cache is discarded.  Each lookup returns a fresh
+  Scaffold, because inference operators mutate the regen counts and
+  lkernels of the scaffolds they are given.
+
+  Only scaffolds without delta kernels, hard borders or value updates
+  are cached.
+  """
+
+  def __init__(self):
+    self.version = None
+    self.entries = {}
+
+  def __reduce__(self):
+    # Copies and serializations of a trace start with an empty cache.
+    return (ScaffoldCache, ())
+
+  def scaffold(self, trace, key, setsOfPNodes):
+    version = trace.structureKey()
+    if self.version != version:
+      self.entries.clear()
+      self.version = version
+    key = (key, tuple(tuple(pnodes) for pnodes in setsOfPNodes))
+    if key not in self.entries:
+      self.entries[key] = constructScaffold(trace, setsOfPNodes)
+    template = self.entries[key]
+    return Scaffold(template.setsOfPNodes,
+                    OrderedDict(template.regenCounts),
+                    template.absorbing, template.aaa,
+                    [list(segment) for segment in template.border],
+                    loadKernels(trace, template.drg, template.aaa, False, None),
+                    template.brush, template.drg)
+
 def addResamplingNode(trace,drg,absorbing,aaa,q,node,indexAssignments,i,hardBorder):
   if node not in hardBorder:
     if node not in drg or \
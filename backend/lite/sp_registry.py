@@ -38,3 +38,6 @@ def builtInSPs():
 def builtInSPsIter():
   for item in _builtInSPsList:
     yield item
+
+def numBuiltInSPs():
+  return len(_builtInSPsList)
@@ -0,0 +1,287 @@
+# Copyright (c) 2016 MIT Probabilistic Computing Project.
+#
+# This file is part of Venture.
+#
+# Venture is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Venture is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Venture.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Deep-copying Lite traces by analogy with the stop-and-copy
+garbage collection algorithm.
+
+This is the Lite counterpart of Puma's stop_and_copy.cxx.  The copy
+walks the node graph once, allocating an empty shell for every node
+it finds and entering it into the forwarding map, and then fills in
+the fields of each shell by translating them through that map.  No
+PSP is ever invoked, so copying a trace costs time proportional to
+its size rather than to the cost of re-evaluating the program, as
+the dump/restore path in venture.engine.trace does.
+
+The forwarding map doubles as the memo dictionary of Python's
+copy.deepcopy.  The field types that make up the bulk of a trace
+(node lists, child sets, SPRefs, SP records, environments, requests)
+are translated directly; anything else reachable from the trace (SP
+auxes, scopes, made SPs) is copied by deepcopy with node references
+translated through the map.  Pre-populating the map with
+all the nodes keeps the copy from recursing along chains of nodes,
+which would otherwise exceed Python's stack for long models.
+
+Some objects are shared between the original and the copy rather
+than copied:
+
+- Addresses, which are immutable.
+
+- Atomic Venture values (numbers, symbols, etc), which are immutable.
+  The dump/restore path already shares random values between the
+  traces it copies.
+
+- The SP objects bound as primitives (builtins and foreign SPs),
+  which are already shared among all traces through the SP registry
+  and the engine's foreign SP table.  Their SP records and auxes are
+  still copied.
+
+"""
+
+import copy
+import gc
+import random
+
+from collections import OrderedDict
+
+from venture.lite.address import BuiltinAddress
+from venture.lite.env import BuiltinEnvironment
+from venture.lite.env import VentureEnvironment
+from venture.lite.node import ChildTuple
+from venture.lite.node import Node
+from venture.lite.node import iterChildren
+from venture.lite.orderedset import OrderedSet
+from venture.lite.request import ESR
+from venture.lite.request import Request
+from venture.lite.sp import SPAux
+from venture.lite.sp import SPFamilies
+from venture.lite.sp import VentureSPRecord
+from venture.lite.value import SPRef
+from venture.lite.value import VentureAtom
+from venture.lite.value import VentureBool
+from venture.lite.value import VentureInteger
+from venture.lite.value import VentureNil
+from venture.lite.value import VentureNumber
+from venture.lite.value import VenturePair
+from venture.lite.value import VentureString
+from venture.lite.value import VentureSymbol
+
+_shared_types = frozenset([
+  bool, int, long, float, str,
+  VentureNumber, VentureInteger, VentureAtom, VentureBool, VentureSymbol,
+  VentureString, VentureNil])
+
+def stop_and_copy(trace):
+  """Return a deep copy of the given trace that shares no mutable
+state with it."""
+  # The copy allocates many container objects but frees none, so
+  # there is nothing for the cyclic garbage collector to find while
+  # it runs; suspend it rather than have it repeatedly traverse the
+  # whole heap.
+  enabled = gc.isenabled()
+  gc.disable()
+  try:
+    return _stop_and_copy(trace)
+  finally:
+    if enabled:
+      gc.enable()
+
+def _stop_and_copy(trace):
+  forward = {}
+  answer = trace.__class__.__new__(trace.__class__)
+  forward[id(trace)] = answer
+  # Keep the originals alive for the duration of the copy, as
+  # deepcopy does, so that their ids are not reused.
+  forward[id(forward)] = [trace]
+
+  nodes = _reachable_nodes(trace)
+  for node in nodes:
+    forward[id(node)] = node.__class__.__new__(node.__class__)
+    if isinstance(node.address, BuiltinAddress) and \
+       node.madeSPRecord is not None:
+      sp = node.madeSPRecord.sp
+      forward[id(sp)] = sp
+  forward[id(forward)].extend(nodes)
+
+  for node in nodes:
+    _fill_node(forward[id(node)], node, forward)
+  for (key, val) in trace.__dict__.iteritems():
+    answer.__dict__[key] = _copy_value(val, forward)
+  return answer
+
+def _reachable_nodes(trace):
+  roots = []
+  env = trace.globalEnv
+  while env is not None:
+    roots.extend(n for n in env.frame.itervalues() if n is not None)
+    env = env.outerEnv
+  roots.extend(trace.families.itervalues())
+  roots.extend(trace.unpropagatedObservations.iterkeys())
+  roots.extend(trace.rcs)
+  roots.extend(trace.ccs)
+  roots.extend(trace.aes)
+
+  seen = set()
+  nodes = []
+  worklist = roots
+  while worklist:
+    node = worklist.pop()
+    if id(node) in seen:
+      continue
+    seen.add(id(node))
+    nodes.append(node)
+    worklist.extend(_adjacent_nodes(node))
+  return nodes
+
+def _adjacent_nodes(node):
+  # Read the slots directly rather than calling parents(), because
+  # frozen nodes have had their parent pointers cleared.
+  for slot in ('sourceNode', 'operatorNode', 'requestNode', 'outputNode'):
+    neighbor = getattr(node, slot, None)
+    if neighbor is not None:
+      yield neighbor
+  operands = getattr(node, 'operandNodes', None)
+  if operands is not None:
+    for operand in operands:
+      yield operand
+  if node.esrParents is not None:
+    for parent in node.esrParents:
+      yield parent
+  for child in iterChildren(node):
+    yield child
+  if node.madeSPRecord is not None and \
+     node.madeSPRecord.spFamilies is not None:
+    for root in node.madeSPRecord.spFamilies.families.itervalues():
+      yield root
+
+def _fill_node(new, old, forward):
+  new.address = old.address
+  for slot in _node_slots(old.__class__):
+    val = getattr(old, slot, _unset)
+    if val is not _unset:
+      setattr(new, slot, _copy_value(val, forward))
+
+_unset = object()
+
+def _copy_value(val, forward):
+  # Fast paths for the types that make up the bulk of a trace; fall
+  # back to deepcopy for everything else.
+  kind = type(val)
+  if val is None or kind in _shared_types:
+    return val
+  elif id(val) in forward:
+    return forward[id(val)]
+  elif kind is list:
+    ans = []
+    forward[id(val)] = ans
+    ans.extend([_copy_value(x, forward) for x in val])
+    return ans
+  elif kind is ChildTuple:
+    # Holds nothing but nodes, which are all forwarded already.
+    ans = ChildTuple([forward[id(x)] for x in val])
+    forward[id(val)] = ans
+    return ans
+  elif kind is OrderedSet:
+    ans = OrderedSet()
+    forward[id(val)] = ans
+    members = ans._dict # pylint: disable=protected-access
+    for x in val:
+      members[_copy_value(x, forward)] = 1
+    return ans
+  elif kind is SPRef:
+    ans = SPRef(_copy_value(val.makerNode, forward))
+    forward[id(val)] = ans
+    return ans
+  elif kind is Request:
+    ans = Request([_copy_esr(esr, forward) for esr in val.esrs],
+                  copy.deepcopy(val.lsrs, forward))
+    forward[id(val)] = ans
+    return ans
+  elif kind is VentureEnvironment or kind is BuiltinEnvironment:
+    ans = kind.__new__(kind)
+    forward[id(val)] = ans
+    ans.outerEnv = _copy_value(val.outerEnv, forward)
+    ans.frame = OrderedDict()
+    for (sym, node) in val.frame.iteritems():
+      ans.frame[sym] = _copy_value(node, forward)
+    if kind is BuiltinEnvironment:
+      ans.trace = _copy_value(val.trace, forward)
+      ans.builtins = val.builtins # Shared by all traces
+    return ans
+  elif kind is VentureSPRecord:
+    return _copy_sp_record(val, forward)
+  elif kind is VenturePair:
+    return _copy_list(val, forward)
+  elif kind is random.Random:
+    # deepcopy would copy the Mersenne Twister state word by word.
+    ans = random.Random()
+    ans.setstate(val.getstate())
+    forward[id(val)] = ans
+    return ans
+  else:
+    return copy.deepcopy(val, forward)
+
+def _copy_sp_record(record, forward):
+  ans = VentureSPRecord.__new__(VentureSPRecord)
+  forward[id(record)] = ans
+  ans.sp = _copy_value(record.sp, forward)
+  if type(record.spAux) is SPAux:
+    # The base SPAux is stateless, and most SPs use it.
+    ans.spAux = SPAux()
+  else:
+    ans.spAux = _copy_value(record.spAux, forward)
+  if record.spFamilies is None:
+    ans.spFamilies = None
+  else:
+    ans.spFamilies = SPFamilies()
+    for (esrId, root) in record.spFamilies.families.iteritems():
+      ans.spFamilies.registerFamily(
+        copy.deepcopy(esrId, forward), _copy_value(root, forward))
+  return ans
+
+def _copy_esr(esr, forward):
+  # The expression and address of an ESR are immutable, but its id
+  # may contain nodes.
+  return ESR(copy.deepcopy(esr.id, forward), esr.exp, esr.addr,
+             _copy_value(esr.env, forward), esr.block, esr.subBlock)
+
+def _copy_list(pair, forward):
+  # Venture lists can be long; copy the spine iteratively to avoid
+  # exhausting the stack.
+  spine = []
+  while type(pair) is VenturePair and id(pair) not in forward:
+    spine.append(pair)
+    pair = pair.rest
+  tail = _copy_value(pair, forward)
+  for old in reversed(spine):
+    tail = VenturePair((_copy_value(old.first, forward), tail))
+    forward[id(old)] = tail
+  return tail
+
+_slot_cache = {}
+
+def _node_slots(cls):
+  if cls not in _slot_cache:
+    assert issubclass(cls, Node)
+    slots = []
+    for klass in reversed(cls.__mro__):
+      declared = klass.__dict__.get('__slots__', ())
+      if isinstance(declared, str):
+        declared = (declared,)
+      slots.extend(s for s in declared
+                   if s not in ('address', '__weakref__', '__dict__'))
+    _slot_cache[cls] = slots
+  return _slot_cache[cls]
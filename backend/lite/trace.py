@@ -25,11 +25,11 @@ import numpy.random as npr
 from numpy.testing import assert_allclose
 
 from venture.exception import VentureException
-from venture.lite.builtin import builtInSPsIter
-from venture.lite.builtin import builtInValues
+from venture.lite.builtin import builtInBindings
 from venture.lite.detach import detachAndExtract
 from venture.lite.detach import unconstrain
 from venture.lite.detach import unevalFamily
+from venture.lite.env import BuiltinEnvironment
 from venture.lite.env import VentureEnvironment
 from venture.lite.exception import VentureError
 from venture.lite.infer import BlockScaffoldIndexer
@@ -42,8 +42,13 @@ from venture.lite.node import isConstantNode
 from venture.lite.node import isLookupNode
 from venture.lite.node import isOutputNode
 from venture.lite.node import TraceNodeArgs
+from venture.lite.node import addChild
+from venture.lite.node import childrenOf
+from venture.lite.node import iterChildren
+from venture.lite.node import removeChild
 from venture.lite.omegadb import OmegaDB
 from venture.lite.orderedset import OrderedSet
+from venture.lite.phase_profile import PhaseProfile
 from venture.lite.psp import ESRRefOutputPSP
 from venture.lite.regen import constrain
 from venture.lite.regen import evalFamily
@@ -51,11 +56,14 @@ from venture.lite.regen import processMadeSP
 from venture.lite.regen import regenAndAttach
 from venture.lite.regen import restore
 from venture.lite.scaffold import Scaffold
+from venture.lite.scaffold import ScaffoldCache
 from venture.lite.scaffold import constructScaffold
 from venture.lite.scope import isTagExcludeOutputPSP
 from venture.lite.scope import isTagOutputPSP
 from venture.lite.serialize import OrderedOmegaDB
 from venture.lite.smap import SamplableMap
+from venture.lite.stop_and_copy import stop_and_copy
+from venture.lite.sp import SPAux
 from venture.lite.sp import SPFamilies
 from venture.lite.sp import VentureSPRecord
 from venture.lite.types import ExpressionType
@@ -66,14 +74,48 @@ from venture.lite.value import VentureValue
 import venture.lite.address as addr
 import venture.lite.infer as infer
 
+def _edgeHash(node, child):
+  # Nodes hash by identity.
+  return hash((node, child))
+
+def _choiceHash(scope, block, node):
+  return hash((scope, block, node))
+
+class BlockExtentCache(object):
+  """The random choices in the dynamic extents of custom scope blocks.
+
+  The extent of a block depends on the structure of the trace and on
+  which nodes are registered in which scopes (including the default
+  scope, which tracks which choices are unconstrained), but not on
+  the values of the random choices.  The cache is discarded whenever
+  the trace's extentKey changes, which it does not across a rejected
+  or structure-preserving proposal.
+  """
+
+  def __init__(self):
+    self.version = None
+    self.entries = {}
+
+  def __reduce__(self):
+    # Copies and serializations of a trace start with an empty cache.
+    return (BlockExtentCache, ())
+
+  def extent(self, trace, scope, block):
+    version = trace.extentKey()
+    if self.version != version:
+      self.entries.clear()
+      self.version = version
+    key = (scope, block)
+    if key not in self.entries:
+      self.entries[key] = trace.randomChoicesInExtent(
+        trace.scopes[scope][block], scope, block)
+    return self.entries[key]
+
 class Trace(object):
   def __init__(self, seed):
 
-    self.globalEnv = VentureEnvironment()
-    for name, val in builtInValues().iteritems():
-      self.bindPrimitiveName(name, val)
-    for name, sp in builtInSPsIter():
-      self.bindPrimitiveSP(name, sp)
+    # Builtins are bound on first lookup; see BuiltinEnvironment
+    self.globalEnv = BuiltinEnvironment(self, builtInBindings())
     self.sealEnvironment() # New frame so users can shadow globals
 
     self.rcs = OrderedSet()
@@ -85,6 +127,27 @@ class Trace(object):
 
     self.profiling_enabled = False
     self.stats = []
+    # The PhaseProfile being recorded into, if any, and the one
+    # recorded so far, which survives disabling phase profiling.
+    self.phase_profile = None
+    self.phase_stats = None
+
+    # Together, these change whenever the structure of the trace does;
+    # see ScaffoldCache.  The version is bumped when nodes are created
+    # or a procedure-valued node starts referring to a different SP.
+    # The hash is a sum over the child edges, so that removing edges
+    # and then restoring them, as a rejected proposal does, leaves it
+    # unchanged.
+    self.structureVersion = 0
+    self.childEdgeHash = 0
+    self.scaffoldCache = ScaffoldCache()
+    # Likewise a sum over the scope registrations, for BlockExtentCache.
+    self.choiceHash = 0
+    self.extentCache = BlockExtentCache()
+    # The HMCAdaptation of adaptive_hmc on each (scope, block).  Unlike
+    # the caches, these are state of the inference, and are copied
+    # along with the trace.
+    self.hmcAdaptations = {}
 
     assert seed is not None
     rng = random.Random(seed)
@@ -100,15 +163,26 @@ class Trace(object):
     self.globalEnv = VentureEnvironment(self.globalEnv)
 
   def bindPrimitiveName(self, name, val):
-    address = addr.builtin_address(name)
-    self.globalEnv.addBinding(name, self.createConstantNode(address, val))
+    self.globalEnv.addBinding(name, self.createPrimitiveNode(name, val))
 
   def bindPrimitiveSP(self, name, sp):
+    self.globalEnv.addBinding(name, self.createPrimitiveSPNode(name, sp))
+
+  def createPrimitiveNode(self, name, val):
+    return self.createConstantNode(addr.builtin_address(name), val)
+
+  def createPrimitiveSPNode(self, name, sp):
     address = addr.builtin_address(name)
     spNode = self.createConstantNode(address, VentureSPRecord(sp))
     processMadeSP(self, spNode, False)
     assert isinstance(self.valueAt(spNode), SPRef)
-    self.globalEnv.addBinding(name, spNode)
+    return spNode
+
+  def createBuiltinNode(self, name, val):
+    if isinstance(val, VentureValue):
+      return self.createPrimitiveNode(name, val)
+    else:
+      return self.createPrimitiveSPNode(name, val)
 
   def registerAEKernel(self, node): self.aes.add(node)
   def unregisterAEKernel(self, node): self.aes.remove(node)
@@ -124,6 +198,7 @@ class Trace(object):
     if block not in self.scopes[scope]: self.scopes[scope][block] = OrderedSet()
     assert node not in self.scopes[scope][block]
     self.scopes[scope][block].add(node)
+    self.choiceHash += _choiceHash(scope, block, node)
     assert scope != "default" or len(self.scopes[scope][block]) == 1
 
   def unregisterRandomChoice(self, node):
@@ -134,6 +209,7 @@ class Trace(object):
   def unregisterRandomChoiceInScope(self, scope, block, node):
     (scope, block) = self._normalizeEvaluatedScopeAndBlock(scope, block)
     self.scopes[scope][block].remove(node)
+    self.choiceHash -= _choiceHash(scope, block, node)
     if scope == "default":
       assert len(self.scopes[scope][block]) == 0
     if len(self.scopes[scope][block]) == 0: del self.scopes[scope][block]
@@ -178,14 +254,18 @@ class Trace(object):
     self.ccs.remove(node)
     if self.pspAt(node).isRandom(): self.registerRandomChoice(node)
 
-  def createConstantNode(self, address, val): return ConstantNode(address, val)
+  def createConstantNode(self, address, val):
+    self.noteStructureChange()
+    return ConstantNode(address, val)
   def createLookupNode(self, address, sourceNode):
+    self.noteStructureChange()
     lookupNode = LookupNode(address, sourceNode)
     self.setValueAt(lookupNode, self.valueAt(sourceNode))
     self.addChildAt(sourceNode, lookupNode)
     return lookupNode
 
   def createApplicationNodes(self, address, operatorNode, operandNodes, env):
+    self.noteStructureChange()
     requestNode = RequestNode(address, operatorNode, operandNodes, env)
     outputNode = OutputNode(address, operatorNode, operandNodes, requestNode, env)
     self.addChildAt(operatorNode, requestNode)
@@ -243,6 +323,11 @@ class Trace(object):
 
   def setValueAt(self, node, value):
     assert node.isAppropriateValue(value)
+    if isinstance(value, SPRef) and value.makerNode is not node \
+       and isOutputNode(node):
+      # The applications of this node's value may now use different
+      # PSPs.
+      self.noteStructureChange()
     node.value = value
 
   def hasMadeSPRecordAt(self, node):
@@ -279,15 +364,31 @@ class Trace(object):
   def parentsAt(self, node): return node.parents()
   def definiteParentsAt(self, node): return node.definiteParents()
 
-  def esrParentsAt(self, node): return node.esrParents
-  def setEsrParentsAt(self, node, parents): node.esrParents = parents
-  def appendEsrParentAt(self, node, parent): node.esrParents.append(parent)
-  def popEsrParentAt(self, node): return node.esrParents.pop()
-
-  def childrenAt(self, node): return node.children
-  def setChildrenAt(self, node, children): node.children = children
-  def addChildAt(self, node, child): node.children.add(child)
-  def removeChildAt(self, node, child): node.children.remove(child)
+  def esrParentsAt(self, node): return node.esrParents or []
+  def setEsrParentsAt(self, node, parents): node.esrParents = parents or None
+  def appendEsrParentAt(self, node, parent):
+    if node.esrParents is None: node.esrParents = [parent]
+    else: node.esrParents.append(parent)
+  def popEsrParentAt(self, node):
+    parent = node.esrParents.pop()
+    if not node.esrParents: node.esrParents = None
+    return parent
+
+  def childrenAt(self, node): return childrenOf(node)
+  def setChildrenAt(self, node, children):
+    for child in iterChildren(node): self.childEdgeHash -= _edgeHash(node, child)
+    node.children = None
+    for child in children: self.addChildAt(node, child)
+  def addChildAt(self, node, child):
+    if addChild(node, child):
+      self.childEdgeHash += _edgeHash(node, child)
+  def removeChildAt(self, node, child):
+    removeChild(node, child)
+    self.childEdgeHash -= _edgeHash(node, child)
+
+  def noteStructureChange(self): self.structureVersion += 1
+  def structureKey(self): return (self.structureVersion, self.childEdgeHash)
+  def extentKey(self): return (self.structureKey(), self.choiceHash)
 
   def registerFamilyAt(self, node, esrId, esrParent): self.spFamiliesAt(node).registerFamily(esrId, esrParent)
   def unregisterFamilyAt(self, node, esrId): self.spFamiliesAt(node).unregisterFamily(esrId)
@@ -349,8 +450,14 @@ class Trace(object):
         return OrderedSet(list(nodes))
       else:
         return nodes
-    else:
+    elif self.extentCache is None:
       return self.randomChoicesInExtent(nodes, scope, block)
+    else:
+      pnodes = self.extentCache.extent(self, scope, block)
+      if do_copy:
+        return OrderedSet(list(pnodes))
+      else:
+        return pnodes
 
   def randomChoicesInExtent(self, nodes, scope, block):
     # The scope and block, if present, limit the computed dynamic
@@ -419,21 +526,55 @@ class Trace(object):
     node = self.families[id]
     self.unpropagatedObservations[node] = self.unboxValue(val)
 
+  def observe_dataset(self, ids, exp, vals, args=None):
+    """Evaluate and observe one directive per id in a single pass.
+
+If args is None, every directive observes exp itself; otherwise
+directive i observes the application of exp to the quoted args[i].
+The expression is unboxed once for the whole batch, and propagation
+of the observations is left to the next makeConsistent, as for
+observe.
+
+The batch is all or nothing: if any row fails, the rows already
+evaluated are unevaluated again before the error propagates."""
+    pyExp = self.unboxExpression(exp)
+    done = []
+    try:
+      for i, (id, val) in enumerate(zip(ids, vals)):
+        assert id not in self.families
+        if args is None:
+          rowExp = pyExp
+        else:
+          rowExp = [pyExp] + [["quote", VentureValue.fromStackDict(a)]
+                              for a in args[i]]
+        (_, node) = evalFamily(
+          self, addr.directive_address(id), rowExp, self.globalEnv,
+          Scaffold(), False, OmegaDB(), OrderedDict())
+        self.families[id] = node
+        done.append(id)
+        self.unpropagatedObservations[node] = self.unboxValue(val)
+    except Exception:
+      import sys
+      info = sys.exc_info()
+      for id in reversed(done):
+        self.unpropagatedObservations.pop(self.families[id], None)
+        self.uneval(id)
+      raise info[0], info[1], info[2]
+
   def makeConsistent(self):
-    weight = 0
-    for node, val in self.unpropagatedObservations.iteritems():
-      appNode = self.getConstrainableNode(node)
-#      print "PROPAGATE", node, appNode
-      scaffold = constructScaffold(self, [OrderedSet([appNode])])
-      rhoWeight, _ = detachAndExtract(self, scaffold)
-      scaffold.lkernels[appNode] = DeterministicLKernel(self.pspAt(appNode), val)
-      xiWeight = regenAndAttach(self, scaffold, False, OmegaDB(), OrderedDict())
-      # If xiWeight is -inf, we are in an impossible state, but that might be ok.
-      # Finish constraining, to avoid downstream invariant violations.
-      node.observe(val)
-      constrain(self, appNode, node.observedValue)
-      weight += xiWeight
-      weight -= rhoWeight
+    observations = self.unpropagatedObservations.items()
+    appNodes = [self.getConstrainableNode(node) for node, _ in observations]
+    scaffold = constructScaffold(self, [OrderedSet(appNodes)])
+    if self._canPropagateJointly(appNodes, scaffold):
+      weight = self._propagateJointly(observations, appNodes, scaffold)
+    else:
+      weight = 0
+      for node, val in observations:
+        # Propagating one observation may replace the brush that
+        # another's constrainable node was in, so find it afresh.
+        appNode = self.getConstrainableNode(node)
+        scaffold = constructScaffold(self, [OrderedSet([appNode])])
+        weight += self._propagateJointly([(node, val)], [appNode], scaffold)
     self.unpropagatedObservations.clear()
     if not math.isnan(weight):
       # Note: +inf weight is possible at spikes in density against
@@ -447,6 +588,37 @@ class Trace(object):
       # the resulting state is impossible.
       return float("-inf")
 
+  def _canPropagateJointly(self, appNodes, scaffold):
+    # Regenerating all the observations in one scaffold gives the same
+    # total weight as propagating them one at a time, in order, unless
+    # some of them interact through something other than absorbing
+    # nodes: one observation downstream of another, or two applying
+    # the same SP whose aux they incorporate into.
+    if len(appNodes) < 2: return True
+    if len(OrderedSet(appNodes)) != len(appNodes): return False
+    makers = set()
+    for appNode in appNodes:
+      if appNode not in scaffold.drg: return False
+      for parent in self.parentsAt(appNode):
+        if parent in scaffold.drg: return False
+      maker = self.spRefAt(appNode).makerNode
+      if maker in makers and type(self.madeSPAuxAt(maker)) is not SPAux:
+        return False
+      makers.add(maker)
+    return True
+
+  def _propagateJointly(self, observations, appNodes, scaffold):
+    rhoWeight, _ = detachAndExtract(self, scaffold)
+    for (_, val), appNode in zip(observations, appNodes):
+      scaffold.lkernels[appNode] = DeterministicLKernel(self.pspAt(appNode), val)
+    xiWeight = regenAndAttach(self, scaffold, False, OmegaDB(), OrderedDict())
+    # If xiWeight is -inf, we are in an impossible state, but that might be ok.
+    # Finish constraining, to avoid downstream invariant violations.
+    for (node, val), appNode in zip(observations, appNodes):
+      node.observe(val)
+      constrain(self, appNode, node.observedValue)
+    return xiWeight - rhoWeight
+
   # use instead of makeConsistent when restoring a trace
   def registerConstraints(self):
     for node, val in self.unpropagatedObservations.iteritems():
@@ -705,7 +877,10 @@ the scaffold determined by the given expression."""
     self.np_rng = npr.RandomState(rng.randint(1, 2**31 - 1))
     self.py_rng = random.Random(rng.randint(1, 2**31 - 1))
 
-  def short_circuit_copyable(self): return False
+  def stop_and_copy(self):
+    return stop_and_copy(self)
+
+  def short_circuit_copyable(self): return True
 
   #### Helpers (shouldn't be class methods)
 
@@ -723,7 +898,7 @@ the scaffold determined by the given expression."""
 
   def addNewChildren(self, node, newChildren):
     for child in newChildren:
-      node.children.add(child)
+      self.addChildAt(node, child)
 
   #### Configuration
 
@@ -732,3 +907,12 @@ the scaffold determined by the given expression."""
 
   def clear_profiling(self):
     self.stats = []
+    if self.phase_stats is not None:
+      self.phase_stats = PhaseProfile()
+      if self.phase_profile is not None:
+        self.phase_profile = self.phase_stats
+
+  def set_phase_profiling(self, enabled=True):
+    if self.phase_stats is None:
+      self.phase_stats = PhaseProfile()
+    self.phase_profile = self.phase_stats if enabled else None
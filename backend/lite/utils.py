@@ -179,6 +179,54 @@ def sampleLogCategorical(logs, np_rng, os=None):
     # impossible.
     return simulateCategorical([0 for _ in logs], np_rng, os=os)
 
+def logWeightsToNormalizedArray(logs):
+  """Vectorized logWeightsToNormalizedDirect, returning a numpy array.
+
+  If all the logs are -inf, treat all options as equally impossible,
+  as sampleLogCategorical does."""
+  logs = np.asarray(logs, dtype=float)
+  the_max = np.max(logs)
+  if the_max > float("-inf"):
+    ps = np.exp(logs - the_max)
+    return ps / np.sum(ps)
+  else:
+    return np.ones(len(logs)) / len(logs)
+
+def effectiveSampleSize(logs):
+  "The effective sample size of a set of particles with the given log weights."
+  ps = logWeightsToNormalizedArray(logs)
+  return 1.0 / np.sum(ps * ps)
+
+def _searchCumulative(ps, us):
+  cdf = np.cumsum(ps)
+  cdf[-1] = 1.0 # Guard against roundoff leaving the last bucket short
+  return np.searchsorted(cdf, us, side='right')
+
+def resampleLogWeights(logs, n, np_rng, scheme='multinomial'):
+  """Choose n ancestor indexes for particles with the given log weights.
+
+  The scheme is one of 'multinomial', 'stratified', 'systematic' or
+  'residual'.  Each takes one O(len(logs) + n) pass.  The indexes are
+  returned in sorted order."""
+  ps = logWeightsToNormalizedArray(logs)
+  if scheme == 'multinomial':
+    counts = np_rng.multinomial(n, ps)
+  elif scheme == 'stratified':
+    us = (np.arange(n) + np_rng.uniform(size=n)) / n
+    return _searchCumulative(ps, us).tolist()
+  elif scheme == 'systematic':
+    us = (np.arange(n) + np_rng.uniform()) / n
+    return _searchCumulative(ps, us).tolist()
+  elif scheme == 'residual':
+    expected = n * ps
+    counts = np.floor(expected).astype(int)
+    rest = n - np.sum(counts)
+    if rest > 0:
+      counts += np_rng.multinomial(rest, normalizeList(expected - counts))
+  else:
+    raise ValueError("Unknown resampling scheme %r" % (scheme,))
+  return np.repeat(np.arange(len(ps)), counts).tolist()
+
 def logDensityLogCategorical(val,log_ps,os=None):
   if os is None: os = range(len(log_ps))
   return logsumexp([log_pi for (log_pi, oi) in zip(log_ps, os) if oi == val]) - logsumexp(log_ps)
@@ -25,6 +25,7 @@
 #include "pmap.hpp"
 #include "pset.hpp"
 #include "rng.h"
+#include "profiler.h"
 
 using persistent::PMap;
 using persistent::PSet;
@@ -213,6 +214,9 @@ struct ConcreteTrace : Trace
   set<boost::shared_ptr<Node> > builtInNodes;
   set<boost::shared_ptr<Node> > boundForeignSPNodes;
 
+  // Proposals recorded by mixMH; null unless profiling is enabled
+  boost::shared_ptr<ProposalLog> proposalLog;
+
   private:
   set<Node*> allNodes();
 };
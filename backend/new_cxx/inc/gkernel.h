@@ -34,6 +34,10 @@ struct GKernel
   virtual int accept() =0;
   virtual int reject() =0;
 
+  /* For the profiler: a string literal naming the operator, matching
+     the name of its Lite counterpart. */
+  virtual const char * name() const =0;
+
   virtual ~GKernel() {}
 };
 
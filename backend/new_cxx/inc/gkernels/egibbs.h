@@ -34,6 +34,7 @@ struct EnumerativeGibbsGKernel : GKernel
       const boost::shared_ptr<Scaffold> & scaffold);
   int accept();
   int reject();
+  const char * name() const { return "enumerative gibbs"; }
 
   ConcreteTrace * trace;
   boost::shared_ptr<Scaffold> scaffold;
@@ -61,6 +62,6 @@ struct EnumerativeMAPGKernel : EnumerativeGibbsGKernel
     const vector<boost::shared_ptr<Particle> >& particles,
     const vector<double>& particleWeights,
     ConcreteTrace* trace) const;
-
+  const char * name() const { return "enumerative max a-posteriori"; }
 };
 #endif
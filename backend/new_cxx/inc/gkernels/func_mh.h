@@ -33,6 +33,7 @@ struct FuncMHGKernel : GKernel
   propose(ConcreteTrace * trace, const boost::shared_ptr<Scaffold> & scaffold);
   int accept();
   int reject();
+  const char * name() const { return "resimulation MH"; }
 
   ConcreteTrace * trace;
   boost::shared_ptr<Scaffold> scaffold;
@@ -32,6 +32,7 @@ struct HMCGKernel : GKernel
   propose(ConcreteTrace * trace, const boost::shared_ptr<Scaffold> & scaffold);
   int accept();
   int reject();
+  const char * name() const { return "hamiltonian monte carlo"; }
 
   ConcreteTrace * trace;
   boost::shared_ptr<Scaffold> scaffold;
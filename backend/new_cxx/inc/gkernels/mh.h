@@ -32,6 +32,7 @@ struct MHGKernel : GKernel
   propose(ConcreteTrace * trace, const boost::shared_ptr<Scaffold> & scaffold);
   int accept();
   int reject();
+  const char * name() const { return "resimulation MH"; }
 
   ConcreteTrace * trace;
   boost::shared_ptr<Scaffold> scaffold;
@@ -35,6 +35,7 @@ struct PGibbsGKernel : GKernel
   propose(ConcreteTrace * trace, const boost::shared_ptr<Scaffold> & scaffold);
   int accept();
   int reject();
+  const char * name() const { return "particle gibbs"; }
 
   ConcreteTrace * trace;
   boost::shared_ptr<Scaffold> scaffold;
@@ -31,6 +31,7 @@ struct BogoPossibilizeGKernel : GKernel
   propose(ConcreteTrace * trace, const boost::shared_ptr<Scaffold> & scaffold);
   int accept();
   int reject();
+  const char * name() const { return "bogo_possibilize"; }
 
   ConcreteTrace * trace;
   boost::shared_ptr<Scaffold> scaffold;
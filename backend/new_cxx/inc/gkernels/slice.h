@@ -54,6 +54,7 @@ struct SliceGKernel : GKernel
   propose(ConcreteTrace * trace, const boost::shared_ptr<Scaffold> & scaffold);
   int accept();
   int reject();
+  const char * name() const { return "slice sampling with stepping out"; }
 
   ConcreteTrace * trace;
   boost::shared_ptr<Scaffold> scaffold;
@@ -0,0 +1,76 @@
+// Copyright (c) 2016 MIT Probabilistic Computing Project.
+//
+// This file is part of Venture.
+//
+// Venture is free software: you can redistribute it and/or modify
+// it under the terms of the GNU General Public License as published by
+// the Free Software Foundation, either version 3 of the License, or
+// (at your option) any later version.
+//
+// Venture is distributed in the hope that it will be useful,
+// but WITHOUT ANY WARRANTY; without even the implied warranty of
+// MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+// GNU General Public License for more details.
+//
+// You should have received a copy of the GNU General Public License
+// along with Venture.  If not, see <http://www.gnu.org/licenses/>.
+
+#ifndef PROFILER_H
+#define PROFILER_H
+
+#include "types.h"
+
+/* One transition of mixMH, as recorded for the profiler.  The Puma
+   counterpart of the keyword arguments of Lite's
+   Trace.recordProposal, except that the principal, absorbing, AAA and
+   brush node sets are reduced to their sizes. */
+struct ProposalRecord
+{
+  ProposalRecord():
+    operatorName(NULL), time(0), numPrincipal(0), numAbsorbing(0),
+    numAAA(0), numBrush(0), alpha(0), accepted(false) {}
+
+  const char * operatorName; // Static; see GKernel::name
+  ScopeID scope;
+  BlockID block;
+  double time; // seconds
+  size_t numPrincipal;
+  size_t numAbsorbing;
+  size_t numAAA;
+  size_t numBrush;
+  double alpha;
+  bool accepted;
+};
+
+/* A ring buffer of the most recent proposals.  All the storage is
+   allocated up front, so recording a proposal costs a few stores;
+   once the buffer is full, each new record overwrites the oldest and
+   counts it as dropped. */
+struct ProposalLog
+{
+  explicit ProposalLog(size_t capacity);
+
+  /* Whether mixMH should record into this log.  Disabling profiling
+     keeps the records already taken, as it does in Lite. */
+  bool enabled;
+
+  /* The slot for the next record, to be filled in by the caller. */
+  ProposalRecord & next();
+
+  size_t size() const { return count; }
+  /* The i-th record still held, oldest first. */
+  const ProposalRecord & at(size_t i) const;
+  void clear();
+
+  size_t dropped;
+
+private:
+  vector<ProposalRecord> records;
+  size_t start;
+  size_t count;
+};
+
+/* Seconds on a monotonic clock, for timing proposals. */
+double profilerClock();
+
+#endif
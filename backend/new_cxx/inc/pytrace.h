@@ -79,6 +79,10 @@ struct PyTrace
 
   double primitive_infer(const boost::python::dict & params);
 
+  void setProfiling(bool enabled);
+  void clearProfiling();
+  boost::python::dict profileData();
+
   void freeze(DirectiveID did);
 
   PyTrace* stop_and_copy() const;
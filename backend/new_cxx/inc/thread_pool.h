@@ -0,0 +1,97 @@
+// Copyright (c) 2016 MIT Probabilistic Computing Project.
+//
+// This file is part of Venture.
+//
+// Venture is free software: you can redistribute it and/or modify
+// it under the terms of the GNU General Public License as published by
+// the Free Software Foundation, either version 3 of the License, or
+// (at your option) any later version.
+//
+// Venture is distributed in the hope that it will be useful,
+// but WITHOUT ANY WARRANTY; without even the implied warranty of
+// MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+// GNU General Public License for more details.
+//
+// You should have received a copy of the GNU General Public License
+// along with Venture.  If not, see <http://www.gnu.org/licenses/>.
+
+#ifndef THREAD_POOL_H
+#define THREAD_POOL_H
+
+#include <deque>
+#include <vector>
+
+#include <boost/exception_ptr.hpp>
+#include <boost/function.hpp>
+#include <boost/thread.hpp>
+
+using std::deque;
+using std::vector;
+
+struct TaskGroup;
+
+/* A fixed set of worker threads that run tasks submitted in batches.
+   Parallel gkernels share one process-wide pool (see
+   ThreadPool::global()) instead of spawning a thread per particle. */
+struct ThreadPool
+{
+  explicit ThreadPool(size_t numThreads);
+  ~ThreadPool();
+
+  /* The pool shared by the whole process, sized to the number of
+     cores.  A forked child process gets a fresh pool, since the
+     parent's workers do not survive the fork. */
+  static ThreadPool & global();
+
+  size_t size() const { return threads.size(); }
+
+private:
+  friend struct TaskGroup;
+
+  struct Task
+  {
+    Task(const boost::function<void()> & f, TaskGroup * group):
+      f(f), group(group) {}
+    boost::function<void()> f;
+    TaskGroup * group;
+  };
+
+  void submit(const vector<boost::function<void()> > & fs, TaskGroup * group);
+  /* Runs one queued task in the calling thread, if there is one. */
+  bool runPending();
+  void workerLoop();
+  static void runTask(const Task & task);
+
+  boost::mutex mutex;
+  boost::condition_variable taskAvailable;
+  deque<Task> queue;
+  bool stopping;
+  vector<boost::thread*> threads;
+};
+
+/* A batch of tasks run on a ThreadPool.  wait() returns once every
+   task in the group has finished, rethrowing the first exception any
+   of them raised.  The waiting thread helps drain the queue, so a
+   group makes progress even if all the workers are busy. */
+struct TaskGroup
+{
+  explicit TaskGroup(ThreadPool & pool): pool(pool), outstanding(0) {}
+  ~TaskGroup() { drain(); }
+
+  void run(const vector<boost::function<void()> > & fs);
+  void wait();
+
+private:
+  friend struct ThreadPool;
+
+  void drain();
+  void finished(const boost::exception_ptr & error);
+
+  ThreadPool & pool;
+  boost::mutex mutex;
+  boost::condition_variable done;
+  size_t outstanding;
+  boost::exception_ptr error;
+};
+
+#endif
@@ -26,9 +26,10 @@
 #include "args.h"
 #include "lkernel.h"
 #include "gkernel.h"
+#include "thread_pool.h"
 #include <math.h>
+#include <boost/bind.hpp>
 #include <boost/foreach.hpp>
-#include <boost/thread.hpp>
 
 struct EGibbsWorker
 {
@@ -103,20 +104,20 @@ pair<Trace*, double> EnumerativeGibbsGKernel::propose(ConcreteTrace * trace,
   vector<double> particleWeights(numValues);
   vector<boost::shared_ptr<EGibbsWorker> > workers(numValues);
   if (inParallel) {
-    vector<boost::thread*> threads(numValues);
+    vector<boost::function<void()> > tasks(numValues);
     for (size_t p = 0; p < numValues; ++p) {
       workers[p] = boost::shared_ptr<EGibbsWorker>(new EGibbsWorker(trace));
-      boost::function<void()> th_func =
+      tasks[p] =
         boost::bind(&EGibbsWorker::doEGibbs, workers[p], scaffold,
                     applicationNodes, valueTuples[p], currentValues,
                     weightAndRhoDB.second);
-      threads[p] = new boost::thread(th_func);
     }
+    TaskGroup group(ThreadPool::global());
+    group.run(tasks);
+    group.wait();
     for (size_t p = 0; p < numValues; ++p) {
-      threads[p]->join();
       particles[p] = workers[p]->particle;
       particleWeights[p] = workers[p]->weight;
-      delete threads[p];
     }
   } else {
     for (size_t p = 0; p < numValues; ++p) {
@@ -25,8 +25,9 @@
 #include "db.h"
 #include "concrete_trace.h"
 #include "rng.h"
+#include "thread_pool.h"
 
-#include <boost/thread.hpp>
+#include <boost/bind.hpp>
 
 struct PGibbsWorker
 {
@@ -87,20 +88,19 @@ pair<Trace*, double> PGibbsGKernel::propose(
   vector<boost::shared_ptr<Particle> > particles(numNewParticles + 1);
   vector<boost::shared_ptr<PGibbsWorker> > workers(numNewParticles);
   if (inParallel) {
-    vector<boost::thread*> threads(numNewParticles);
+    vector<boost::function<void()> > tasks(numNewParticles);
     for (size_t p = 0; p < numNewParticles; ++p) {
       workers[p] = boost::shared_ptr<PGibbsWorker>(new PGibbsWorker(scaffold));
       const unsigned long seed = gsl_rng_get(trace->getRNG());
-      boost::function<void()> th_func =
+      tasks[p] =
         boost::bind(&PGibbsWorker::doPGibbsInitial, workers[p], trace, seed);
-      threads[p] = new boost::thread(th_func);
     }
+    TaskGroup group(ThreadPool::global());
+    group.run(tasks);
+    group.wait();
     for (size_t p = 0; p < numNewParticles; ++p) {
-      threads[p]->join();
       particles[p] = workers[p]->particle;
       particleWeights[p] = workers[p]->weight;
-
-      delete threads[p];
     }
   } else {
     for (size_t p = 0; p < numNewParticles; ++p) {
@@ -127,14 +127,15 @@ pair<Trace*, double> PGibbsGKernel::propose(
     vector<double> sums = computePartialSums(mapExpUptoMultConstant(particleWeights));
 
     if (inParallel) {
-      vector<boost::thread*> threads(numNewParticles);
+      vector<boost::function<void()> > tasks(numNewParticles);
       for (size_t p = 0; p < numNewParticles; ++p) {
         workers[p] = boost::shared_ptr<PGibbsWorker>(new PGibbsWorker(scaffold));
-        boost::function<void()> th_func = boost::bind(
-          &PGibbsWorker::doPGibbsPropagate, workers[p], particles, sums,
-          gsl_rng_get(trace->getRNG()), borderGroup);
-        threads[p] = new boost::thread(th_func);
+        tasks[p] = boost::bind(
+          &PGibbsWorker::doPGibbsPropagate, workers[p], boost::ref(particles),
+          boost::cref(sums), gsl_rng_get(trace->getRNG()), borderGroup);
       }
+      TaskGroup group(ThreadPool::global());
+      group.run(tasks);
 
       newParticles[numNewParticles] = boost::shared_ptr<Particle>(
         new Particle(particles[numNewParticles],
@@ -144,11 +145,10 @@ pair<Trace*, double> PGibbsGKernel::propose(
                        scaffold->border[borderGroup], scaffold, true,
                        rhoDBs[borderGroup], nullGradients);
 
+      group.wait();
       for (size_t p = 0; p < numNewParticles; ++p) {
-        threads[p]->join();
         newParticles[p] = workers[p]->particle;
         newParticleWeights[p] = workers[p]->weight;
-        delete threads[p];
       }
     } else {
       for (size_t p = 0; p < numNewParticles; ++p) {
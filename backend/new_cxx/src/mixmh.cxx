@@ -20,6 +20,7 @@
 #include "indexer.h"
 #include "gkernel.h"
 #include "mixmh.h"
+#include "profiler.h"
 #include <gsl/gsl_rng.h>
 #include <gsl/gsl_randist.h>
 #include <cmath>
@@ -34,8 +35,23 @@ int mixMH(
     const boost::shared_ptr<ScaffoldIndexer> & indexer,
     const boost::shared_ptr<GKernel> & gKernel)
 {
+  ProposalLog * proposals = trace->proposalLog.get();
+  if (proposals && !proposals->enabled) { proposals = NULL; }
+  double start = proposals ? profilerClock() : 0.0;
+
   boost::shared_ptr<Scaffold> index = indexer->sampleIndex(trace);
 
+  // Take the sizes before proposing, as Lite does, since the kernel
+  // may alter the scaffold.
+  size_t numPrincipal = 0, numAbsorbing = 0, numAAA = 0, numBrush = 0;
+  if (proposals) {
+    for (size_t i = 0; i < index->setsOfPNodes.size(); ++i) {
+      numPrincipal += index->setsOfPNodes[i].size();
+    }
+    numAbsorbing = index->absorbing.size();
+    numAAA = index->aaa.size();
+    numBrush = index->brush.size();
+  }
 
   double rhoMix = indexer->logDensityOfIndex(trace, index);
 
@@ -49,12 +65,28 @@ int mixMH(
   //      << " + proposal alpha " << p.second
   //      << " - rhoMix " << rhoMix
   //      << "; logU " << logU << endl;
-  if (logU < alpha) {
+  bool accepted = logU < alpha;
+  int ans;
+  if (accepted) {
     // cout << ".";
-    return gKernel->accept();
+    ans = gKernel->accept();
   } else {
     // cout << "!";
-    return gKernel->reject();
+    ans = gKernel->reject();
   }
 
+  if (proposals) {
+    ProposalRecord & record = proposals->next();
+    record.operatorName = gKernel->name();
+    record.scope = indexer->scope;
+    record.block = indexer->block;
+    record.numPrincipal = numPrincipal;
+    record.numAbsorbing = numAbsorbing;
+    record.numAAA = numAAA;
+    record.numBrush = numBrush;
+    record.alpha = alpha;
+    record.accepted = accepted;
+    record.time = profilerClock() - start;
+  }
+  return ans;
 }
@@ -0,0 +1,59 @@
+// Copyright (c) 2016 MIT Probabilistic Computing Project.
+//
+// This file is part of Venture.
+//
+// Venture is free software: you can redistribute it and/or modify
+// it under the terms of the GNU General Public License as published by
+// the Free Software Foundation, either version 3 of the License, or
+// (at your option) any later version.
+//
+// Venture is distributed in the hope that it will be useful,
+// but WITHOUT ANY WARRANTY; without even the implied warranty of
+// MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+// GNU General Public License for more details.
+//
+// You should have received a copy of the GNU General Public License
+// along with Venture.  If not, see <http://www.gnu.org/licenses/>.
+
+#include "profiler.h"
+
+#include <cassert>
+#include <time.h>
+
+ProposalLog::ProposalLog(size_t capacity):
+  enabled(true), dropped(0), records(capacity), start(0), count(0)
+{
+  assert(capacity > 0);
+}
+
+ProposalRecord & ProposalLog::next()
+{
+  size_t capacity = records.size();
+  if (count < capacity) {
+    return records[(start + count++) % capacity];
+  }
+  ProposalRecord & oldest = records[start];
+  start = (start + 1) % capacity;
+  ++dropped;
+  return oldest;
+}
+
+const ProposalRecord & ProposalLog::at(size_t i) const
+{
+  assert(i < count);
+  return records[(start + i) % records.size()];
+}
+
+void ProposalLog::clear()
+{
+  start = 0;
+  count = 0;
+  dropped = 0;
+}
+
+double profilerClock()
+{
+  struct timespec now;
+  clock_gettime(CLOCK_MONOTONIC, &now);
+  return now.tv_sec + 1e-9 * now.tv_nsec;
+}
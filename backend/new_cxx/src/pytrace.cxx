@@ -233,6 +233,63 @@ double PyTrace::primitive_infer(const boost::python::dict & params)
   return inferer.infer();
 }
 
+// Enough for the last several thousand transitions, at about 100
+// bytes each.
+const size_t PROFILE_CAPACITY = 1 << 14;
+
+void PyTrace::setProfiling(bool enabled)
+{
+  if (enabled && !trace->proposalLog) {
+    trace->proposalLog = boost::shared_ptr<ProposalLog>(
+      new ProposalLog(PROFILE_CAPACITY));
+  } else if (trace->proposalLog) {
+    trace->proposalLog->enabled = enabled;
+  }
+}
+
+void PyTrace::clearProfiling()
+{
+  if (trace->proposalLog) { trace->proposalLog->clear(); }
+}
+
+// The records by column, so that Python receives them in one call.
+boost::python::dict PyTrace::profileData()
+{
+  boost::python::list operators, scopes, blocks, times, principal,
+    absorbing, aaa, brush, alphas, accepted;
+  size_t dropped = 0;
+  if (trace->proposalLog) {
+    const ProposalLog & log = *trace->proposalLog;
+    for (size_t i = 0; i < log.size(); ++i) {
+      const ProposalRecord & record = log.at(i);
+      operators.append(record.operatorName);
+      scopes.append(record.scope->toPython(trace.get())["value"]);
+      blocks.append(record.block->toPython(trace.get())["value"]);
+      times.append(record.time);
+      principal.append(record.numPrincipal);
+      absorbing.append(record.numAbsorbing);
+      aaa.append(record.numAAA);
+      brush.append(record.numBrush);
+      alphas.append(record.alpha);
+      accepted.append(record.accepted);
+    }
+    dropped = log.dropped;
+  }
+  boost::python::dict data;
+  data["operator"] = operators;
+  data["scope"] = scopes;
+  data["block"] = blocks;
+  data["time"] = times;
+  data["principal"] = principal;
+  data["absorbing"] = absorbing;
+  data["aaa"] = aaa;
+  data["brush"] = brush;
+  data["alpha"] = alphas;
+  data["accepted"] = accepted;
+  data["dropped"] = dropped;
+  return data;
+}
+
 void translateStringException(const string& err) {
   PyErr_SetString(PyExc_RuntimeError, err.c_str());
 }
@@ -349,6 +406,9 @@ BOOST_PYTHON_MODULE(libpumatrace)
     .def("observe", &PyTrace::observe)
     .def("unobserve", &PyTrace::unobserve)
     .def("primitive_infer", &PyTrace::primitive_infer)
+    .def("set_profiling", &PyTrace::setProfiling)
+    .def("clear_profiling", &PyTrace::clearProfiling)
+    .def("profile_data", &PyTrace::profileData)
     .def("makeConsistent", &PyTrace::makeConsistent)
     .def("registerConstraints", &PyTrace::registerConstraints)
     .def("log_likelihood_at", &PyTrace::logLikelihoodAt)
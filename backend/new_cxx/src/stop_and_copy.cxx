@@ -304,6 +304,12 @@ boost::shared_ptr<ConcreteTrace> ConcreteTrace::copy_help(ForwardingMap* forward
   answer->observedValues = copy_map_kv(this->observedValues, forward);
   answer->builtInNodes = copy_set_shared(this->builtInNodes, forward);
   answer->boundForeignSPNodes = copy_set_shared(this->boundForeignSPNodes, forward);
+  if (this->proposalLog) {
+    // The records refer to no nodes, only to (immutable) scope and
+    // block values, which the copies may share.
+    answer->proposalLog = boost::shared_ptr<ProposalLog>(
+      new ProposalLog(*this->proposalLog));
+  }
   answer->seekInconsistencies();
   return answer;
 }
@@ -0,0 +1,150 @@
+// Copyright (c) 2016 MIT Probabilistic Computing Project.
+//
+// This file is part of Venture.
+//
+// Venture is free software: you can redistribute it and/or modify
+// it under the terms of the GNU General Public License as published by
+// the Free Software Foundation, either version 3 of the License, or
+// (at your option) any later version.
+//
+// Venture is distributed in the hope that it will be useful,
+// but WITHOUT ANY WARRANTY; without even the implied warranty of
+// MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+// GNU General Public License for more details.
+//
+// You should have received a copy of the GNU General Public License
+// along with Venture.  If not, see <http://www.gnu.org/licenses/>.
+
+#include "thread_pool.h"
+
+#include <unistd.h>
+
+#include <boost/bind.hpp>
+
+ThreadPool::ThreadPool(size_t numThreads): stopping(false)
+{
+  for (size_t i = 0; i < numThreads; ++i) {
+    threads.push_back(
+      new boost::thread(boost::bind(&ThreadPool::workerLoop, this)));
+  }
+}
+
+ThreadPool::~ThreadPool()
+{
+  {
+    boost::lock_guard<boost::mutex> lock(mutex);
+    stopping = true;
+  }
+  taskAvailable.notify_all();
+  for (size_t i = 0; i < threads.size(); ++i) {
+    threads[i]->join();
+    delete threads[i];
+  }
+}
+
+ThreadPool & ThreadPool::global()
+{
+  static boost::mutex globalMutex;
+  static ThreadPool * pool = NULL;
+  static pid_t owner = 0;
+
+  boost::lock_guard<boost::mutex> lock(globalMutex);
+  if (pool == NULL || owner != getpid()) {
+    // The pool of a parent process is deliberately leaked: its
+    // threads do not exist in this process, so it cannot be joined.
+    size_t numThreads = boost::thread::hardware_concurrency();
+    if (numThreads == 0) { numThreads = 1; }
+    pool = new ThreadPool(numThreads);
+    owner = getpid();
+  }
+  return *pool;
+}
+
+void ThreadPool::submit(const vector<boost::function<void()> > & fs,
+                        TaskGroup * group)
+{
+  {
+    boost::lock_guard<boost::mutex> lock(mutex);
+    for (size_t i = 0; i < fs.size(); ++i) {
+      queue.push_back(Task(fs[i], group));
+    }
+  }
+  taskAvailable.notify_all();
+}
+
+bool ThreadPool::runPending()
+{
+  boost::unique_lock<boost::mutex> lock(mutex);
+  if (queue.empty()) { return false; }
+  Task task = queue.front();
+  queue.pop_front();
+  lock.unlock();
+  runTask(task);
+  return true;
+}
+
+void ThreadPool::workerLoop()
+{
+  while (true) {
+    boost::unique_lock<boost::mutex> lock(mutex);
+    while (queue.empty() && !stopping) { taskAvailable.wait(lock); }
+    if (queue.empty()) { return; }
+    Task task = queue.front();
+    queue.pop_front();
+    lock.unlock();
+    runTask(task);
+  }
+}
+
+void ThreadPool::runTask(const Task & task)
+{
+  boost::exception_ptr error;
+  try {
+    task.f();
+  } catch (...) {
+    error = boost::current_exception();
+  }
+  task.group->finished(error);
+}
+
+void TaskGroup::run(const vector<boost::function<void()> > & fs)
+{
+  {
+    boost::lock_guard<boost::mutex> lock(mutex);
+    outstanding += fs.size();
+  }
+  pool.submit(fs, this);
+}
+
+void TaskGroup::finished(const boost::exception_ptr & taskError)
+{
+  boost::lock_guard<boost::mutex> lock(mutex);
+  if (taskError && !error) { error = taskError; }
+  if (--outstanding == 0) { done.notify_all(); }
+}
+
+void TaskGroup::drain()
+{
+  while (true) {
+    {
+      boost::lock_guard<boost::mutex> lock(mutex);
+      if (outstanding == 0) { return; }
+    }
+    if (!pool.runPending()) { break; }
+  }
+  // Everything left is already running on a worker.
+  boost::unique_lock<boost::mutex> lock(mutex);
+  while (outstanding > 0) { done.wait(lock); }
+}
+
+void TaskGroup::wait()
+{
+  drain();
+  boost::exception_ptr e;
+  {
+    boost::lock_guard<boost::mutex> lock(mutex);
+    e = error;
+    error = boost::exception_ptr();
+  }
+  if (e) { boost::rethrow_exception(e); }
+}
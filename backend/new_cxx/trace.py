@@ -15,6 +15,7 @@
 # You should have received a copy of the GNU General Public License
 # along with Venture.  If not, see <http://www.gnu.org/licenses/>.
 import random
+import warnings
 import numpy.random as npr
 
 import libpumatrace as puma
@@ -130,10 +131,39 @@ class Trace(object):
   def numBlocksInScope(self, scope):
     return self.trace.numBlocksInScope(_coerce_to_stack_dict(scope))
 
-  def set_profiling(self, _enabled):
-    pass # Puma can't be internally profiled (currently)
+  def set_profiling(self, enabled=True):
+    self.trace.set_profiling(enabled)
 
-  def clear_profiling(self): pass
+  def clear_profiling(self):
+    self.trace.clear_profiling()
+
+  def set_phase_profiling(self, _enabled):
+    pass # Phase profiling is only implemented for Lite
+
+  @property
+  def stats(self):
+    # Puma keeps only the most recent proposals, and records the sizes
+    # of the principal, absorbing, AAA and brush node sets rather than
+    # their addresses.
+    data = self.trace.profile_data()
+    if data['dropped'] > 0:
+      warnings.warn("Puma profiler dropped the oldest %d proposals" %
+                    data['dropped'])
+    return [dict(operator=operator,
+                 indexer=["scaffold", scope, block],
+                 time=time,
+                 principal=principal,
+                 absorbing=absorbing,
+                 aaa=aaa,
+                 brush=brush,
+                 alpha=alpha,
+                 accepted=accepted)
+            for (operator, scope, block, time, principal, absorbing, aaa,
+                 brush, alpha, accepted)
+            in zip(data['operator'], data['scope'], data['block'],
+                   data['time'], data['principal'], data['absorbing'],
+                   data['aaa'], data['brush'], data['alpha'],
+                   data['accepted'])]
 
 def _unwrapVentureValue(val):
   if isinstance(val, VentureValue):
@@ -0,0 +1,169 @@
+# Copyright (c) 2016 MIT Probabilistic Computing Project.
+#
+# This file is part of Venture.
+#
+# Venture is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Venture is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Venture.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Closure compilation of untraced expressions.
+
+Semantically the same as venture.untraced.evaluator.eval, except for
+the random stream: compile turns an expression into a tree of Python
+closures once, so that evaluating it does not re-dispatch on the
+shape of the expression at every node.  All the applications of one
+evaluation share one pair of PRNGs, rather than each seeding its own.
+
+"""
+
+import numpy.random as npr
+
+from venture.exception import VentureException
+from venture.lite import exp as e
+from venture.lite.exception import VentureNestedRiplMethodError
+from venture.lite.psp import IArgs
+from venture.lite.sp import VentureSPRecord
+from venture.untraced.evaluator import applyPSP
+from venture.untraced.evaluator import nonRepeatableRequestID
+import venture.lite.address as addr
+import venture.untraced.node as node
+
+class EvalContext(object):
+  """The per-evaluation state shared by all applications in it."""
+  def __init__(self, py_rng):
+    self.py_rng = py_rng
+    self._np_rng = None
+
+  def np_rng(self):
+    if self._np_rng is None:
+      self._np_rng = npr.RandomState(self.py_rng.randint(1, 2**31 - 1))
+    return self._np_rng
+
+def evaluate(address, program, env, rng):
+  """Run a compiled expression, drawing randomness from rng."""
+  return program(address, env, EvalContext(rng))
+
+def compile_exp(exp):
+  """Compile an expression into a function of (address, env, context)."""
+  if e.isVariable(exp):
+    return _compile_variable(exp)
+  elif e.isSelfEvaluating(exp):
+    return _compile_constant(node.normalize(exp))
+  elif e.isQuotation(exp):
+    return _compile_constant(node.normalize(e.textOfQuotation(exp)))
+  else:
+    return _compile_application([compile_exp(subexp) for subexp in exp])
+
+# Compiled expressions, keyed by the identity of the source expression.
+# The source is kept alive alongside, so that its id cannot be reused
+# while the entry exists.
+_cache = {}
+_CACHE_LIMIT = 10000
+
+def compiled(exp):
+  """Compile exp, reusing the result if this very object was compiled before."""
+  key = id(exp)
+  entry = _cache.get(key)
+  if entry is not None and entry[0] is exp:
+    return entry[1]
+  ans = compile_exp(exp)
+  if len(_cache) >= _CACHE_LIMIT:
+    _cache.clear()
+  _cache[key] = (exp, ans)
+  return ans
+
+def _compile_constant(value):
+  def constant(_address, _env, _ctx):
+    return value
+  return constant
+
+def _compile_variable(sym):
+  message = "Cannot find symbol '%s'" % sym
+  def lookup(address, env, _ctx):
+    # Inlined VentureEnvironment.findSymbol
+    while env is not None:
+      frame = env.frame
+      if sym in frame:
+        found = frame[sym]
+        if found is None:
+          break
+        return found.value
+      env = env.outerEnv
+    raise VentureException("evaluation", message, address=address)
+  return lookup
+
+def _compile_application(subs):
+  indexed = list(enumerate(subs))
+  def application(address, env, ctx):
+    nodes = []
+    for index, sub in indexed:
+      addr2 = addr.extend(address, index)
+      nodes.append(node.Node(addr2, sub(addr2, env, ctx)))
+    try:
+      return _apply(address, nodes, env, ctx)
+    except VentureNestedRiplMethodError as err:
+      # See the comment in venture.untraced.evaluator.eval
+      import sys
+      info = sys.exc_info()
+      raise VentureException("evaluation", err.message, address=err.addr, cause=err), None, info[2]
+    except VentureException:
+      raise # Avoid rewrapping with the below
+    except Exception as err:
+      import sys
+      info = sys.exc_info()
+      raise VentureException("evaluation", err.message, address=address, cause=err), None, info[2]
+  return application
+
+def _apply(address, nodes, env, ctx):
+  spr = nodes[0].value
+  if not isinstance(spr, VentureSPRecord):
+    raise VentureException("evaluation", "Cannot apply a non-procedure", address=address)
+  args = CompiledArgs(address, nodes[1:], env, ctx)
+  requests = applyPSP(spr.sp.requestPSP, args)
+  assert not requests.lsrs, "The untraced evaluator does not yet support LSRs."
+  if requests.esrs:
+    args.esr_nodes = [_evalRequest(args, spr, r, ctx) for r in requests.esrs]
+  args.requests = requests
+  return applyPSP(spr.sp.outputPSP, args)
+
+def _evalRequest(args, spr, r, ctx):
+  families = spr.spFamilies
+  if families.containsFamily(r.id):
+    return families.getFamily(r.id)
+  else:
+    new_addr = addr.request(args.node.address, r.addr)
+    ans = node.Node(new_addr, compiled(r.exp)(new_addr, r.env, ctx))
+    if not nonRepeatableRequestID(args, r.id):
+      families.registerFamily(r.id, ans)
+    return ans
+
+class CompiledArgs(IArgs):
+  """The evaluation context of one application under the compiled evaluator.
+
+Serves as both the RequestArgs and the OutputArgs of the application,
+and hands out the evaluation's shared PRNGs."""
+  def __init__(self, address, nodes, env, ctx):
+    super(CompiledArgs, self).__init__()
+    self.node = node.Node(address)
+    self.operandNodes = nodes
+    self.env = env
+    self.ctx = ctx
+    self.esr_nodes = []
+    self.requests = None # This field is used by "fix" for getting the environment to modify
+
+  def operandValues(self): return [n.value for n in self.operandNodes]
+  def py_prng(self): return self.ctx.py_rng
+  def np_prng(self): return self.ctx.np_rng()
+
+  def esrNodes(self): return self.esr_nodes
+  def esrValues(self): return [n.value for n in self.esr_nodes]
+  def requestValue(self): return self.requests
@@ -26,20 +26,27 @@ from venture.lite import types as t
 from venture.lite import value as vv
 from venture.lite.exception import VentureError
 from venture.lite.sp import VentureSPRecord
+import venture.untraced.compiler as compiler
 import venture.untraced.evaluator as evaluator
 import venture.untraced.node as node
 
 class Trace(object):
 
-  def __init__(self, seed):
+  def __init__(self, seed, compile_programs=False):
     self.results = {}
+    # If set, evaluate by compiling each expression to closures
+    # (see venture.untraced.compiler) instead of interpreting it.
+    self.compile_programs = compile_programs
+    self.compiled_programs = {}
     self.env = env.VentureEnvironment()
     for name, val in builtin.builtInValues().iteritems():
       self.bindPrimitiveName(name, val)
     for name, sp in builtin.builtInSPs().iteritems():
       self.bindPrimitiveSP(name, sp)
     self.sealEnvironment() # New frame so users can shadow globals
+    self.set_seed(seed)
 
+  def set_seed(self, seed):
     assert seed is not None
     rng = random.Random(seed)
     self.np_rng = npr.RandomState(rng.randint(1, 2**31 - 1))
@@ -56,12 +63,29 @@ class Trace(object):
 
   def eval(self, id, exp):
     assert id not in self.results
-    py_exp = t.ExpressionType().asPython(vv.VentureValue.fromStackDict(exp))
     rng = self.py_rng
-    val = evaluator.eval(addr.directive_address(id), py_exp, self.env, rng)
+    if self.compile_programs:
+      val = compiler.evaluate(addr.directive_address(id),
+                              self._compiled_program(exp), self.env, rng)
+    else:
+      py_exp = t.ExpressionType().asPython(vv.VentureValue.fromStackDict(exp))
+      val = evaluator.eval(addr.directive_address(id), py_exp, self.env, rng)
     assert isinstance(val, vv.VentureValue)
     self.results[id] = val
 
+  def _compiled_program(self, exp):
+    # Keyed by the identity of the stack dict, which is kept alive in
+    # the entry so that its id is not reused.
+    entry = self.compiled_programs.get(id(exp))
+    if entry is not None and entry[0] is exp:
+      return entry[1]
+    py_exp = t.ExpressionType().asPython(vv.VentureValue.fromStackDict(exp))
+    ans = compiler.compile_exp(py_exp)
+    if len(self.compiled_programs) >= 100:
+      self.compiled_programs.clear()
+    self.compiled_programs[id(exp)] = (exp, ans)
+    return ans
+
   def uneval(self, id):
     # Not much to do here
     assert id in self.results
@@ -0,0 +1,68 @@
+# Copyright (c) 2016 MIT Probabilistic Computing Project.
+#
+# This file is part of Venture.
+#
+# Venture is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Venture is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Venture.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Compare the cost of copying a Lite trace by stop-and-copy against
+copying it by dump and restore.
+
+Usage: ../pythenv.sh python lite_copy_trace.py [num_directives ...]
+"""
+
+import sys
+import time
+
+import venture.shortcuts as s
+
+def make_ripl(num_directives):
+  ripl = s.make_lite_church_prime_ripl()
+  ripl.assume('mu', '(normal 0 10)')
+  ripl.assume('sigma', '(gamma 1 1)')
+  ripl.assume('f', '(mem (lambda (i) (normal mu sigma)))')
+  for i in range(num_directives):
+    ripl.observe('(normal (f %d) 1)' % i, float(i % 7))
+  ripl.infer('(incorporate)')
+  return ripl
+
+def time_copies(model, trace, copy, reps):
+  start = time.time()
+  for _ in range(reps):
+    copy(trace)
+  return (time.time() - start) / reps
+
+def dump_and_restore(model):
+  def copy(trace):
+    values = trace.dump(skipStackDictConversion=True)
+    return model.restore_trace(values, skipStackDictConversion=True)
+  return copy
+
+def main(sizes):
+  print "%12s %16s %16s %8s" % ("directives", "dump/restore (s)",
+                                "stop&copy (s)", "speedup")
+  for n in sizes:
+    ripl = make_ripl(n)
+    engine = ripl.sivm.core_sivm.engine
+    model = engine.model
+    trace = engine.getDistinguishedTrace()
+    reps = max(1, 2000 // n)
+    slow = time_copies(model, trace, dump_and_restore(model), reps)
+    fast = time_copies(model, trace, lambda t: t.stop_and_copy(), reps)
+    print "%12d %16.4f %16.4f %7.1fx" % (n, slow, fast, slow / fast)
+
+if __name__ == '__main__':
+  if len(sys.argv) > 1:
+    main([int(a) for a in sys.argv[1:]])
+  else:
+    main([10, 100, 1000])
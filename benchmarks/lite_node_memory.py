@@ -0,0 +1,83 @@
+# Copyright (c) 2016 MIT Probabilistic Computing Project.
+#
+# This file is part of Venture.
+#
+# Venture is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Venture is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Venture.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""Measure the memory a Lite trace spends per node, on a model with
+many observations.
+
+Reports the growth of the process's peak resident set while building
+the model, and the bytes held by the nodes' children and ESR parent
+containers alone.  Run each size in a fresh process for the resident
+set figure to be meaningful.
+
+Usage: ../pythenv.sh python lite_node_memory.py [num_observations ...]
+"""
+
+import resource
+import sys
+
+from venture.lite.orderedset import OrderedSet
+from venture.lite.stop_and_copy import _reachable_nodes
+import venture.shortcuts as s
+
+def make_ripl(num_observations):
+  ripl = s.make_lite_church_prime_ripl()
+  ripl.assume('mu', '(normal 0 10)')
+  ripl.assume('obs', '(lambda () (normal mu 1))')
+  ripl.observe_dataset('obs', ([float(i % 7)] for i in xrange(num_observations)))
+  ripl.infer('(incorporate)')
+  return ripl
+
+def container_bytes(val):
+  if val is None:
+    return 0
+  elif isinstance(val, OrderedSet):
+    # OrderedDict in Python 2 keeps a map and a linked list of cells
+    # besides the dict itself.
+    od = val._dict # pylint: disable=protected-access
+    cells = od._OrderedDict__map # pylint: disable=protected-access
+    return sys.getsizeof(val) + sys.getsizeof(val.__dict__) + \
+      sys.getsizeof(od) + sys.getsizeof(cells) + \
+      sum(sys.getsizeof(cell) for cell in cells.itervalues())
+  elif isinstance(val, (list, tuple)):
+    return sys.getsizeof(val)
+  else:
+    return 0 # A lone child is stored inline
+
+def max_rss_kb():
+  return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+def main(sizes):
+  print "%12s %10s %14s %16s" % ("observations", "nodes", "rss/node (B)",
+                                 "edges/node (B)")
+  for n in sizes:
+    before = max_rss_kb()
+    ripl = make_ripl(n)
+    after = max_rss_kb()
+    trace = ripl.sivm.core_sivm.engine.getDistinguishedTrace().trace
+    nodes = _reachable_nodes(trace)
+    edges = sum(container_bytes(node.children) +
+                container_bytes(node.esrParents) for node in nodes)
+    print "%12d %10d %14.1f %16.1f" % (n, len(nodes),
+                                       1024.0 * (after - before) / len(nodes),
+                                       float(edges) / len(nodes))
+
+if __name__ == '__main__':
+  if len(sys.argv) > 1:
+    main([int(a) for a in sys.argv[1:]])
+  else:
+    main([1000, 100000, 1000000])
@@ -0,0 +1,139 @@
+# Copyright (c) 2016 MIT Probabilistic Computing Project.
+#
+# This file is part of Venture.
+#
+# Venture is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Venture is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Venture.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Growable, append-only columns of values, as stored by Datasets.
+
+A column keeps its values in a NumPy array with spare room at the end,
+doubling the array when it fills, so appending is amortized constant
+time per value and reading the values back is a view rather than a
+copy.  Since values are only ever appended, such a view stays valid
+however much the column grows afterwards.
+
+A column of numbers (or booleans) gets a numeric dtype; one that ever
+receives anything else holds Python objects.
+
+A column made with a spill directory keeps a numeric array in a
+memory-mapped file in that directory instead of in memory, so that
+the samples of a long run need not fit in RAM.  Object columns cannot
+be mapped, and stay in memory.
+"""
+
+import os
+import tempfile
+
+import numpy as np
+
+_INITIAL_CAPACITY = 16
+
+_NUMERIC_TYPES = (bool, int, long, float, np.number, np.bool_)
+
+class Column(object):
+  def __init__(self, spill_dir=None):
+    self.spill_dir = spill_dir
+    self._array = None
+    self._size = 0
+    self._path = None # The file backing _array, if it is spilled
+
+  def __len__(self):
+    return self._size
+
+  def __del__(self):
+    self._remove_file()
+
+  def __getstate__(self):
+    # The backing file belongs to this column alone, so a copy made by
+    # pickling carries the values themselves and spills them afresh.
+    return {'spill_dir': self.spill_dir, 'values': np.array(self.values())}
+
+  def __setstate__(self, state):
+    spill_dir = state['spill_dir']
+    if spill_dir is not None and not os.path.isdir(spill_dir):
+      spill_dir = None # Unpickled somewhere the directory does not exist
+    self.__init__(spill_dir)
+    self.extend(state['values'])
+
+  def values(self):
+    """The values appended so far, as a view of the underlying array."""
+    if self._array is None:
+      return np.empty(0)
+    return self._array[:self._size]
+
+  def extend(self, values):
+    """Append the given values, a list or a one-dimensional array."""
+    batch = _as_array(values)
+    n = len(batch)
+    if n == 0:
+      return
+    if self._array is None:
+      dtype = batch.dtype
+      capacity = 0
+    else:
+      dtype = np.promote_types(self._array.dtype, batch.dtype)
+      capacity = len(self._array)
+    if dtype != getattr(self._array, 'dtype', None) or \
+       self._size + n > capacity:
+      self._reallocate(dtype, max(self._size + n, 2 * capacity,
+                                  _INITIAL_CAPACITY))
+    self._array[self._size:self._size + n] = batch
+    self._size += n
+
+  def copy(self):
+    ans = Column(self.spill_dir)
+    ans.extend(self.values())
+    return ans
+
+  def _reallocate(self, dtype, capacity):
+    old = self.values()
+    if self.spill_dir is None or dtype == np.object_:
+      new = np.empty(capacity, dtype=dtype)
+      new[:self._size] = old
+      self._remove_file()
+    elif self._path is not None and dtype == self._array.dtype:
+      # Grow the file in place; what is already in it stays put.
+      self._array.flush()
+      with open(self._path, 'r+b') as f:
+        f.truncate(capacity * dtype.itemsize)
+      new = np.memmap(self._path, dtype=dtype, mode='r+', shape=(capacity,))
+    else:
+      (fd, path) = tempfile.mkstemp(suffix='.dat', dir=self.spill_dir)
+      os.close(fd)
+      new = np.memmap(path, dtype=dtype, mode='w+', shape=(capacity,))
+      new[:self._size] = old
+      self._remove_file()
+      self._path = path
+    self._array = new
+
+  def _remove_file(self):
+    # Views of the mapping outlive the file's name, so this is safe
+    # even if someone still holds one.
+    if self._path is not None:
+      os.remove(self._path)
+      self._path = None
+
+def _as_array(values):
+  if isinstance(values, np.ndarray) and values.ndim == 1:
+    return values
+  if all(isinstance(val, _NUMERIC_TYPES) for val in values):
+    ans = np.array(values)
+    if ans.dtype.kind in 'biuf':
+      return ans
+  # Element by element, so that NumPy does not try to make a
+  # multidimensional array out of values that are lists.
+  ans = np.empty(len(values), dtype=object)
+  for (i, val) in enumerate(values):
+    ans[i] = val
+  return ans
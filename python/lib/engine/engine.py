@@ -25,6 +25,7 @@ import time
 from venture.engine.inference import Infer
 from venture.engine.trace_set import TraceSet
 from venture.exception import VentureException
+import venture.engine.snapshot as snapshot
 import venture.lite.inference_sps as inf
 import venture.untraced.trace_search # So the SPs get registered
 import venture.lite.value as vv
@@ -32,16 +33,19 @@ import venture.value.dicts as v
 
 class Engine(object):
 
-  def __init__(self, backend, seed, persistent_inference_trace=True):
+  def __init__(self, backend, seed, persistent_inference_trace=True,
+               compile_inference=True):
     assert seed is not None
     self._py_rng = random.Random(seed)
+    self.foreign_sps = {}
     self.model = self.new_model(backend)
     self.directiveCounter = 0
     self.inferrer = None
-    self.foreign_sps = {}
     self.inference_sps = dict(inf.inferenceSPsList)
     self.callbacks = {}
     self.persistent_inference_trace = persistent_inference_trace
+    self.compile_inference = compile_inference
+    self._run_forms = {}
     if self.persistent_inference_trace:
       self.infer_trace = self.init_inference_trace()
     self.ripl = None
@@ -119,6 +123,11 @@ class Engine(object):
       weight_increments = self.incorporate()
     return (baseAddr, weight_increments)
 
+  def observe_dataset(self, datum, vals, args=None, labels=None):
+    baseAddrs = [self.nextBaseAddr() for _ in vals]
+    self.model.observe_dataset(baseAddrs, datum, vals, args, labels)
+    return (baseAddrs, self.incorporate())
+
   def forget(self,directiveId):
     weight_increments = self.model.forget(directiveId)
     return weight_increments
@@ -200,8 +209,12 @@ class Engine(object):
   def reinit_inference_problem(self, num_particles=1):
     self.model.reinit_inference_problem(num_particles)
 
-  def resample(self, P, mode = 'sequential', process_cap = None):
-    self.model.resample(P, mode, process_cap)
+  def resample(self, P, mode = 'sequential', process_cap = None,
+               scheme = 'multinomial'):
+    self.model.resample(P, mode, process_cap, scheme)
+
+  def resample_if_needed(self, P, threshold = 0.5, scheme = 'systematic'):
+    return self.model.resample_if_needed(P, threshold, scheme)
 
   def diversify(self, program): self.model.diversify(program)
   def collapse(self, scope, block): self.model.collapse(scope, block)
@@ -277,21 +290,55 @@ class Engine(object):
     finally:
       self.ripl = ripl
 
-  def for_each_particle(self, action):
+  def for_each_particle(self, action, in_workers=False):
+    if in_workers and self.model.can_run_in_workers(action):
+      args = [self._particle_action_args(action)
+              for _ in range(self.num_traces())]
+      results = self.model.for_each_trace_in_workers(_run_particle_action, args)
+      return [self._particle_action_result(res) for res in results]
     with self._particle_swapping(action) as do_action:
       return self.model.for_each_trace_sequential(do_action)
 
-  def on_particle(self, i, action):
+  def on_particle(self, i, action, in_workers=False):
+    if in_workers and self.model.can_run_in_workers(action):
+      res = self.model.on_trace_in_workers(i, _run_particle_action,
+        *self._particle_action_args(action))
+      return self._particle_action_result(res)
     with self._particle_swapping(action) as do_action:
       return self.model.on_trace(i, do_action)
 
+  def _particle_action_args(self, action):
+    return (action, self._py_rng.randint(1, 2**31 - 1), self.directiveCounter)
+
+  def _particle_action_result(self, res):
+    (ans, directiveCounter) = res
+    # Keep directive ids used in the workers from being reused.
+    self.directiveCounter = max(self.directiveCounter, directiveCounter)
+    return ans
+
+  def particle_engine(self):
+    return ParticleEngine(self)
+
   def infer(self, program):
     if self.is_infer_loop_program(program):
       assert len(program) == 2
       self.start_continuous_inference(program[1])
       return (None, None) # The core_sivm expects a 2-tuple
     else:
-      return self.raw_evaluate([v.sym("run"), program])
+      return self.raw_evaluate(self._run_form(program))
+
+  def _run_form(self, program):
+    # Reuse the same (run <program>) form for the same program object,
+    # so that the inference trace's cache of compiled programs, which
+    # is keyed by identity, hits when a program is inferred repeatedly.
+    entry = self._run_forms.get(id(program))
+    if entry is not None and entry[0] is program:
+      return entry[1]
+    form = [v.sym("run"), program]
+    if len(self._run_forms) >= 100:
+      self._run_forms.clear()
+    self._run_forms[id(program)] = (program, form)
+    return form
 
   def is_infer_loop_program(self, program):
     return isinstance(program, list) and isinstance(program[0], dict) and program[0]["value"] == "loop"
@@ -308,7 +355,8 @@ class Engine(object):
 
   def init_inference_trace(self):
     import venture.untraced.trace as trace
-    ans = trace.Trace(self._py_rng.randint(1, 2**31 - 1))
+    ans = trace.Trace(self._py_rng.randint(1, 2**31 - 1),
+                      compile_programs=self.compile_inference)
     for name,sp in self.inferenceSPsList():
       ans.bindPrimitiveSP(name, sp)
     for word in inf.inferenceKeywords:
@@ -337,13 +385,23 @@ class Engine(object):
     inferrer_obj = self.inferrer # Read self.inferrer atomically, just in case.
     if inferrer_obj is not None and not inferrer_obj.crashed:
       # Running CI in Python
-      return {"running":True, "expression":inferrer_obj.program}
+      return inferrer_obj.status(inferrer_obj.program)
     else:
       return {"running":False}
 
-  def start_continuous_inference(self, program):
+  def start_continuous_inference(self, program, snapshots=None):
+    """Start running the given inference program over and over in a
+background thread.
+
+If snapshots is given, the thread also publishes InferenceSnapshots
+between passes, from which reads may be answered without stopping
+it; see SnapshotPublisher for the keys it accepts."""
     self.stop_continuous_inference()
-    self.inferrer = ContinuousInferrer(self, program)
+    if snapshots is not None:
+      publisher = SnapshotPublisher(**snapshots)
+    else:
+      publisher = None
+    self.inferrer = ContinuousInferrer(self, program, publisher)
     self.inferrer.start()
 
   def stop_continuous_inference(self):
@@ -356,10 +414,19 @@ class Engine(object):
     else:
       program = None
     if program is not None:
-      return {"running":True, "expression":program}
+      return inferrer_obj.status(program)
     else:
       return {"running":False}
 
+  def continuous_inference_snapshot(self):
+    """The latest snapshot published by continuous inference, or None
+if there is none within the staleness bound it was started with."""
+    inferrer_obj = self.inferrer # Read self.inferrer atomically, just in case.
+    if inferrer_obj is None or inferrer_obj.crashed or \
+       inferrer_obj.publisher is None:
+      return None
+    return inferrer_obj.publisher.fresh()
+
   def on_continuous_inference_thread(self):
     inferrer_obj = self.inferrer # Read self.inferrer atomically, just in case.
     # The time that self.inferrer is not None is a superset of
@@ -374,31 +441,35 @@ class Engine(object):
       return inferrer_obj.inference_thread_id == threading.currentThread().ident
 
 
-  def save_io(self, stream, extra=None):
-    data = self.model.saveable()
+  def save_io(self, stream, extra=None, compress=False):
+    data = self.model.saveable(streaming=True)
     data['directiveCounter'] = self.directiveCounter
     data['extra'] = extra
-    version = '0.2'
-    cPickle.dump((data, version), stream)
+    snapshot.write(stream, data, compress=compress)
 
   def load_io(self, stream):
-    (data, version) = cPickle.load(stream)
-    assert version == '0.2', "Incompatible version or unrecognized object"
+    prefix = stream.read(len(snapshot.MAGIC))
+    if snapshot.is_snapshot(prefix):
+      data = snapshot.read(stream)
+    else:
+      # A model saved before the snapshot format was introduced.
+      (data, version) = cPickle.loads(prefix + stream.read())
+      assert version == '0.2', "Incompatible version or unrecognized object"
     self.directiveCounter = data['directiveCounter']
     self.model.load(data)
     return data['extra']
 
-  def save(self, fname, extra=None):
-    with open(fname, 'w') as fp:
-      self.save_io(fp, extra=extra)
+  def save(self, fname, extra=None, compress=False):
+    with open(fname, 'wb') as fp:
+      self.save_io(fp, extra=extra, compress=compress)
 
-  def saves(self, extra=None):
+  def saves(self, extra=None, compress=False):
     ans = StringIO.StringIO()
-    self.save_io(ans, extra=extra)
+    self.save_io(ans, extra=extra, compress=compress)
     return ans.getvalue()
 
   def load(self, fname):
-    with open(fname) as fp:
+    with open(fname, 'rb') as fp:
       return self.load_io(fp)
 
   def loads(self, string):
@@ -419,9 +490,20 @@ class Engine(object):
 
   def set_profiling(self, enabled=True): self.model.set_profiling(enabled)
   def clear_profiling(self): self.model.clear_profiling()
+  def set_phase_profiling(self, enabled=True):
+    self.model.set_phase_profiling(enabled)
 
-  def profile_data(self):
+  def profile_data(self, phases=False):
+    """One row per recorded proposal or, if phases is true, per row of
+each particle's PhaseProfile."""
     rows = []
+    if phases:
+      for (pid, trace) in enumerate(self.model.retrieve_traces()):
+        profile = getattr(trace, "phase_stats", None)
+        if profile is not None:
+          for row in profile.rows():
+            rows.append(dict(row, particle = pid))
+      return rows
     for (pid, trace) in enumerate([t for t in self.model.retrieve_traces()
                                    if hasattr(t, "stats")]):
       for stat in trace.stats:
@@ -434,12 +516,83 @@ class Engine(object):
       backend = self.model.backend
     return TraceSet(self, backend, self._py_rng.randint(1, 2**31 - 1))
 
+# Support for running inference actions in trace pool workers
+
+class ParticleEngine(Engine):
+  """An engine that runs inference actions on one particle at a time,
+inside a worker of the trace pool of another engine.
+
+It has its own inference trace, built from the prelude, and a model
+that holds just the particle being acted on."""
+
+  def __init__(self, engine):
+    # Reseeded for each action it runs
+    super(ParticleEngine, self).__init__(engine.model.backend, 1)
+    self.foreign_sps = engine.foreign_sps
+    for (name, sp) in engine.inferenceSPsList():
+      if name not in self.inference_sps:
+        self.bind_foreign_inference_sp(name, sp)
+    # Callbacks are the caller's Python code, and would run here in a
+    # worker, where their side effects are lost; Infer.call_back
+    # refuses them.
+    self.callbacks = None
+    self.creation_time = engine.creation_time
+    self.ripl = ParticleRipl(self)
+
+  def run_action(self, trace, weight, action, seed, directiveCounter):
+    rng = random.Random(seed)
+    self.infer_trace.set_seed(rng.randint(1, 2**31 - 1))
+    self.directiveCounter = directiveCounter
+    self.model.create_trace_pool([trace], [weight])
+    self.model.traces.reset_seeds(rng.randint(1, 2**31 - 1))
+    stack_dict_action = {"type":"SP", "value":action}
+    program = [v.sym("run"), v.quote(stack_dict_action)]
+    did = self._do_raw_evaluate(program)
+    ans = self.infer_trace.extractRaw(did)
+    self.infer_trace.uneval(did) # TODO This becomes "forget" after the engine.Trace wrapper
+    if self.num_traces() != 1:
+      raise VentureException('Cannot change the number of particles in a parallel for_each_particle.')
+    return (self.model.retrieve_trace(0), self.model.log_weights[0], ans)
+
+def _run_particle_action(particle_engine, trace, weight, action, seed,
+                         directiveCounter):
+  (trace, weight, ans) = particle_engine.run_action(
+    trace, weight, action, seed, directiveCounter)
+  return (trace, (weight, (ans, particle_engine.directiveCounter)))
+
+class ParticleRipl(object):
+  """Stands in for the ripl of a ParticleEngine: the inference action
+may sample from its particle, but not issue modeling commands."""
+
+  def __init__(self, engine):
+    from venture.sivm import CoreSivm
+    from venture.sivm import VentureSivm
+    self.sivm = VentureSivm(CoreSivm(engine))
+
+  def __getattr__(self, attr):
+    raise VentureException('Modeling commands not allowed in for_each_particle.')
+
+  # The inference language asks for typed values only, so the type
+  # argument is accepted for compatibility with the ripl and ignored.
+  def force(self, expression, value, type=True): # pylint: disable=redefined-builtin
+    i = {'instruction':'force', 'expression':expression, 'value':value}
+    return v.vector(self.sivm.execute_instruction(i)['value'])
+
+  def sample(self, expression, type=True): # pylint: disable=redefined-builtin
+    i = {'instruction':'sample', 'expression':expression}
+    return self.sivm.execute_instruction(i)['value']
+
+  def sample_all(self, expression, type=True): # pylint: disable=redefined-builtin
+    i = {'instruction':'sample_all', 'expression':expression}
+    return self.sivm.execute_instruction(i)['value']
+
 # Support for continuous inference
 
 class ContinuousInferrer(object):
-  def __init__(self, engine, program):
+  def __init__(self, engine, program, publisher=None):
     self.engine = engine
     self.program = program
+    self.publisher = publisher
     self.inferrer = threading.Thread(target=self.infer_continuously, args=(self.program,))
     self.inferrer.daemon = True
     self.inference_thread_id = None
@@ -448,12 +601,21 @@ class ContinuousInferrer(object):
   def start(self):
     self.inferrer.start()
 
+  def status(self, program):
+    ans = {"running":True, "expression":program}
+    if self.publisher is not None:
+      ans["snapshots"] = self.publisher.config()
+    return ans
+
   def infer_continuously(self, program):
     self.inference_thread_id = threading.currentThread().ident
     # Can use the storage of the thread object itself as the semaphore
     # controlling whether continuous inference proceeds.
     try:
       while self.inferrer is not None:
+        if self.publisher is not None:
+          # Between passes, so the model is in a consistent state
+          self.publisher.maybe_publish(self.engine)
         # TODO React somehow to values returned by the inference action?
         # Currently suppressed for fear of clobbering the prompt
         self.engine.ripl.infer(program)
@@ -472,6 +634,89 @@ class ContinuousInferrer(object):
     else:
       return self.program
 
+class InferenceSnapshot(object):
+  """The state of the model as of one moment of continuous inference.
+
+Holds the reported values of the published directives and, if asked
+for, a copy of the distinguished trace.  A snapshot is never changed
+after it is published, except that sample evaluates an expression in
+the copied trace and then forgets it again."""
+  def __init__(self, taken, values, trace):
+    self.taken = taken
+    self.values = values # {did: stack dict}
+    self.trace = trace
+    self._lock = threading.Lock()
+    if trace is not None:
+      self._next_did = max([0] + trace.dids()) + 1
+
+  def age(self):
+    return time.time() - self.taken
+
+  def report(self, did):
+    """The value of the given directive, or None if it was not published."""
+    return self.values.get(did)
+
+  def sample(self, exp):
+    """Evaluate the desugared expression in the copied trace, or return
+None if this snapshot has none."""
+    if self.trace is None:
+      return None
+    with self._lock:
+      did = self._next_did
+      self._next_did += 1
+      value = self.trace.evaluate(did, exp)
+      self.trace.forget(did)
+    return value
+
+class SnapshotPublisher(object):
+  """Publishes InferenceSnapshots from the continuous inference thread.
+
+- directive_ids: the directives whose values each snapshot records.
+- trace: whether each snapshot also carries a copy of the
+  distinguished trace, for answering sample.  Copying costs time
+  proportional to the size of the trace.
+- interval: the least number of seconds between snapshots.
+- max_staleness: the age in seconds beyond which a snapshot is no
+  longer used to answer reads, or None for no bound.
+
+Publication is a single attribute assignment, so readers on other
+threads see either the previous snapshot or the next one whole."""
+  def __init__(self, directive_ids=(), trace=False, interval=0.0,
+               max_staleness=None):
+    self.directive_ids = list(directive_ids)
+    self.trace = trace
+    self.interval = interval
+    self.max_staleness = max_staleness
+    self.latest = None
+
+  def config(self):
+    return {"directive_ids":list(self.directive_ids), "trace":self.trace,
+            "interval":self.interval, "max_staleness":self.max_staleness}
+
+  def maybe_publish(self, engine):
+    now = time.time()
+    if self.latest is not None and now - self.latest.taken < self.interval:
+      return
+    values = {}
+    for did in self.directive_ids:
+      try:
+        values[did] = engine.report_value(did)
+      except VentureException:
+        pass # Forgotten since continuous inference started
+    if self.trace:
+      trace = engine.model.retrieve_trace(0).stop_and_copy()
+    else:
+      trace = None
+    self.latest = InferenceSnapshot(now, values, trace)
+
+  def fresh(self):
+    snap = self.latest # Read once; the inference thread may replace it
+    if snap is None:
+      return None
+    if self.max_staleness is not None and snap.age() > self.max_staleness:
+      return None
+    return snap
+
 # Inference prelude
 
 the_prelude = None
@@ -21,6 +21,7 @@ import time
 
 from pandas import DataFrame
 
+from venture.engine.columns import Column
 from venture.engine.plot_spec import PlotSpec
 from venture.lite.exception import VentureCallbackError
 from venture.lite.exception import VentureValueError
@@ -35,7 +36,7 @@ from venture.lite.value import VentureNil
 from venture.lite.value import VentureString
 from venture.lite.value import VentureSymbol
 from venture.lite.value import VentureValue
-from venture.ripl.utils import strip_types_from_dict_values
+from venture.ripl.utils import strip_types
 import venture.lite.inference_sps as inf
 import venture.lite.types as t
 import venture.lite.value as v
@@ -125,12 +126,19 @@ class Infer(object):
 
   def primitive_infer(self, exp): return self.engine.primitive_infer(exp)
 
-  def resample(self, ct): self.engine.resample(ct, 'sequential')
-  def resample_serializing(self, ct): self.engine.resample(ct, 'serializing')
-  def resample_threaded(self, ct): self.engine.resample(ct, 'threaded')
-  def resample_thread_ser(self, ct): self.engine.resample(ct, 'thread_ser')
-  def resample_multiprocess(self, ct, process_cap = None):
-    self.engine.resample(ct, 'multiprocess', process_cap)
+  def resample(self, ct, scheme = 'multinomial'):
+    self.engine.resample(ct, 'sequential', scheme=scheme)
+  def resample_serializing(self, ct, scheme = 'multinomial'):
+    self.engine.resample(ct, 'serializing', scheme=scheme)
+  def resample_threaded(self, ct, scheme = 'multinomial'):
+    self.engine.resample(ct, 'threaded', scheme=scheme)
+  def resample_thread_ser(self, ct, scheme = 'multinomial'):
+    self.engine.resample(ct, 'thread_ser', scheme=scheme)
+  def resample_multiprocess(self, ct, process_cap = None,
+                            scheme = 'multinomial'):
+    self.engine.resample(ct, 'multiprocess', process_cap, scheme)
+  def resample_if_needed(self, ct, threshold = 0.5, scheme = 'systematic'):
+    return self.engine.resample_if_needed(ct, threshold, scheme)
 
   def likelihood_weight(self): self.engine.likelihood_weight()
   def log_likelihood_at(self, scope, block):
@@ -165,6 +173,11 @@ class Infer(object):
 
   def call_back(self, name, *exprs):
     name = SymbolType().asPython(name)
+    if self.engine.callbacks is None:
+      raise VentureValueError("Cannot call back {} from a particle running "
+                              "in a worker; omit the in_workers argument "
+                              "of for_each_particle and on_particle to use "
+                              "callbacks".format(name))
     if name not in self.engine.callbacks:
       raise VentureValueError("Unregistered callback {}".format(name))
     args = [self.engine.sample_all(e.asStackDict()) for e in exprs]
@@ -233,10 +246,10 @@ class Infer(object):
   def particle_normalized_probs(self):
     return logWeightsToNormalizedDirect(self.particle_log_weights())
 
-  def for_each_particle(self, action):
-    return self.engine.for_each_particle(action)
-  def on_particle(self, index, action):
-    return self.engine.on_particle(index, action)
+  def for_each_particle(self, action, in_workers=False):
+    return self.engine.for_each_particle(action, in_workers)
+  def on_particle(self, index, action, in_workers=False):
+    return self.engine.on_particle(index, action, in_workers)
 
   def convert_model(self, backend_name):
     import venture.shortcuts as s
@@ -324,15 +337,31 @@ special columns (like the iteration count).  If you are a Venture user and
 find yourself dealing with one of these, you probably want the
 asPandas() method.
 
+Each column is a growable array (see venture.engine.columns), so
+merge_bang takes time proportional to the rows merged in, not to the
+rows already present.  If spill_dir is given, numeric columns live in
+memory-mapped files in that directory rather than in memory.
+
   """
 
-  def __init__(self, ind_names=None, std_names=None, data=None):
+  def __init__(self, ind_names=None, std_names=None, data=None,
+               spill_dir=None):
     self.ind_names = ind_names # :: [String]
     self.std_names = std_names # :: [String]
-    self.data = data   # :: {String, [value]}
-    # The keys of data are the strings that appear in ind_names and std_names
-    # The values of data are all parallel (by particle)
+    self.spill_dir = spill_dir
+    self.columns = None # :: {String, Column}
+    # The keys of columns are the strings that appear in ind_names and std_names
+    # The columns are all parallel (by particle)
     # Column indexing is resolved by position in ind_names (hence the name)
+    self.iter_max = None # The largest iteration count, if any
+    if data is not None:
+      self.columns = OrderedDict()
+      for (key, vals) in data.iteritems():
+        column = Column(spill_dir)
+        column.extend(strip_types(vals))
+        self.columns[key] = column
+      if "iter" in self.columns and len(self.columns["iter"]) > 0:
+        self.iter_max = self.columns["iter"].values().max()
 
   def merge(self, other):
     """Functional merge of two datasets.  Returns a newly allocated
@@ -342,14 +371,9 @@ Dataset which is the result of the merge. """
     if other.ind_names is None:
       return self
     self._check_compat(other)
-    answer = OrderedDict()
-    for (key, vals) in self.data.iteritems():
-      if key == "iter" and len(vals) > 0:
-        nxt = max(vals)
-        answer[key] = vals + [val + nxt for val in other.data[key]]
-      else:
-        answer[key] = vals + other.data[key]
-    return Dataset(self.ind_names, self.std_names, answer)
+    answer = Dataset(spill_dir=self.spill_dir)
+    answer.merge_bang(self)
+    return answer.merge_bang(other)
 
   def merge_bang(self, other):
     """Imperative merge of two datasets.  Returns self after merging other
@@ -359,14 +383,20 @@ into it."""
     if self.ind_names is None:
       self.ind_names = other.ind_names
       self.std_names = other.std_names
-      self.data = OrderedDict([name, []] for name in self.ind_names + self.std_names)
+      self.columns = OrderedDict(
+        [name, Column(self.spill_dir)]
+        for name in self.ind_names + self.std_names)
     self._check_compat(other)
-    for key in self.data.keys():
-      if key == "iter" and len(self.data[key]) > 0:
-        nxt = max(self.data[key])
-        self.data[key].extend([val + nxt for val in other.data[key]])
-      else:
-        self.data[key].extend(other.data[key])
+    iter_max = None
+    for (key, column) in self.columns.iteritems():
+      vals = other.columns[key].values()
+      if key == "iter" and len(vals) > 0:
+        if self.iter_max is not None:
+          vals = vals + self.iter_max
+        iter_max = vals.max()
+      column.extend(vals)
+    if iter_max is not None:
+      self.iter_max = iter_max
     return self
 
   def _check_compat(self, other):
@@ -378,11 +408,14 @@ into it."""
                       % (self.std_names, other.std_names))
 
   def asPandas(self):
-    """Return a freshly allocated Pandas DataFrame containing the data in
-this Dataset."""
-    ds = DataFrame.from_dict(strip_types_from_dict_values(self.data))
+    """Return a Pandas DataFrame containing the data in this Dataset.
+
+The columns are handed to Pandas as arrays without conversion, so the
+frame may share memory with this Dataset.  Merging more data in does
+not disturb it, but copy the frame before modifying it in place."""
     order = self.std_names + self.ind_names
-    return ds[order]
+    return DataFrame(OrderedDict(
+      (name, self.columns[name].values()) for name in order), columns=order)
 
 # Design rationales for collect and the Dataset object
 #
@@ -555,8 +588,15 @@ Like `plotf`, but save the resulting plot(s) instead of displaying on screen.
 See `plot_to_file`.
 """)
 
-inf.registerBuiltinInferenceSP("empty", deterministic_typed(lambda *args: Dataset(), [], t.ForeignBlobType("<dataset>"), descr="""\
+def empty_fun(spill_dir=None):
+  return Dataset(spill_dir=spill_dir)
+
+inf.registerBuiltinInferenceSP("empty", deterministic_typed(empty_fun, [t.StringType("<directory>")], t.ForeignBlobType("<dataset>"), min_req_args=0, descr="""\
 Create an empty dataset `into` which further `collect` ed stuff may be merged.
+
+If a directory is given, the numeric columns of the dataset are kept
+in memory-mapped files there instead of in memory, for collecting
+more samples than fit in RAM.
   """))
 
 inf.registerBuiltinInferenceSP("into", inf.sequenced_sp(lambda orig, new: orig.merge_bang(new), inf.infer_action_maker_type([t.ForeignBlobType(), t.ForeignBlobType()]), desc="""\
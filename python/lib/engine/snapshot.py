@@ -0,0 +1,280 @@
+# Copyright (c) 2016 MIT Probabilistic Computing Project.
+#
+# This file is part of Venture.
+#
+# Venture is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Venture is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Venture.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Binary snapshots of a whole model, as written by Engine.save_io.
+
+A snapshot is a fixed header followed by a sequence of records, each
+a one-byte tag and a length-prefixed payload:
+
+- ``M``: the model-wide data (mode, weights, labels, directive
+  counter, extra), pickled.
+- ``D``: a directive table and its foreign SP names, pickled.  All the
+  traces of a model usually share their directives, so each distinct
+  table is written once and traces refer to it by index.
+- ``T``: one trace's value stack, stored by columns: a type code per
+  value, a float64 column for real numbers, an int64 column for
+  integers, atoms, booleans and interned symbols and strings, and a
+  pickled list of the values that fit none of these.  Strings are
+  interned across the whole snapshot; each record carries only the
+  strings it introduces.
+- ``E``: the end of the snapshot.
+
+Records after the header pass through zlib if the header says so.
+Both directions stream: traces are encoded one at a time, and read
+back one at a time as the model restores them.
+"""
+
+import cPickle
+import numbers
+import struct
+import zlib
+
+import numpy as np
+
+MAGIC = "VNTSNAP\0"
+VERSION = 1
+
+_HEADER = struct.Struct("<HB")
+_RECORD = struct.Struct("<cQ")
+_COLUMNS = struct.Struct("<QQQQ")
+
+# Compression methods
+_RAW = 0
+_ZLIB = 1
+
+# Type codes of values in the value stack
+_REAL = 0     # number with a float value
+_NUMBER = 1   # number with an integer value
+_INTEGER = 2
+_ATOM = 3
+_BOOLEAN = 4
+_SYMBOL = 5
+_STRING = 6
+_OTHER = 7
+
+_INT_CODES = {"number":_NUMBER, "integer":_INTEGER, "atom":_ATOM}
+_INTERNED_CODES = {"symbol":_SYMBOL, "string":_STRING}
+_TYPE_NAMES = {_REAL:"number", _NUMBER:"number", _INTEGER:"integer",
+               _ATOM:"atom", _BOOLEAN:"boolean", _SYMBOL:"symbol",
+               _STRING:"string"}
+
+_INT64_MIN = -2**63
+_INT64_MAX = 2**63 - 1
+
+def is_snapshot(prefix):
+  """Whether a stream starting with the given bytes holds a snapshot."""
+  return prefix == MAGIC
+
+def write(stream, data, compress=False):
+  """Write the data of TraceSet.saveable, plus the engine's
+directiveCounter and extra, to the given binary stream.
+
+The 'traces' entry may be any iterable; it is consumed once, each
+trace being encoded and written before the next is drawn."""
+  stream.write(MAGIC)
+  stream.write(_HEADER.pack(VERSION, _ZLIB if compress else _RAW))
+  out = _ZlibWriter(stream) if compress else stream
+  meta = dict((k, val) for (k, val) in data.iteritems() if k != 'traces')
+  _write_record(out, 'M', cPickle.dumps(meta, cPickle.HIGHEST_PROTOCOL))
+  tables = []
+  strings = {}
+  for (values, directives, foreign_sp_names) in data['traces']:
+    index = _table_index(tables, directives, foreign_sp_names)
+    if index == len(tables):
+      tables.append((directives, foreign_sp_names))
+      _write_record(out, 'D', cPickle.dumps(
+        (directives, foreign_sp_names), cPickle.HIGHEST_PROTOCOL))
+    _write_record(out, 'T', _encode_values(index, values, strings))
+  _write_record(out, 'E', "")
+  if compress:
+    out.finish()
+
+def read(stream):
+  """Read a snapshot from the given binary stream, which must be
+positioned just after the magic number.
+
+Returns the data in the form TraceSet.load expects, except that the
+'traces' entry is an iterator that reads the traces from the stream
+as it is consumed."""
+  (version, compression) = _HEADER.unpack(_read_exactly(stream, _HEADER.size))
+  if version != VERSION:
+    raise IOError("Unsupported snapshot version %d" % version)
+  if compression == _ZLIB:
+    inp = _ZlibReader(stream)
+  elif compression == _RAW:
+    inp = stream
+  else:
+    raise IOError("Unknown snapshot compression method %d" % compression)
+  (tag, payload) = _read_record(inp)
+  if tag != 'M':
+    raise IOError("Malformed snapshot: expected model data, got %r" % tag)
+  data = cPickle.loads(payload)
+  data['traces'] = _read_traces(inp)
+  return data
+
+def _read_traces(inp):
+  tables = []
+  strings = []
+  while True:
+    (tag, payload) = _read_record(inp)
+    if tag == 'E':
+      return
+    elif tag == 'D':
+      tables.append(cPickle.loads(payload))
+    elif tag == 'T':
+      (index, values) = _decode_values(payload, strings)
+      (directives, foreign_sp_names) = tables[index]
+      yield (values, directives, foreign_sp_names)
+    else:
+      raise IOError("Malformed snapshot: unknown record %r" % tag)
+
+def _table_index(tables, directives, foreign_sp_names):
+  # Identity first, since comparing directive tables is not free.
+  for (i, (ds, names)) in enumerate(tables):
+    if ds is directives and names is foreign_sp_names:
+      return i
+  for (i, (ds, names)) in enumerate(tables):
+    if ds == directives and names == foreign_sp_names:
+      return i
+  return len(tables)
+
+def _encode_values(index, values, strings):
+  codes = np.empty(len(values), dtype=np.uint8)
+  reals = []
+  ints = []
+  others = []
+  new_strings = []
+  for (i, value) in enumerate(values):
+    code = _OTHER
+    if isinstance(value, dict) and len(value) == 2 and 'value' in value:
+      tp = value.get('type')
+      val = value['value']
+      if isinstance(val, (bool, np.bool_)):
+        if tp == "boolean":
+          code = _BOOLEAN
+          ints.append(int(val))
+      elif tp == "number" and isinstance(val, float):
+        code = _REAL
+        reals.append(val)
+      elif tp in _INT_CODES and isinstance(val, numbers.Integral) \
+           and _INT64_MIN <= val <= _INT64_MAX:
+        code = _INT_CODES[tp]
+        ints.append(val)
+      elif tp in _INTERNED_CODES and type(val) is str:
+        code = _INTERNED_CODES[tp]
+        if val not in strings:
+          strings[val] = len(strings)
+          new_strings.append(val)
+        ints.append(strings[val])
+    if code == _OTHER:
+      others.append(value)
+    codes[i] = code
+  header = cPickle.dumps((index, new_strings, others),
+                         cPickle.HIGHEST_PROTOCOL)
+  columns = [header, codes.tostring(),
+             np.array(reals, dtype='<f8').tostring(),
+             np.array(ints, dtype='<i8').tostring()]
+  return _COLUMNS.pack(*[len(c) for c in columns]) + "".join(columns)
+
+def _decode_values(payload, strings):
+  lengths = _COLUMNS.unpack_from(payload)
+  columns = []
+  offset = _COLUMNS.size
+  for length in lengths:
+    columns.append(payload[offset:offset+length])
+    offset += length
+  (index, new_strings, others) = cPickle.loads(columns[0])
+  strings.extend(new_strings)
+  codes = _column(columns[1], np.uint8)
+  reals = iter(_column(columns[2], '<f8'))
+  ints = iter(_column(columns[3], '<i8'))
+  others = iter(others)
+  values = []
+  for code in codes:
+    if code == _REAL:
+      values.append({"type":"number", "value":next(reals)})
+    elif code == _OTHER:
+      values.append(next(others))
+    elif code == _BOOLEAN:
+      values.append({"type":"boolean", "value":bool(next(ints))})
+    elif code in (_SYMBOL, _STRING):
+      values.append({"type":_TYPE_NAMES[code], "value":strings[next(ints)]})
+    else:
+      values.append({"type":_TYPE_NAMES[code], "value":next(ints)})
+  return (index, values)
+
+def _column(data, dtype):
+  if not data:
+    return []
+  return np.frombuffer(data, dtype=dtype).tolist()
+
+def _write_record(out, tag, payload):
+  out.write(_RECORD.pack(tag, len(payload)))
+  out.write(payload)
+
+def _read_record(inp):
+  (tag, length) = _RECORD.unpack(_read_exactly(inp, _RECORD.size))
+  return (tag, _read_exactly(inp, length))
+
+def _read_exactly(inp, n):
+  ans = inp.read(n)
+  if len(ans) != n:
+    raise IOError("Truncated snapshot")
+  return ans
+
+class _ZlibWriter(object):
+  """Compresses everything written to it onto the underlying stream."""
+  def __init__(self, stream):
+    self.stream = stream
+    self.compressor = zlib.compressobj()
+
+  def write(self, data):
+    self.stream.write(self.compressor.compress(data))
+
+  def finish(self):
+    self.stream.write(self.compressor.flush())
+
+class _ZlibReader(object):
+  """Decompresses the underlying stream as it is read."""
+  def __init__(self, stream, chunk_size=1 << 16):
+    self.stream = stream
+    self.decompressor = zlib.decompressobj()
+    self.chunk_size = chunk_size
+    self.buffer = ""
+    self.offset = 0
+
+  def read(self, n):
+    end = self.offset + n
+    if end <= len(self.buffer):
+      ans = self.buffer[self.offset:end]
+      self.offset = end
+      return ans
+    pieces = [self.buffer[self.offset:]]
+    available = len(pieces[0])
+    while available < n:
+      chunk = self.stream.read(self.chunk_size)
+      if chunk:
+        piece = self.decompressor.decompress(chunk)
+      else:
+        piece = self.decompressor.flush()
+      pieces.append(piece)
+      available += len(piece)
+      if not chunk:
+        break
+    self.buffer = "".join(pieces)
+    self.offset = min(n, len(self.buffer))
+    return self.buffer[:n]
@@ -69,6 +69,47 @@ class Trace(object):
     self.trace.observe(baseAddr,val)
     self.directives[baseAddr] = ["observe", exp, val]
 
+  def observe_dataset(self, baseAddrs, exp, vals, args=None):
+    assert len(baseAddrs) == len(vals)
+    if args is None:
+      exps = [exp for _ in baseAddrs]
+    else:
+      exps = [[exp] + [v.quote(a) for a in row] for row in args]
+    assert not any(baseAddr in self.directives for baseAddr in baseAddrs)
+    if hasattr(self.trace, 'observe_dataset'):
+      self.trace.observe_dataset(baseAddrs, exp, vals, args)
+    else:
+      # Backends without a bulk path still avoid the per-datum
+      # round trips through the engine.
+      evaluated = []
+      observed = set()
+      try:
+        for (baseAddr, rowExp, val) in zip(baseAddrs, exps, vals):
+          self.trace.eval(baseAddr, rowExp)
+          evaluated.append(baseAddr)
+          self.trace.observe(baseAddr, val)
+          observed.add(baseAddr)
+      except Exception:
+        # All or nothing, as for the bulk path
+        import sys
+        info = sys.exc_info()
+        for baseAddr in reversed(evaluated):
+          if baseAddr in observed:
+            self.trace.unobserve(baseAddr)
+          self.trace.uneval(baseAddr)
+        raise info[0], info[1], info[2]
+    for (baseAddr, rowExp, val) in zip(baseAddrs, exps, vals):
+      self.directives[baseAddr] = ["observe", rowExp, val]
+
+  def abandon_dataset(self, baseAddrs):
+    """Forget whichever of the given directives this trace has.
+
+Used to undo a dataset observation that succeeded in this trace but
+failed in another."""
+    for baseAddr in baseAddrs:
+      if baseAddr in self.directives:
+        self.forget(baseAddr)
+
   def forget(self, directiveId):
     if directiveId not in self.directives:
       raise VentureException("invalid_argument", "Cannot forget a non-existent directive id.  Valid options are %s" % self.directives.keys(),
@@ -171,7 +212,8 @@ inference.)
     return Trace(_restore_trace(mk_trace(), directives, values, foreign_sp_names, foreign_sps, skipStackDictConversion), directives, foreign_sp_names)
 
   def stop_and_copy(self):
-    return Trace(self.trace.stop_and_copy(), self.directives)
+    return Trace(self.trace.stop_and_copy(), self.directives,
+                 self.foreign_sp_names)
 
 ######################################################################
 # Auxiliary functions for dumping and loading backend-specific traces
@@ -28,8 +28,10 @@ from ..multiprocess import SynchronousSerializingMaster
 from ..multiprocess import ThreadedMaster
 from ..multiprocess import ThreadedSerializingMaster
 from venture.exception import VentureException
+from venture.lite.utils import effectiveSampleSize
 from venture.lite.utils import log_domain_even_out
 from venture.lite.utils import logsumexp
+from venture.lite.utils import resampleLogWeights
 from venture.lite.utils import sampleLogCategorical
 import venture.engine.trace as tr
 
@@ -64,12 +66,20 @@ class TraceSet(object):
   def create_trace_pool(self, traces, weights=None):
     del self.traces # To (try and) force reaping any worker processes
     seed = self._py_rng.randint(1, 2**31 - 1)
-    self.traces = self._trace_master(self.mode)(traces, self.process_cap, seed)
+    self.traces = self._trace_master(self.mode)(
+      traces, self.process_cap, seed, TraceCodec(self))
+    # Worker processes restore traces with the foreign SPs they were
+    # forked with.
+    self._pool_foreign_sps = dict(self.engine.foreign_sps)
     if weights is not None:
       self.log_weights = weights
     else:
       self.log_weights = [0 for _ in traces]
 
+  def _can_reuse_pool(self, count):
+    return self.traces.can_rearrange(count) and \
+      self._pool_foreign_sps == self.engine.foreign_sps
+
   # Labeled operations.
 
   @contextlib.contextmanager
@@ -154,6 +164,34 @@ class TraceSet(object):
   def observe(self, baseAddr, datum, val):
     self.traces.map('observe', baseAddr, datum, val)
 
+  def observe_dataset(self, baseAddrs, datum, vals, args=None, labels=None):
+    if labels is not None:
+      assert len(labels) == len(baseAddrs)
+      for label in labels:
+        if label in self._label_to_did:
+          raise VentureException('invalid_argument',
+              'Label %r is already assigned to a different directive.' \
+              % (label,), argument='label')
+      if len(set(labels)) != len(labels):
+        raise VentureException('invalid_argument',
+            'Labels in a dataset must be distinct.', argument='label')
+    # One message per trace for the whole batch, rather than one per
+    # datum.
+    try:
+      self.traces.map('observe_dataset', baseAddrs, datum, vals, args)
+    except Exception:
+      # Each trace undoes its own failed batch, but the batch may have
+      # gone through in other traces.
+      import sys
+      info = sys.exc_info()
+      self.traces.map('abandon_dataset', baseAddrs)
+      raise info[0], info[1], info[2]
+    if labels is not None:
+      for (label, did) in zip(labels, baseAddrs):
+        assert did not in self._did_to_label
+        self._label_to_did[label] = did
+        self._did_to_label[did] = label
+
   def forget(self, directiveId):
     weight_increments = self.traces.map('forget', directiveId)
     if directiveId in self._did_to_label:
@@ -199,24 +237,56 @@ if freeze has been used.
     self.log_weights = [0 for _ in range(num_particles)]
     self.traces.map('reset_to_prior')
 
-  def resample(self, P, mode = 'sequential', process_cap = None):
-    self.mode = mode
-    self.process_cap = process_cap
-    newTraces = self._resample_traces(P)
-    self.create_trace_pool(newTraces, log_domain_even_out(self.log_weights, P))
+  def resample(self, P, mode = 'sequential', process_cap = None,
+               scheme = 'multinomial'):
+    P = int(P)
+    parents = self._resample_parents(P, scheme)
+    weights = log_domain_even_out(self.log_weights, P)
+    if mode == self.mode and process_cap == self.process_cap:
+      self.rearrange_traces(parents, weights)
+    else:
+      newTraces = self._copy_parents(parents)
+      self.mode = mode
+      self.process_cap = process_cap
+      self.create_trace_pool(newTraces, weights)
     self.incorporate()
 
-  def _resample_traces(self, P):
-    P = int(P)
-    newTraces = [None for p in range(P)]
-    used_parents = {}
+  def resample_if_needed(self, P, threshold = 0.5, scheme = 'systematic'):
+    """Resample to P particles if the effective sample size has fallen
+below threshold times the current number of particles.
+
+Keeps the current parallelism mode.  Returns whether it resampled."""
+    if self.effective_sample_size() < threshold * len(self.log_weights):
+      self.resample(P, self.mode, self.process_cap, scheme)
+      return True
+    else:
+      return False
+
+  def effective_sample_size(self):
+    return effectiveSampleSize(self.log_weights)
+
+  def _resample_parents(self, P, scheme = 'multinomial'):
     seed = self._py_rng.randint(1, 2**31 - 1)
     np_rng = npr.RandomState(seed)
-    for p in range(P):
-      parent = sampleLogCategorical(self.log_weights, np_rng) # will need to include or rewrite
-      newTrace = self._use_parent(used_parents, parent)
-      newTraces[p] = newTrace
-    return newTraces
+    # The order of the resampled particles is immaterial, and grouping
+    # the children of each parent together keeps them on the same
+    # worker as their parent as far as possible, so the parents come
+    # back sorted.
+    return resampleLogWeights(self.log_weights, P, np_rng, scheme)
+
+  def rearrange_traces(self, parents, weights):
+    """Replace the traces with copies of the traces at the given indexes,
+without restarting the workers if possible."""
+    if self._can_reuse_pool(len(parents)):
+      seed = self._py_rng.randint(1, 2**31 - 1)
+      self.traces.rearrange(parents, seed)
+      self.log_weights = weights
+    else:
+      self.create_trace_pool(self._copy_parents(parents), weights)
+
+  def _copy_parents(self, parents):
+    used_parents = {}
+    return [self._use_parent(used_parents, parent) for parent in parents]
 
   def _use_parent(self, used_parents, index):
     # All traces returned from calling this function with the same
@@ -246,34 +316,34 @@ if freeze has been used.
     self.create_trace_pool(new_traces, new_weights)
 
   def _collapse_help(self, scope, block, select_keeper):
-    traces = self.retrieve_traces()
     weights = self.log_weights
-    fingerprints = [t.block_values(scope, block) for t in traces]
+    fingerprints = self.traces.map('block_values', scope, block)
     def grouping():
       "Because sorting doesn't do what I want on dicts, so itertools.groupby is not useful"
-      groups = [] # :: [(fingerprint, [trace], [weight])]  Not a dict because the fingerprints are not hashable
-      for (t, w, f) in zip(traces, weights, fingerprints):
+      groups = [] # :: [(fingerprint, [index], [weight])]  Not a dict because the fingerprints are not hashable
+      for (i, (w, f)) in enumerate(zip(weights, fingerprints)):
         try:
           place = [g[0] for g in groups].index(f)
         except ValueError:
           place = len(groups)
           groups.append((f, [], []))
-        groups[place][1].append(t)
+        groups[place][1].append(i)
         groups[place][2].append(w)
       return groups
     groups = grouping()
-    new_ts = []
+    keepers = []
     new_ws = []
-    for (_, ts, ws) in groups:
+    for (_, ixs, ws) in groups:
       (index, total) = select_keeper(ws)
-      new_ts.append(self.copy_trace(ts[index]))
-      new_ts[-1].makeConsistent() # Even impossible states ok
+      keepers.append(ixs[index])
       new_ws.append(total)
-    self.create_trace_pool(new_ts, new_ws)
+    self.rearrange_traces(keepers, new_ws)
+    self.traces.map('makeConsistent') # Even impossible states ok
 
   def collapse(self, scope, block):
+    np_rng = npr.RandomState(self._py_rng.randint(1, 2**31 - 1))
     def sample(weights):
-      return (sampleLogCategorical(weights), logsumexp(weights))
+      return (sampleLogCategorical(weights, np_rng), logsumexp(weights))
     self._collapse_help(scope, block, sample)
 
   def collapse_map(self, scope, block):
@@ -293,11 +363,31 @@ if freeze has been used.
       self.log_weights[i] += increment
     return weight_increments
 
+  def can_run_in_workers(self, payload):
+    """Whether work described by the given payload can be done inside the
+workers holding the traces, instead of bringing the traces here."""
+    if self.mode == 'sequential':
+      return False
+    return self.traces.can_shortcut_retrieval() or is_picklable(payload)
+
+  def for_each_trace_in_workers(self, f, args):
+    # Rather than bringing the traces to the engine, send the work to
+    # the traces.  f(workspace, trace, weight, *args[i]) runs in the
+    # worker holding trace i and returns (trace, (weight, answer)),
+    # where workspace is that worker's ParticleEngine.
+    args = [(w,) + tuple(a) for (w, a) in zip(self.log_weights, args)]
+    results = self.traces.map_in_workspace(f, args)
+    self.log_weights = [w for (w, _) in results]
+    return [ans for (_, ans) in results]
+
+  def on_trace_in_workers(self, i, f, *args):
+    (weight, ans) = self.traces.at_in_workspace(i, f, self.log_weights[i], *args)
+    self.log_weights[i] = weight
+    return ans
+
   def for_each_trace_sequential(self, f):
     # Rather than sending the engine to the traces, bring the traces
-    # to the engine.
-    # TODO is there any way to do something like this while leveraging
-    # parallelism?
+    # to the engine.  See for_each_trace_in_workers for the converse.
     mode = self.mode
     self.mode = 'sequential'
     traces = self.retrieve_traces()
@@ -320,21 +410,31 @@ if freeze has been used.
       self.create_trace_pool(traces, weights)
 
   def on_trace(self, i, f):
+    # Only the one trace leaves the pool, and it goes back in place
+    # unless f changed the number of particles.
     mode = self.mode
-    self.mode = 'sequential'
-    traces = self.retrieve_traces()
+    pool = self.traces
     weights = self.log_weights
+    new_traces = [self.retrieve_trace(i)]
+    new_weights = [weights[i]]
+    self.mode = 'sequential'
     try:
-      self.create_trace_pool([traces[i]], [weights[i]])
-      ans = f(traces[i])
+      self.create_trace_pool(new_traces, new_weights)
+      ans = f(new_traces[0])
       new_traces = self.retrieve_traces()
       new_weights = self.log_weights
-      traces = traces[0:i] + new_traces + traces[i+1:]
-      weights = weights[0:i] + new_weights + weights[i+1:]
       return ans
     finally:
       self.mode = mode
-      self.create_trace_pool(traces, weights)
+      self.traces = pool
+      self.log_weights = weights[0:i] + new_weights + weights[i+1:]
+      if len(new_traces) == 1 and self._can_reuse_pool(len(weights)):
+        seed = self._py_rng.randint(1, 2**31 - 1)
+        self.traces.replace(i, new_traces[0], seed)
+      else:
+        traces = self.retrieve_traces()
+        traces = traces[0:i] + new_traces + traces[i+1:]
+        self.create_trace_pool(traces, self.log_weights)
 
   def primitive_infer(self, exp):
     return self.traces.map('primitive_infer', exp)
@@ -348,6 +448,11 @@ if freeze has been used.
   def retrieve_dumps(self):
     return self.traces.map('dump')
 
+  def iter_dumps(self):
+    """Dump the traces one at a time, as the result is consumed."""
+    for ix in range(len(self.log_weights)):
+      yield self.retrieve_dump(ix)
+
   def retrieve_trace(self, ix):
     if self.traces.can_shortcut_retrieval():
       return self.traces.retrieve(ix)
@@ -374,10 +479,18 @@ if freeze has been used.
       values = trace.dump(skipStackDictConversion=True)
       return self.restore_trace(values, skipStackDictConversion=True)
 
-  def saveable(self):
+  def saveable(self, streaming=False):
+    """The model's state, for saving.
+
+If streaming is true, the 'traces' entry is an iterator that dumps
+each trace only when it is reached, so that a writer consuming it one
+trace at a time never holds all the dumps at once."""
     data = {}
     data['mode'] = self.mode
-    data['traces'] = self.retrieve_dumps()
+    if streaming:
+      data['traces'] = self.iter_dumps()
+    else:
+      data['traces'] = self.retrieve_dumps()
     data['log_weights'] = self.log_weights
     data['label_dict'] = self._label_to_did
     data['did_dict'] = self._did_to_label
@@ -403,9 +516,31 @@ if freeze has been used.
   def clear_profiling(self):
     self.traces.map('clear_profiling')
 
+  def set_phase_profiling(self, enabled=True):
+    self.traces.map('set_phase_profiling', enabled)
+
+class TraceCodec(object):
+  """How the workers of a trace pool copy, serialize, and run inference
+actions on the traces."""
+
+  def __init__(self, trace_set):
+    self.trace_set = trace_set
+
+  def copy(self, trace):
+    return self.trace_set.copy_trace(trace)
+
+  def dump(self, trace):
+    return trace.dump()
+
+  def restore(self, values):
+    return self.trace_set.restore_trace(values)
+
+  def workspace(self):
+    return self.trace_set.engine.particle_engine()
+
 def is_picklable(obj):
   try:
-    pickle.dumps(obj)
+    pickle.dumps(obj, pickle.HIGHEST_PROTOCOL)
   except TypeError:
     return False
   except pickle.PicklingError:
@@ -66,6 +66,23 @@ an object defines a "has_own_prng" method, and that method returns
 "set_seed" method.  If not, the Worker will assume the object relies
 on the process-global Python PRNG available in each child process.
 
+If the Master is given a codec (an object with "copy", "dump", and
+"restore" methods for the managed objects), it can also rearrange the
+objects in place: replace them with copies of some of them, as
+particle resampling does, without stopping the workers.  Each worker
+copies the objects it already holds locally, and an object is
+serialized with "dump" and shipped to another worker, which
+reconstructs it with "restore", only if that worker needs a copy of
+it and does not have one.  When memory is shared, objects are handed
+over directly rather than serialized.
+
+A codec may also offer a "workspace" method, making the Master able
+to run a function on each object inside the worker that holds it.
+Each worker creates its workspace (whatever scratch state the
+function needs) the first time it is asked to, and keeps it for
+later calls.  Only the function, its arguments, and its results
+travel over the pipes; the objects stay where they are.
+
 For more information on the Master class hierarchy, see the docstrings
 below.
 
@@ -127,7 +144,7 @@ class MasterBase(object):
   sequential modes.
 
   '''
-  def __init__(self, objects, process_cap, seed):
+  def __init__(self, objects, process_cap, seed, codec=None):
     """A Master maintains:
 
     - An array of objects representing the worker processes.
@@ -143,8 +160,12 @@ class MasterBase(object):
       list and (the chunk that object is part of and its offset in that
       chunk).
 
+    - The codec, if any, with which the workers copy and serialize
+      the objects when rearranging them.
+
     """
     self.process_cap = process_cap
+    self.codec = codec
     self.processes = []
     self.pipes = []  # Parallel to processes
     self.chunk_sizes = [] # Parallel to processes
@@ -157,28 +178,43 @@ class MasterBase(object):
     # stop child processes
     self.map('stop')
 
-  def _create_processes(self, objects):
-    Pipe, Worker = self._pipe_and_process_types()
+  def _chunk_bounds(self, count):
+    '''Start and end indexes of each chunk of count objects.'''
     if self.process_cap is None:
       base_size = 1
       extras = 0
-      chunk_ct = len(objects)
+      chunk_ct = count
     else:
-      (base_size, extras) = divmod(len(objects), self.process_cap)
-      chunk_ct = min(self.process_cap, len(objects))
+      (base_size, extras) = divmod(count, self.process_cap)
+      chunk_ct = min(self.process_cap, count)
+    bounds = []
     for chunk in range(chunk_ct):
-      parent, child = Pipe()
       if chunk < extras:
         chunk_start = chunk * (base_size + 1)
         chunk_end = chunk_start + base_size + 1
       else:
         chunk_start = extras + chunk * base_size
         chunk_end = chunk_start + base_size
-      assert chunk_end <= len(objects) # I think I wrote this code to ensure this
-      process = Worker(objects[chunk_start:chunk_end], child)
+      assert chunk_end <= count # I think I wrote this code to ensure this
+      bounds.append((chunk_start, chunk_end))
+    return bounds
+
+  def _create_processes(self, objects):
+    Pipe, Worker = self._pipe_and_process_types()
+    bounds = self._chunk_bounds(len(objects))
+    for (chunk_start, chunk_end) in bounds:
+      parent, child = Pipe()
+      process = Worker(objects[chunk_start:chunk_end], child, self.codec)
       process.start()
       self.pipes.append(parent)
       self.processes.append(process)
+    self._set_chunks(bounds)
+
+  def _set_chunks(self, bounds):
+    self.chunk_sizes = []
+    self.chunk_indexes = []
+    self.chunk_offsets = []
+    for (chunk, (chunk_start, chunk_end)) in enumerate(bounds):
       self.chunk_sizes.append(chunk_end - chunk_start)
       for i in range (chunk_end - chunk_start):
         self.chunk_indexes.append(chunk)
@@ -245,6 +281,102 @@ class MasterBase(object):
   def at_distinguished(self, cmd, *args, **kwargs):
     return self.at(0, cmd, *args, **kwargs)
 
+  def can_rearrange(self, count):
+    '''Whether count objects can be laid out over the existing workers.'''
+    return self.codec is not None and \
+      len(self._chunk_bounds(count)) == len(self.processes)
+
+  def rearrange(self, sources, seed):
+    '''Replace the objects with copies of the objects at the given indexes.
+
+    Object i of the result is (a copy of) the current object
+    sources[i].  Every source object that has a copy placed on the
+    worker already holding it is reused there rather than copied.  The
+    workers stay up, and are reseeded from the given seed afterwards.
+
+    '''
+    assert self.can_rearrange(len(sources))
+    bounds = self._chunk_bounds(len(sources))
+    dest_chunks = []
+    for (chunk, (chunk_start, chunk_end)) in enumerate(bounds):
+      dest_chunks.extend([chunk] * (chunk_end - chunk_start))
+
+    # Which new object keeps each source object itself: the first on
+    # the same worker if any, else the first elsewhere.
+    keeper = {}
+    for (i, src) in enumerate(sources):
+      if dest_chunks[i] == self.chunk_indexes[src]:
+        if src not in keeper or \
+           dest_chunks[keeper[src]] != self.chunk_indexes[src]:
+          keeper[src] = i
+      elif src not in keeper:
+        keeper[src] = i
+
+    # Each worker exports one object for every (source, destination
+    # worker) pair that crosses between workers.
+    exports = [[] for _ in self.processes] # (offset, move) per chunk
+    plans = [[] for _ in self.processes] # (kind, key) per new object
+    imports = [[] for _ in self.processes] # (chunk, export no) per chunk
+    import_keys = {}
+    for (i, src) in enumerate(sources):
+      (src_chunk, dest_chunk) = (self.chunk_indexes[src], dest_chunks[i])
+      if src_chunk == dest_chunk:
+        plans[dest_chunk].append(('local', self.chunk_offsets[src]))
+        continue
+      if (src, dest_chunk) not in import_keys:
+        move = keeper[src] == i
+        exports[src_chunk].append((self.chunk_offsets[src], move))
+        import_keys[(src, dest_chunk)] = len(imports[dest_chunk])
+        imports[dest_chunk].append((src_chunk, len(exports[src_chunk]) - 1))
+      plans[dest_chunk].append(('import', import_keys[(src, dest_chunk)]))
+
+    exporting = [chunk for chunk in range(len(self.processes))
+                 if exports[chunk]]
+    for chunk in exporting:
+      self.pipes[chunk].send(('export_objects', (exports[chunk],), {}, None))
+    payloads = {}
+    for chunk in exporting:
+      payloads[chunk] = self.handle_one_result(self.pipes[chunk].recv())
+
+    for (chunk, pipe) in enumerate(self.pipes):
+      incoming = [payloads[src_chunk][k] for (src_chunk, k) in imports[chunk]]
+      pipe.send(('rearrange', (plans[chunk], incoming), {}, None))
+    res = []
+    for pipe in self.pipes:
+      self.accumulate_result(res, pipe.recv())
+    self.handle_result_list(res)
+
+    self._set_chunks(bounds)
+    self.reset_seeds(seed)
+
+  def replace(self, ix, obj, seed):
+    '''Replace the object at index ix, and reseed all the objects.'''
+    self.at(ix, 'import_object', self._export(obj))
+    self.reset_seeds(seed)
+
+  def _export(self, obj):
+    return self.codec.dump(obj)
+
+  def map_in_workspace(self, f, args):
+    '''Apply f to every object in the worker holding it.
+
+    Object i is replaced by the first element of the result of
+    f(workspace, obj, *args[i]), and the list of the second elements
+    is returned.  f must be picklable if memory is not shared.
+
+    '''
+    for (chunk, pipe) in enumerate(self.pipes):
+      chunk_args = [a for (a, c) in zip(args, self.chunk_indexes) if c == chunk]
+      pipe.send(('map_in_workspace', (f, chunk_args), {}, None))
+    res = []
+    for pipe in self.pipes:
+      self.accumulate_result(res, pipe.recv())
+    return self.handle_result_list(res)
+
+  def at_in_workspace(self, ix, f, *args):
+    '''Apply f to the object at index ix, as map_in_workspace does.'''
+    return self.at(ix, 'at_in_workspace', f, args)
+
   def can_shortcut_retrieval(self):
     """In general, the short-circuit offered by SharedMemoryMasterBase is not available."""
     return False
@@ -264,6 +396,9 @@ class SharedMemoryMasterBase(MasterBase):
 
   def can_shortcut_retrieval(self): return True
 
+  def _export(self, obj):
+    return obj
+
   def retrieve(self, ix):
     return self.at(ix, 'send_object')
 
@@ -356,11 +491,17 @@ class WorkerBase(object):
   synchronously (using Safely objects to catch exceptions).
 
   '''
-  def __init__(self, objs, pipe):
-    self.objs = [Safely(o) for o in objs]
+  def __init__(self, objs, pipe, codec=None):
+    self.objs = [self._wrap(o) for o in objs]
     self.pipe = pipe
+    self.codec = codec
+    self.workspace = None
     self._initialize()
 
+  @staticmethod
+  def _wrap(obj):
+    return Safely(obj)
+
   def run(self):
     done = False
     while not done:
@@ -405,6 +546,59 @@ class WorkerBase(object):
   def send_object(self, _index):
     raise VentureException("fatal", "Cannot transmit object directly if memory is not shared")
 
+  @safely
+  def export_objects(self, _index, entries):
+    # Each entry is (offset, move), where move means that the object
+    # at offset will not be kept by this worker.
+    return [self._export(self.objs[offset].obj, move)
+            for (offset, move) in entries]
+
+  @safely
+  def rearrange(self, _index, plan, incoming):
+    # Each plan entry is ('local', offset) to reuse (a copy of) an
+    # object of this worker, or ('import', k) to use (a copy of)
+    # incoming[k].
+    originals = {}
+    objs = []
+    for entry in plan:
+      if entry in originals:
+        objs.append(self.codec.copy(originals[entry]))
+      else:
+        (kind, key) = entry
+        if kind == 'local':
+          obj = self.objs[key].obj
+        else:
+          obj = self._import(incoming[key])
+        originals[entry] = obj
+        objs.append(obj)
+    self.objs = [self._wrap(o) for o in objs]
+    return [None for _ in self.objs]
+
+  @safely
+  def import_object(self, index, payload):
+    self.objs[index] = self._wrap(self._import(payload))
+
+  @safely
+  def map_in_workspace(self, _index, f, args):
+    return [self._apply_in_workspace(i, f, a) for (i, a) in enumerate(args)]
+
+  @safely
+  def at_in_workspace(self, index, f, args):
+    return self._apply_in_workspace(index, f, args)
+
+  def _apply_in_workspace(self, index, f, args):
+    if self.workspace is None:
+      self.workspace = self.codec.workspace()
+    (obj, ans) = f(self.workspace, self.objs[index].obj, *args)
+    self.objs[index] = self._wrap(obj)
+    return ans
+
+  def _export(self, obj, _move):
+    return self.codec.dump(obj)
+
+  def _import(self, payload):
+    return self.codec.restore(payload)
+
 ######################################################################
 # Base classes defining how to send objects, and process types
 
@@ -423,6 +617,15 @@ class SharedMemoryWorkerBase(WorkerBase):
     else:
       return [o.obj for o in self.objs]
 
+  def _export(self, obj, move):
+    if move:
+      return obj
+    else:
+      return self.codec.copy(obj)
+
+  def _import(self, payload):
+    return payload
+
 class MultiprocessBase(mp.Process):
   '''
   Specifies multiprocess implementation; inherited by MultiprocessingWorker.
@@ -493,11 +696,11 @@ class SynchronousWorker(SharedMemoryWorkerBase, SynchronousBase):
   serialization. Controlled by SynchronousMaster.
 
   '''
-  def _initialize(self):
-    super(SynchronousWorker, self)._initialize()
-    # Re-wrap the trace objects not to capture exceptions, but to
-    # propagate them into the master.
-    self.objs = [Confidently(o.obj) for o in self.objs]
+  # Wrap the trace objects not to capture exceptions, but to
+  # propagate them into the master.
+  @staticmethod
+  def _wrap(obj):
+    return Confidently(obj)
 
 ######################################################################
 # Code to handle exceptions in worker processes
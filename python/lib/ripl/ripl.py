@@ -434,7 +434,7 @@ class Ripl():
                 return self._ensure_parsed_expression(value)
             elif key in ['directive_id', 'seed']:
                 return self._ensure_parsed_number(value)
-            elif key in ['options', 'params']:
+            elif key in ['options', 'params', 'snapshots']:
                 # Do not support partially parsed options or param
                 # hashes, since they have too many possible key types
                 return value
@@ -697,12 +697,9 @@ but appreciably faster.  See also open considerations and details of
 the semantics in `observe_dataset`.
 
 """
-        ret_vals = []
         parsed = self._ensure_parsed_expression(exp)
-        for i, val in enumerate(items):
-          lab = label+"_"+str(i) if label is not None else None
-          ret_vals.append(self.observe(parsed, val, lab))
-        return ret_vals
+        vals = [self._ensure_parsed_expression(val) for val in items]
+        return self._observe_dataset(parsed, vals, None, label)
 
     def observe_dataset(self, proc_expression, iterable, label=None):
         """Observe a general dataset.
@@ -732,6 +729,10 @@ Semantics:
 - The ripl method returns a list of directive ids, which correspond to
   the individual observes thus generated.
 
+- The `<iterable>` may be a NumPy array, one row per item.  The whole
+  dataset is transmitted to the traces as one batch, so this is much
+  faster than the equivalent loop of observes.
+
 Open issues:
 
 - If the `<expr>` is itself stochastic, it is unspecified whether we
@@ -752,13 +753,86 @@ Open issues:
   it's called!)
 
         """
-        ret_vals = []
         parsed = self._ensure_parsed_expression(proc_expression)
-        for i, args_val in enumerate(iterable):
-          expr = [parsed] + [v.quote(a) for a in args_val[:-1]]
-          lab = label+"_"+str(i) if label is not None else None
-          ret_vals.append(self.observe(expr, args_val[-1], lab))
-        return ret_vals
+        args = []
+        vals = []
+        for args_val in iterable:
+          args.append([self._ensure_parsed_expression(a)
+                       for a in args_val[:-1]])
+          vals.append(self._ensure_parsed_expression(args_val[-1]))
+        return self._observe_dataset(parsed, vals, args, label)
+
+    def _observe_dataset(self, parsed, vals, args, label):
+        # The whole dataset goes down to the traces as one batch: the
+        # expression is macro-expanded once and each trace receives a
+        # single message, instead of one instruction per datum.
+        if len(vals) == 0:
+          return []
+        if label is not None:
+          labels = [label+"_"+str(i) for i in range(len(vals))]
+        else:
+          labels = None
+        try:
+          dids = self.sivm.observe_dataset(parsed, vals, args,
+                                           labels)['directive_ids']
+        except VentureException as e:
+          if self._do_not_annotate:
+            raise
+          self._raise_annotated(e, {'instruction':'observe',
+                                    'expression':parsed, 'value':vals[0]})
+        # Recorded only once the whole batch has gone through, since a
+        # failed batch leaves no directives behind.
+        for i, did in enumerate(dids):
+          if args is None:
+            expr = parsed
+          else:
+            expr = [parsed] + [v.quote(a) for a in args[i]]
+          if labels is None:
+            instr = {'instruction':'observe', 'expression':expr,
+                     'value':vals[i]}
+          else:
+            instr = {'instruction':'labeled_observe', 'expression':expr,
+                     'value':vals[i], 'label':v.symbol(labels[i])}
+          self.directive_id_to_stringable_instruction[did] = instr
+          self.directive_id_to_mode[did] = self.mode
+        return dids
+
+    def execute_prepared(self, instructions):
+        '''Execute a batch of already parsed and desugared directives.
+
+Each instruction is a dict as accepted by execute_instruction for
+assume, define, observe or predict (or their labeled variants), with
+the expression fully parsed and free of macros, and symbols, labels
+and values given as Venture values.  This skips the per-directive
+validation and macro expansion of the interactive path, for clients
+that generate many directives programmatically.
+
+Return the list of the directive ids assigned.'''
+        engine = self.sivm.core_sivm.engine
+        did = engine.predictNextDirectiveId()
+        for (i, instruction) in enumerate(instructions):
+            self.directive_id_to_stringable_instruction[did + i] = instruction
+            self.directive_id_to_mode[did + i] = self.mode
+        try:
+            responses = self.sivm.execute_prepared(instructions)
+        except Exception as e:
+            info = sys.exc_info()
+            index = getattr(e, 'prepared_index', None)
+            # The failed directive keeps its record, as in
+            # execute_instruction, but the ones after it never got
+            # their ids.
+            if index is not None:
+                first_unassigned = index + 1
+            else:
+                first_unassigned = engine.predictNextDirectiveId() - did
+            for i in range(max(first_unassigned, 0), len(instructions)):
+                del self.directive_id_to_stringable_instruction[did + i]
+                del self.directive_id_to_mode[did + i]
+            if isinstance(e, VentureException) and index is not None \
+               and not self._do_not_annotate:
+                self._raise_annotated(e, instructions[index])
+            raise info[0], info[1], info[2]
+        return [response['directive_id'] for response in responses]
 
     ############################################
     # Core
@@ -905,9 +979,34 @@ Open issues:
     def continuous_inference_status(self):
         return self.execute_instruction({'instruction':'continuous_inference_status'})
 
-    def start_continuous_inference(self, program=None):
+    def start_continuous_inference(self, program=None, publish=None,
+                                   publish_trace=False, interval=0,
+                                   max_staleness=None):
+        """Start running the given inference program repeatedly in the
+        background.
+
+        If publish (a list of labels or directive ids) is given, or
+        publish_trace is true, the background thread also publishes
+        snapshots of the model, at most one per interval seconds.
+        While it runs, report of a published directive (and sample,
+        if publish_trace) is answered from the latest snapshot not
+        older than max_staleness seconds, without stopping inference.
+        """
         inst = {'instruction':'start_continuous_inference',
                 'expression': self.defaultInferProgram(program)}
+        if publish is not None or publish_trace:
+            dids = []
+            labels = []
+            for label_or_did in publish or []:
+                (tp, val) = _interp_label_or_did(label_or_did)
+                if tp == 'did':
+                    dids.append(val)
+                else:
+                    labels.append(val)
+            inst['snapshots'] = {'directive_ids': dids, 'labels': labels,
+                                 'trace': publish_trace,
+                                 'interval': interval,
+                                 'max_staleness': max_staleness}
         self.execute_instruction(inst)
         return None
 
@@ -960,13 +1059,13 @@ Open issues:
     # Serialization
     ############################################
 
-    def save_io(self, stream, extra=None):
+    def save_io(self, stream, extra=None, compress=False):
         if extra is None:
             extra = {}
         extra['directive_id_to_stringable_instruction'] = \
             self.directive_id_to_stringable_instruction
         extra['directive_id_to_mode'] = self.directive_id_to_mode
-        return self.sivm.save_io(stream, extra)
+        return self.sivm.save_io(stream, extra, compress=compress)
 
     def load_io(self, stream):
         extra = self.sivm.load_io(stream)
@@ -975,17 +1074,17 @@ Open issues:
         self.directive_id_to_mode = extra['directive_id_to_mode']
         return extra
 
-    def save(self, fname, extra=None):
-        with open(fname, 'w') as fp:
-            self.save_io(fp, extra=extra)
+    def save(self, fname, extra=None, compress=False):
+        with open(fname, 'wb') as fp:
+            self.save_io(fp, extra=extra, compress=compress)
 
-    def saves(self, extra=None):
+    def saves(self, extra=None, compress=False):
         ans = StringIO.StringIO()
-        self.save_io(ans, extra=extra)
+        self.save_io(ans, extra=extra, compress=compress)
         return ans.getvalue()
 
     def load(self, fname):
-        with open(fname) as fp:
+        with open(fname, 'rb') as fp:
             return self.load_io(fp)
 
     def loads(self, string):
@@ -1033,7 +1132,21 @@ Open issues:
         self.profiler_running(False)
         return None
 
-    def profile_data(self):
+    def phase_profiler_enable(self):
+        """Start aggregating per-phase timings, scaffold sizes, and PSP
+call counts of inference transitions (Lite only)."""
+        self.sivm.core_sivm.engine.set_phase_profiling(True)
+        return None
+
+    def phase_profiler_disable(self):
+        self.sivm.core_sivm.engine.set_phase_profiling(False)
+        return None
+
+    def profile_data(self, phases=False):
+        if phases:
+            from pandas import DataFrame
+            return DataFrame.from_records(
+                self.sivm.core_sivm.engine.profile_data(phases=True))
         rows = self.sivm.core_sivm.engine.profile_data()
 
         def replace(d, name, f):
@@ -1056,6 +1169,10 @@ Open issues:
             return np.array(xs)[ix].tolist()
 
         for row in rows:
+            if 'current' not in row:
+                # Puma records the sizes of the node sets, not their
+                # addresses and values.
+                continue
             initial_order = map(resugar, row['principal'])
             for name in ['principal', 'absorbing', 'aaa']:
                 replace(row, name, lambda addrs: frozenset(map(resugar, addrs)))
@@ -66,25 +66,25 @@ class CoreSivm(object):
     # Serialization
     ###############################
 
-    def save_io(self, stream, extra=None):
+    def save_io(self, stream, extra=None, compress=False):
         if extra is None:
             extra = {}
-        return self.engine.save_io(stream, extra)
+        return self.engine.save_io(stream, extra, compress=compress)
 
     def load_io(self, stream):
         return self.engine.load_io(stream)
 
-    def save(self, fname, extra=None):
-        with open(fname, 'w') as fp:
-            self.save_io(fp, extra=extra)
+    def save(self, fname, extra=None, compress=False):
+        with open(fname, 'wb') as fp:
+            self.save_io(fp, extra=extra, compress=compress)
 
-    def saves(self, extra=None):
+    def saves(self, extra=None, compress=False):
         ans = StringIO.StringIO()
-        self.save_io(ans, extra=extra)
+        self.save_io(ans, extra=extra, compress=compress)
         return ans.getvalue()
 
     def load(self, fname):
-        with open(fname) as fp:
+        with open(fname, 'rb') as fp:
             return self.load_io(fp)
 
     def loads(self, string):
@@ -138,6 +138,52 @@ class CoreSivm(object):
         did, weights = self.engine.labeled_observe(label, exp, val)
         return {'directive_id': did, 'value': weights}
 
+    def observe_dataset(self, expression, vals, args=None, labels=None):
+        # Not an instruction: the batch is validated here once rather
+        # than once per datum.
+        exp = _modify_expression(utils.validate_expression(expression))
+        vals = [_modify_value(utils.validate_value(val)) for val in vals]
+        if args is not None:
+            args = [[_modify_expression(utils.validate_expression(a))
+                     for a in row] for row in args]
+        if labels is not None:
+            labels = [utils.validate_symbol(label) for label in labels]
+        dids, weights = self.engine.observe_dataset(exp, vals, args, labels)
+        return {"directive_ids":dids, "value":weights}
+
+    def execute_prepared(self, instruction):
+        # Not an instruction either: the caller vouches that the
+        # directive is well-formed and its expression desugared, so
+        # nothing is validated on the way to the engine.  Desugared
+        # expressions still carry bare strings for symbols, which
+        # need the same conversion as any other directive's.
+        instruction_type = instruction['instruction']
+        exp = _modify_expression(instruction['expression'])
+        if instruction_type in ['assume', 'define']:
+            sym = _symbol_name(instruction['symbol'])
+            did, val = getattr(self.engine, instruction_type)(sym, exp)
+        elif instruction_type == 'labeled_assume':
+            did, val = self.engine.labeled_assume(
+                _symbol_name(instruction['label']),
+                _symbol_name(instruction['symbol']), exp)
+        elif instruction_type == 'observe':
+            did, val = self.engine.observe(
+                exp, _modify_value(instruction['value']))
+        elif instruction_type == 'labeled_observe':
+            did, val = self.engine.labeled_observe(
+                _symbol_name(instruction['label']), exp,
+                _modify_value(instruction['value']))
+        elif instruction_type == 'predict':
+            did, val = self.engine.predict(exp)
+        elif instruction_type == 'labeled_predict':
+            did, val = self.engine.labeled_predict(
+                _symbol_name(instruction['label']), exp)
+        else:
+            raise VentureException('unrecognized_instruction',
+                'The "{}" instruction cannot be executed prepared.'.format(
+                    instruction_type))
+        return {"directive_id":did, "value":val}
+
     def _do_predict(self,instruction):
         exp = utils.validate_arg(instruction,'expression',
                 utils.validate_expression,modifier=_modify_expression, wrap_exception=False)
@@ -216,7 +262,15 @@ class CoreSivm(object):
     def _do_start_continuous_inference(self,instruction):
         e = utils.validate_arg(instruction, 'expression',
                 utils.validate_expression,modifier=_modify_expression, wrap_exception=False)
-        self.engine.start_continuous_inference(e)
+        snapshots = instruction.get('snapshots')
+        if snapshots is not None:
+            snapshots = dict(snapshots)
+            dids = list(snapshots.get('directive_ids', []))
+            for label in snapshots.pop('labels', []):
+                label = utils.validate_symbol(label)
+                dids.append(self.engine.get_directive_id(label))
+            snapshots['directive_ids'] = dids
+        self.engine.start_continuous_inference(e, snapshots)
 
     def _do_stop_continuous_inference(self,_):
         return self.engine.stop_continuous_inference()
@@ -256,6 +310,11 @@ def _modify_value(ob):
         return ans
     return ob
 
+def _symbol_name(s):
+    if isinstance(s, dict):
+        return s['value']
+    return s
+
 def _modify_symbol(s):
     # NOTE: need to str() b/c unicode might come via REST,
     #       which the boost python wrappings can't convert
@@ -23,6 +23,7 @@ import cStringIO as StringIO
 
 from venture.exception import VentureException
 from venture.sivm import utils, macro, macro_system
+from venture.sivm.core_sivm import _modify_expression
 import venture.value.dicts as v
 
 class VentureSivm(object):
@@ -72,13 +73,26 @@ class VentureSivm(object):
         'stop_continuous_inference',
     }
 
+    # Instructions that may be answered from a snapshot published by
+    # continuous inference, without pausing it.
+    _snapshot_instructions = {
+        'labeled_report',
+        'report',
+        'sample',
+    }
+
     def execute_instruction(self, instruction):
         utils.validate_instruction(instruction, self._core_instructions |
                                    self._extra_instructions)
         instruction_type = instruction['instruction']
 
+        on_ci_thread = self.core_sivm.engine.on_continuous_inference_thread()
+        if instruction_type in self._snapshot_instructions and not on_ci_thread:
+            response = self._answer_from_snapshot(instruction)
+            if response is not None:
+                return response
         pause = instruction_type not in self._dont_pause_continuous_inference \
-            and not self.core_sivm.engine.on_continuous_inference_thread()
+            and not on_ci_thread
         with self._pause_continuous_inference(pause=pause):
             if instruction_type == 'stop_continuous_inference':
                 # It is possible for a paused CI to exist when
@@ -124,12 +138,12 @@ class VentureSivm(object):
     # Serialization
     ###############################
 
-    def save_io(self, stream, extra=None):
+    def save_io(self, stream, extra=None, compress=False):
         if extra is None:
             extra = {}
         for d in self.dicts:
             extra[d] = getattr(self, d)
-        return self.core_sivm.save_io(stream, extra)
+        return self.core_sivm.save_io(stream, extra, compress=compress)
 
     def load_io(self, stream):
         extra = self.core_sivm.load_io(stream)
@@ -137,17 +151,17 @@ class VentureSivm(object):
             setattr(self, d, extra[d])
         return extra
 
-    def save(self, fname, extra=None):
-        with open(fname, 'w') as fp:
-            self.save_io(fp, extra=extra)
+    def save(self, fname, extra=None, compress=False):
+        with open(fname, 'wb') as fp:
+            self.save_io(fp, extra=extra, compress=compress)
 
-    def saves(self, extra=None):
+    def saves(self, extra=None, compress=False):
         ans = StringIO.StringIO()
-        self.save_io(ans, extra=extra)
+        self.save_io(ans, extra=extra, compress=compress)
         return ans.getvalue()
 
     def load(self, fname):
-        with open(fname) as fp:
+        with open(fname, 'rb') as fp:
             return self.load_io(fp)
 
     def loads(self, string):
@@ -269,7 +283,11 @@ class VentureSivm(object):
                 if frame is not None]
 
     def _get_syntax_record(self, did):
-        return self.syntax_dict[did]
+        if did in self.syntax_dict:
+            return self.syntax_dict[did]
+        # Directives entered by execute_prepared have no record until
+        # one is asked for.
+        return _syntax_record(self._get_directive(did)['expression'])
 
     def _get_exp(self, did):
         return self._get_syntax_record(did)[0]
@@ -312,7 +330,14 @@ class VentureSivm(object):
         # instrument this check to see how often length-1 indexes are
         # annotatable.
         did = index[0]
-        return did not in self.syntax_dict and len(index) == 1
+        return len(index) == 1 and not self._has_syntax_record(did)
+
+    def _has_syntax_record(self, did):
+        if did in self.syntax_dict:
+            return True
+        # Directives entered by execute_prepared get their records
+        # lazily, from the engine's directives.
+        return did in self.core_sivm.engine.model.traces.at_distinguished('dids')
 
     def _register_executed_instruction(self, instruction, predicted_did,
             forgotten_did, response):
@@ -372,7 +397,9 @@ class VentureSivm(object):
                     pass
                 elif self.ci_was_running:
                     # print "restarting continuous inference"
-                    sivm._start_continuous_inference(self.ci_status['expression'])
+                    sivm._start_continuous_inference(
+                        self.ci_status['expression'],
+                        self.ci_status.get('snapshots'))
         return tmp()
 
 
@@ -384,10 +411,42 @@ class VentureSivm(object):
         return self._call_core_sivm_instruction(
             {'instruction' : 'continuous_inference_status'})
 
-    def _start_continuous_inference(self, expression):
-        self._call_core_sivm_instruction(
-            {'instruction' : 'start_continuous_inference',
-             'expression' : expression})
+    def _start_continuous_inference(self, expression, snapshots=None):
+        instruction = {'instruction' : 'start_continuous_inference',
+                       'expression' : expression}
+        if snapshots is not None:
+            instruction['snapshots'] = snapshots
+        self._call_core_sivm_instruction(instruction)
+
+    def _answer_from_snapshot(self, instruction):
+        """Answer a read from the latest snapshot continuous inference
+        published, or return None if it cannot be."""
+        snap = self.core_sivm.engine.continuous_inference_snapshot()
+        if snap is None:
+            return None
+        instruction_type = instruction['instruction']
+        if instruction_type == 'report':
+            value = snap.report(instruction.get('directive_id'))
+        elif instruction_type == 'labeled_report':
+            try:
+                label = utils.validate_arg(instruction, 'label',
+                    utils.validate_symbol)
+                did = self.core_sivm.engine.get_directive_id(label)
+            except VentureException:
+                return None
+            value = snap.report(did)
+        else:
+            exp = utils.validate_arg(instruction, 'expression',
+                    utils.validate_expression, wrap_exception=False)
+            try:
+                value = snap.sample(_modify_expression(
+                    macro_system.expand(exp).desugared()))
+            except VentureException:
+                # Let the usual path report the error properly
+                return None
+        if value is None:
+            return None
+        return {'value': value}
 
     def _stop_continuous_inference(self):
         return self._call_core_sivm_instruction(
@@ -521,6 +580,97 @@ class VentureSivm(object):
                  'value':value, 'label':v.symbol(label)}
         return self.execute_instruction(d)
 
+    def observe_dataset(self, expression, vals, args=None, labels=None):
+        """Observe one directive per element of vals, expanding macros once.
+
+If args is None, each directive observes expression itself; otherwise
+directive i observes the application of expression to the quoted
+args[i].  Returns the list of directive ids and the weight increments
+of the whole batch."""
+        pause = not self.core_sivm.engine.on_continuous_inference_thread()
+        with self._pause_continuous_inference(pause=pause):
+            exp = utils.validate_expression(expression)
+            syntax = macro_system.expand(exp)
+            desugared = syntax.desugared()
+            first_did = self.core_sivm.engine.predictNextDirectiveId()
+            predicted_dids = range(first_did, first_did + len(vals))
+            quote = macro.LiteralSyntax(v.symbol('quote'))
+            for i, did in enumerate(predicted_dids):
+                if args is None:
+                    record = (exp, syntax)
+                else:
+                    quoted = [v.quote(a) for a in args[i]]
+                    record = ([exp] + quoted, macro.ListSyntax(
+                        [syntax] + [macro.ListSyntax(
+                            [quote, macro.LiteralSyntax(a)])
+                                    for a in args[i]]))
+                assert did not in self.syntax_dict
+                self.syntax_dict[did] = record
+            try:
+                response = self.core_sivm.observe_dataset(
+                    desugared, vals, args, labels)
+            except VentureException as e:
+                if self._do_not_annotate:
+                    raise
+                import sys
+                info = sys.exc_info()
+                try:
+                    e = self._annotate(e, {'instruction':'observe',
+                                           'expression':exp})
+                except Exception:
+                    print "Trying to annotate an exception at SIVM level led to:"
+                    import traceback
+                    print traceback.format_exc()
+                    raise e, None, info[2]
+                finally:
+                    for did in predicted_dids:
+                        if did in self.syntax_dict:
+                            del self.syntax_dict[did]
+                raise e, None, info[2]
+            if response['directive_ids'] != predicted_dids:
+                warning = "Warning: Dataset was pre-assigned dids %s but actually assigned dids %s"
+                print warning % (predicted_dids, response['directive_ids'])
+            return response
+
+    def execute_prepared(self, instructions):
+        """Execute a batch of directives that are already valid and desugared.
+
+Each instruction is an assume, define, observe or predict (or their
+labeled variants) in the form the core sivm accepts, whose expression
+contains no macros.  Skips the per-instruction copying, validation,
+macro expansion and syntax bookkeeping of execute_instruction; the
+syntax records used to annotate errors are reconstructed from the
+engine's directives if and when they are needed.  Returns the list of
+responses."""
+        pause = not self.core_sivm.engine.on_continuous_inference_thread()
+        responses = []
+        with self._pause_continuous_inference(pause=pause):
+            for (i, instruction) in enumerate(instructions):
+                did = self.core_sivm.engine.predictNextDirectiveId()
+                try:
+                    responses.append(
+                        self.core_sivm.execute_prepared(instruction))
+                except VentureException as e:
+                    # Tell the caller which instruction failed.
+                    e.prepared_index = i
+                    if self._do_not_annotate:
+                        raise
+                    import sys
+                    info = sys.exc_info()
+                    self.syntax_dict[did] = _syntax_record(
+                        instruction['expression'])
+                    try:
+                        e = self._annotate(e, instruction)
+                    except Exception:
+                        print "Trying to annotate an exception at SIVM level led to:"
+                        import traceback
+                        print traceback.format_exc()
+                        raise e, None, info[2]
+                    finally:
+                        del self.syntax_dict[did]
+                    raise e, None, info[2]
+        return responses
+
     def forget(self, label_or_did):
         if isinstance(label_or_did,int):
             d = {'instruction':'forget','directive_id':label_or_did}
@@ -550,3 +700,6 @@ class VentureSivm(object):
     def sample(self, expression):
         d = {'instruction':'sample','expression':expression}
         return self.execute_instruction(d)
+
+def _syntax_record(exp):
+    return (exp, macro_system.expand(exp))
@@ -128,6 +128,7 @@ puma_src_files = [
     "src/mixmh.cxx",
     "src/node.cxx",
     "src/particle.cxx",
+    "src/profiler.cxx",
     "src/psp.cxx",
     "src/pytrace.cxx",
     "src/pyutils.cxx",
@@ -137,6 +138,7 @@ puma_src_files = [
     "src/sp.cxx",
     "src/sprecord.cxx",
     "src/stop_and_copy.cxx",
+    "src/thread_pool.cxx",
     "src/trace.cxx",
     "src/utils.cxx",
     "src/value.cxx",
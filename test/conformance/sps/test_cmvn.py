@@ -16,15 +16,20 @@
 # along with Venture.  If not, see <http://www.gnu.org/licenses/>.
 
 from nose import SkipTest
+from nose.tools import eq_
+import numpy as np
+import numpy.random as npr
 
 from venture.test.config import backend_name
 from venture.test.config import collectSamples
 from venture.test.config import get_ripl
+from venture.test.config import in_backend
 from venture.test.config import on_inf_prim
 from venture.test.config import skipWhenRejectionSampling
 from venture.test.config import stochasticTest
 from venture.test.stats import reportKnownMean
 from venture.test.stats import statisticalTest
+import venture.lite.cmvn as cmvn
 
 @on_inf_prim("none")
 @stochasticTest
@@ -32,6 +37,36 @@ def testCMVNSmoke(seed):
   if backend_name() != "lite": raise SkipTest("CMVN in lite only")
   get_ripl(seed=seed).predict("((make_niw_normal (array 1.0 1.0) 2 2 (matrix (array (array 1.0 0.0) (array 0.0 1.0)))))")
 
+@in_backend('none')
+@on_inf_prim('none') # Gets run in the misc build
+def testIncrementalPosterior():
+  # Incorporating and unincorporating observations one at a time
+  # should maintain the same posterior as computing it from scratch.
+  d = 3
+  m0 = np.array([1.0, -2.0, 0.5])
+  S0 = np.array([[2.0, 0.3, 0.0], [0.3, 1.5, -0.2], [0.0, -0.2, 1.0]])
+  psp = cmvn.CMVNOutputPSP(d, m0, 1.5, d + 2.0, S0)
+  aux = cmvn.CMVNSPAux(d)
+  np_rng = npr.RandomState(0)
+  xs = np_rng.normal(size=(10, d))
+  for x in xs:
+    aux.posterior_for(psp)
+    aux.incorporate(psp, x)
+  for x in xs[[3, 0, 9, 7]]:
+    aux.posterior_for(psp)
+    aux.unincorporate(psp, x)
+  posterior = aux.posterior_for(psp)
+  eq_(posterior.N, 6)
+  fresh = cmvn.CMVNPosterior.of_aux(psp, aux)
+  np.testing.assert_allclose(posterior.mN, fresh.mN)
+  np.testing.assert_allclose(posterior.L, fresh.L, atol=1e-10)
+
+  (mu, Sigma, v) = psp.getMVTParams(aux)
+  x = np.array([0.3, 0.1, -1.2])
+  np.testing.assert_allclose(
+    cmvn.mvtLogDensityCholesky(x, *posterior.mvtParams()),
+    cmvn.mvtLogDensity(x, mu, Sigma, v))
+
 @statisticalTest
 def testCMVN2D_mu1(seed):
   if backend_name() != "lite": raise SkipTest("CMVN in lite only")
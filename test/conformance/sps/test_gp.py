@@ -160,6 +160,43 @@ def testNormalParameters():
   np.testing.assert_almost_equal(actual_mu, expect_mu, decimal=4)
   np.testing.assert_almost_equal(actual_sig, expect_sig, decimal=4)
 
+@in_backend('none')
+@on_inf_prim('none') # Gets run in the misc build
+def testIncrementalCholesky():
+  # Incorporating and unincorporating points one at a time should
+  # maintain the same factor as computing it from scratch, and the
+  # cached factor should give the same predictions.
+  mean = gp.mean_const(1.)
+  covariance = cov.scale(2.1**2, cov.se(1.8**2))
+  aux = gp.GPSPAux(OrderedDict())
+  np_rng = npr.RandomState(0)
+  xs = np_rng.uniform(-5, 5, size=12)
+  for x in xs:
+    aux.cholesky_for(mean, covariance)
+    aux.incorporate(mean, covariance, x, np_rng.normal())
+  for x in xs[[3, 0, 11, 7]]:
+    aux.cholesky_for(mean, covariance)
+    aux.unincorporate(mean, covariance, x)
+  cholesky = aux.cholesky_for(mean, covariance)
+  eq_(cholesky.keys, aux.samples.keys())
+  fresh = gp.GPCholesky.of_samples(mean, covariance, aux.samples)
+  np.testing.assert_allclose(cholesky.L, fresh.L, atol=1e-10)
+
+  test_inputs = np.array([1.4, -3.2, 0.1])
+  expect_mu, expect_sig = gp._gp_mvnormal(
+    mean, covariance, aux.samples, test_inputs)
+  actual_mu, actual_sig = gp._gp_mvnormal(
+    mean, covariance, aux.samples, test_inputs, cholesky)
+  np.testing.assert_allclose(actual_mu, expect_mu)
+  np.testing.assert_allclose(actual_sig, expect_sig, atol=1e-10)
+  np.testing.assert_allclose(
+    gp._gp_logDensityOfData(mean, covariance, aux.samples, cholesky),
+    gp._gp_logDensityOfData(mean, covariance, aux.samples))
+
+  # Changing the hyperparameters invalidates the factor.
+  covariance2 = cov.scale(2.1**2, cov.se(1.8**2))
+  assert aux.cholesky_for(mean, covariance2) is not cholesky
+
 @in_backend('none')
 @statisticalTest
 @on_inf_prim('none') # Gets run in the misc build
@@ -0,0 +1,67 @@
+# Copyright (c) 2016 MIT Probabilistic Computing Project.
+#
+# This file is part of Venture.
+#
+# Venture is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Venture is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Venture.  If not, see <http://www.gnu.org/licenses/>.
+
+import numpy as np
+import numpy.random as npr
+
+from venture.test.config import in_backend
+from venture.test.config import on_inf_prim
+import venture.lite.hmm as hmm
+
+def exact_log_marginal(p0, T, O, n, os):
+  # Sum over all state sequences by the unnormalized forward recursion.
+  f = np.asarray(p0)
+  for i in range(n):
+    if i > 0:
+      f = np.dot(f, T)
+    for o in os.get(i, []):
+      f = f * O[:, o]
+  return np.log(np.sum(f))
+
+@in_backend('none')
+@on_inf_prim('none') # Gets run in the misc build
+def testIncrementalForwardFilter():
+  # Extending the cached forward messages one observation at a time
+  # should give the same marginal weight as filtering from scratch.
+  p0 = np.array([0.5, 0.3, 0.2])
+  T = np.array([[0.7, 0.2, 0.1], [0.1, 0.8, 0.1], [0.3, 0.3, 0.4]])
+  O = np.array([[0.9, 0.1], [0.4, 0.6], [0.2, 0.8]])
+  sp = hmm.UncollapsedHMMSP(p0, T, O)
+  aux = hmm.HMMSPAux()
+  np_rng = npr.RandomState(0)
+  for n in range(10):
+    aux.xs.append(hmm.npSampleVector(p0, np_rng))
+    aux.os[n] = [np_rng.randint(2)]
+    aux.invalidateFrom(n)
+    np.testing.assert_allclose(sp.forwardMarginalWeight(aux),
+      exact_log_marginal(p0, T, O, len(aux.xs), aux.os))
+    sp.forwardBackwardSample(aux, np_rng)
+  assert len(aux.filter.fs) == len(aux.xs)
+
+  # Changing an earlier observation discards the messages after it.
+  aux.os[4].append(1)
+  aux.invalidateFrom(4)
+  assert len(aux.filter.fs) == 4
+  np.testing.assert_allclose(sp.forwardMarginalWeight(aux),
+    exact_log_marginal(p0, T, O, len(aux.xs), aux.os))
+
+  # A different SP does not reuse the messages.
+  sp2 = hmm.UncollapsedHMMSP(p0, np.eye(3), O)
+  np.testing.assert_allclose(sp2.forwardMarginalWeight(aux),
+    exact_log_marginal(p0, np.eye(3), O, len(aux.xs), aux.os))
+  np.testing.assert_allclose(aux.copy().forwardFilter(sp2).log_weights,
+    aux.filter.log_weights)
@@ -0,0 +1,61 @@
+# Copyright (c) 2016 MIT Probabilistic Computing Project.
+#
+# This file is part of Venture.
+#
+# Venture is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Venture is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Venture.  If not, see <http://www.gnu.org/licenses/>.
+
+from nose import SkipTest
+from nose.tools import eq_
+from numpy.testing import assert_allclose
+import scipy.stats
+
+from venture.test.config import backend_name
+from venture.test.config import get_ripl
+from venture.test.config import on_inf_prim
+
+def log_weight(ripl):
+  return ripl.sivm.core_sivm.engine.model.log_weights[0]
+
+@on_inf_prim("none")
+def testBatchedIncorporateWeight():
+  # Incorporating many independent observations at once weights the
+  # trace by their joint likelihood.
+  if backend_name() != "lite": raise SkipTest("Batched incorporate is Lite only")
+  ripl = get_ripl()
+  ripl.assume("x", "(normal 0 1)")
+  x = ripl.sample("x")
+  vals = [0.5, 1.5, -2.0, 3.0]
+  before = log_weight(ripl)
+  ripl.bulk_observe("(normal x 1)", vals, label="obs")
+  expected = sum(scipy.stats.norm.logpdf(v, loc=x, scale=1) for v in vals)
+  assert_allclose(expected, log_weight(ripl) - before)
+  eq_(x, ripl.sample("x"))
+  for i, v in enumerate(vals):
+    eq_(v, ripl.report("obs_%d" % i))
+
+@on_inf_prim("mh")
+def testBatchedIncorporateSharedAux():
+  # Observations that share a collapsed SP's aux are propagated one
+  # at a time, leaving the aux counting each of them once.
+  if backend_name() != "lite": raise SkipTest("Batched incorporate is Lite only")
+  ripl = get_ripl()
+  ripl.assume("coin", "(make_beta_bernoulli 1 1)")
+  ripl.bulk_observe("(coin)", [True, True, False, True], label="obs")
+  ripl.infer("(resimulation_mh default one 5)")
+  eq_([True, True, False, True],
+      [ripl.report("obs_%d" % i) for i in range(4)])
+  trace = ripl.sivm.core_sivm.engine.getDistinguishedTrace().trace
+  coin = trace.globalEnv.findSymbol("coin")
+  aux = trace.madeSPAuxAt(trace.valueAt(coin).makerNode)
+  eq_([3, 1], aux.cts())
@@ -0,0 +1,69 @@
+# Copyright (c) 2016 MIT Probabilistic Computing Project.
+#
+# This file is part of Venture.
+#
+# Venture is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Venture is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Venture.  If not, see <http://www.gnu.org/licenses/>.
+
+from nose import SkipTest
+from nose.tools import eq_
+
+from venture.test.config import backend_name
+from venture.test.config import get_ripl
+from venture.test.config import on_inf_prim
+
+def lite_trace(ripl):
+  return ripl.sivm.core_sivm.engine.getDistinguishedTrace().trace
+
+def check_extents(trace, scope):
+  for block in trace.getScope(scope).keys():
+    nodes = trace.scopes[scope][block]
+    eq_(list(trace.randomChoicesInExtent(nodes, scope, block)),
+        list(trace.getNodesInBlock(scope, block)))
+
+def tagged_model(ripl):
+  ripl.assume("f", "(mem (lambda (i) (tag (quote latents) i (normal 0 1))))")
+  ripl.assume("g", "(lambda (i) (tag (quote latents) i (normal (f i) 1)))")
+  for i in range(3):
+    ripl.observe("(normal (g %d) 1)" % i, 1)
+
+@on_inf_prim("mh")
+def testBlockExtentCacheFixedStructure():
+  # Inference that leaves the structure of the trace alone keeps the
+  # cached extents, and they agree with walking the extent afresh.
+  if backend_name() != "lite": raise SkipTest("Extent cache is Lite only")
+  ripl = get_ripl()
+  tagged_model(ripl)
+  ripl.infer("(resimulation_mh (quote latents) one 5)")
+  trace = lite_trace(ripl)
+  key = trace.extentKey()
+  ripl.infer("(resimulation_mh (quote latents) one 20)")
+  eq_(key, trace.extentKey())
+  check_extents(trace, "latents")
+
+@on_inf_prim("mh")
+def testBlockExtentCacheInvalidation():
+  # Constraining a choice in a block removes it from the extent.
+  if backend_name() != "lite": raise SkipTest("Extent cache is Lite only")
+  ripl = get_ripl()
+  tagged_model(ripl)
+  ripl.infer("(resimulation_mh (quote latents) one 5)")
+  trace = lite_trace(ripl)
+  block = trace.getScope("latents").keys()[0]
+  before = trace.numNodesInBlock("latents", block)
+  key = trace.extentKey()
+  ripl.observe("(f %s)" % int(block.getNumber()), 0.5)
+  ripl.infer("(incorporate)")
+  assert key != trace.extentKey()
+  eq_(before - 1, trace.numNodesInBlock("latents", block))
+  check_extents(trace, "latents")
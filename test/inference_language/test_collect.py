@@ -16,11 +16,17 @@
 # along with Venture.  If not, see <http://www.gnu.org/licenses/>.
 
 from StringIO import StringIO
+import os
+import pickle
 import re
+import shutil
 import sys
+import tempfile
 
 import scipy.stats as stats
 
+from nose.tools import eq_
+
 from venture.lite.psp import LikelihoodFreePSP
 from venture.lite.sp_help import typed_nr
 from venture.test.config import default_num_samples
@@ -139,6 +145,64 @@ def testCollectLogScore():
   [infer (collect x)]'''
   ripl.execute_program(prog)
 
+@on_inf_prim("collect")
+def testCollectIterCounts():
+  ripl = get_ripl()
+  ripl.infer("(resample 2)")
+  ripl.assume("x", "(normal 0 1)")
+  out = ripl.infer("""
+(let ((d (empty)))
+  (do (repeat 3 (bind (collect x (labelled (list 1 2) pair)) (curry into d)))
+      (return d)))""")
+  result = out.asPandas()
+  eq_([1, 1, 2, 2, 3, 3], list(result["iter"]))
+  eq_([0, 1, 0, 1, 0, 1], list(result["prt. id"]))
+  eq_([[1, 2]] * 6, [list(p) for p in result["pair"]])
+  merged = out.merge(out).asPandas()
+  eq_([1, 1, 2, 2, 3, 3, 4, 4, 5, 5, 6, 6], list(merged["iter"]))
+  eq_(6, len(out.asPandas()))
+
+@on_inf_prim("collect")
+def testCollectSpill():
+  ripl = get_ripl()
+  ripl.assume("x", "(normal 0 1)")
+  spill_dir = tempfile.mkdtemp()
+  try:
+    out = ripl.infer("""
+(let ((d (empty "%s")))
+  (do (repeat 40 (bind (collect x) (curry into d)))
+      (return d)))""" % spill_dir)
+    assert os.listdir(spill_dir)
+    result = out.asPandas()
+    eq_(range(1, 41), list(result["iter"]))
+    eq_(40, len(result["x"]))
+    del out
+  finally:
+    shutil.rmtree(spill_dir)
+
+@on_inf_prim("collect")
+def testCollectSpillPickle():
+  # A pickled copy of a spilled dataset has files of its own, and can
+  # go on growing after the original is gone.
+  ripl = get_ripl()
+  ripl.assume("x", "(normal 0 1)")
+  spill_dir = tempfile.mkdtemp()
+  try:
+    out = ripl.infer("""
+(let ((d (empty "%s")))
+  (do (repeat 20 (bind (collect x) (curry into d)))
+      (return d)))""" % spill_dir)
+    files = set(os.listdir(spill_dir))
+    copied = pickle.loads(pickle.dumps(out))
+    eq_(list(out.asPandas()["x"]), list(copied.asPandas()["x"]))
+    assert set(os.listdir(spill_dir)) > files
+    del out
+    copied.merge_bang(copied.merge(copied))
+    eq_(60, len(copied.asPandas()["x"]))
+    del copied
+  finally:
+    shutil.rmtree(spill_dir)
+
 def make_pattern():
   iteration = r".*x.*foo.*\n.*2.1.*3.1.*\n.*2.1.*3.1.*"
   return re.compile(iteration + iteration, re.DOTALL)
@@ -0,0 +1,60 @@
+# Copyright (c) 2016 MIT Probabilistic Computing Project.
+#
+# This file is part of Venture.
+#
+# Venture is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Venture is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Venture.  If not, see <http://www.gnu.org/licenses/>.
+
+from nose.tools import eq_
+from nose.tools import assert_raises
+
+from venture.exception import VentureException
+from venture.test.config import get_ripl
+from venture.test.config import on_inf_prim
+
+programs = [
+  "(+ 1 2)",
+  "(let ((f (lambda (x) (* x x)))) (f 5))",
+  "(do (x <- (return 3)) (return (+ x 1)))",
+  "(first (list (if (< 1 2) 4 5) 6))",
+  "(letrec ((fact (lambda (n) (if (= n 0) 1 (* n (fact (- n 1))))))) (fact 5))",
+]
+
+@on_inf_prim("none")
+def testCompiledAgreesWithInterpreted():
+  r = get_ripl()
+  infer_trace = r.sivm.core_sivm.engine.infer_trace
+  assert infer_trace.compile_programs
+  for program in programs:
+    infer_trace.compile_programs = True
+    compiled = r.evaluate(program)
+    infer_trace.compile_programs = False
+    interpreted = r.evaluate(program)
+    eq_(interpreted, compiled)
+
+@on_inf_prim("none")
+def testCompiledErrorsAnnotated():
+  r = get_ripl()
+  with assert_raises(VentureException) as cm:
+    r.evaluate("(+ 1 (no_such_procedure 2))")
+  eq_("evaluation", cm.exception.exception)
+
+@on_inf_prim("none")
+def testRepeatedInferCompilesOnce():
+  r = get_ripl()
+  engine = r.sivm.core_sivm.engine
+  program = r._ensure_parsed_expression("(return (+ 1 2))")
+  engine.infer(program)
+  cached = dict(engine.infer_trace.compiled_programs)
+  engine.infer(program)
+  eq_(cached, engine.infer_trace.compiled_programs)
@@ -109,3 +109,43 @@ def testHitsOneParticle():
     (on_particle 0 (force x 0))
     (on_particle 1 (force x 1)))""")
   eq_([0, 1], ripl.sample_all("x"))
+
+@gen_on_inf_prim("for_each_particle")
+def testForEachParticleInWorkers():
+  for mode in ["_threaded", "_thread_ser", "_multiprocess"]:
+    yield checkForEachParticleInWorkers, mode
+
+def checkForEachParticleInWorkers(mode):
+  # In parallel modes, actions asked to run in the workers do so, and
+  # the workers keep their traces.
+  ripl = get_ripl()
+  ripl.assume("x", "(normal 0 1)")
+  ripl.infer("(resample%s 4)" % (mode,))
+  pool = ripl.sivm.core_sivm.engine.model.traces
+  ripl.observe("(normal x 1)", 2)
+  ripl.infer("(for_each_particle (resimulation_mh default one 3) true)")
+  ripl.infer("(on_particle 2 (likelihood_weight) true)")
+  assert ripl.sivm.core_sivm.engine.model.traces is pool
+  eq_(4, len(ripl.sample_all("x")))
+  eq_(4, len(ripl.infer("(particle_log_weights)")))
+
+@gen_on_inf_prim("for_each_particle")
+def testCallbackInWorkers():
+  for mode in ["_threaded", "_thread_ser", "_multiprocess"]:
+    yield checkCallbackInWorkers, mode
+
+def checkCallbackInWorkers(mode):
+  # A callback would run in the worker, out of the caller's sight, so
+  # it is refused there, but still works in particles run here.
+  calls = []
+  ripl = get_ripl()
+  ripl.bind_callback("record", lambda _inferrer: calls.append(1))
+  ripl.infer("(resample%s 2)" % (mode,))
+  with assert_raises(Exception):
+    ripl.infer("(for_each_particle (call_back record) true)")
+  with assert_raises(Exception):
+    ripl.infer("(on_particle 0 (call_back record) true)")
+  eq_([], calls)
+  ripl.infer("(for_each_particle (call_back record))")
+  ripl.infer("(on_particle 0 (call_back record))")
+  eq_([1, 1, 1], calls)
@@ -47,6 +47,35 @@ def testNormalWithObserve1(seed):
   predictions = collectSamples(ripl,"pid",infer="(hmc default one 0.05 20 10)")
   return reportKnownGaussian(12, math.sqrt(0.5), predictions)
 
+@broken_in('puma', "HMC only implemented in Lite.  Issue: https://app.asana.com/0/11192551635048/9277449877754")
+@statisticalTest
+@on_inf_prim("adaptive_hmc")
+def testNormalWithObserveAdaptive(seed):
+  # The same posterior, leaving the step size to warm-up
+  ripl = get_ripl(seed=seed)
+  ripl.assume("a", "(normal 10.0 1.0)", label="pid")
+  ripl.observe("(normal a 1.0)", 14.0)
+  predictions = collectSamples(ripl,"pid",infer="(adaptive_hmc default all 10 20 30)")
+  return reportKnownGaussian(12, math.sqrt(0.5), predictions)
+
+@broken_in('puma', "HMC only implemented in Lite.  Issue: https://app.asana.com/0/11192551635048/9277449877754")
+@on_inf_prim("adaptive_hmc")
+def testAdaptiveHMCWarmupPersists():
+  # Warm-up continues across invocations, and is not repeated.
+  ripl = get_ripl()
+  ripl.assume("a", "(normal 10.0 1.0)")
+  ripl.observe("(normal a 1.0)", 14.0)
+  trace = ripl.sivm.core_sivm.engine.getDistinguishedTrace().trace
+  ripl.infer("(adaptive_hmc default all 5 10 4)")
+  [adaptation] = trace.hmcAdaptations.values()
+  assert adaptation.warming_up()
+  ripl.infer("(adaptive_hmc default all 5 10 6)")
+  assert not adaptation.warming_up()
+  epsilon = adaptation.epsilon
+  ripl.infer("(adaptive_hmc default all 5 10 5)")
+  assert trace.hmcAdaptations.values() == [adaptation]
+  assert epsilon == adaptation.epsilon
+
 @gen_on_inf_prim("mh")
 def testMVGaussSmokeMH():
   yield checkMVGaussSmoke, "(resimulation_mh default one 1)"
@@ -56,6 +85,11 @@ def testMVGaussSmokeMH():
 def testMVGaussSmokeHMC():
   yield checkMVGaussSmoke, "(hmc default one 0.05 20 10)"
 
+@gen_broken_in('puma', "HMC only implemented in Lite.  Issue: https://app.asana.com/0/11192551635048/9277449877754")
+@gen_on_inf_prim("adaptive_hmc")
+def testMVGaussSmokeAdaptiveHMC():
+  yield checkMVGaussSmoke, "(adaptive_hmc default one 10 20 30)"
+
 @statisticalTest
 def checkMVGaussSmoke(infer, seed):
   # Confirm that projecting a multivariate Gaussian to one dimension
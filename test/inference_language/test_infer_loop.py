@@ -120,3 +120,39 @@ def testCrashStopsInferLoop():
   finally:
     ripl.stop_continuous_inference() # Don't want to leave active threads lying around
   eq_(1, ripl.infer('(pyeval "v.VentureNumber(loop_thread_start_count)")'))
+
+@on_inf_prim("loop")
+def testSnapshotReads():
+  ripl = get_ripl()
+  ripl.assume("x", "(normal 0 1)")
+  engine = ripl.sivm.core_sivm.engine
+  try:
+    # A long interval means only the first snapshot is ever published
+    ripl.start_continuous_inference("(resimulation_mh default one 1)",
+                                    publish=["x"], publish_trace=True,
+                                    interval=1000)
+    while engine.continuous_inference_snapshot() is None:
+      time.sleep(0.00001) # Yield to give CI a chance to publish
+    v = ripl.report("x")
+    time.sleep(0.00001) # Yield to give CI a chance to work
+    eq_(v, ripl.report("x"))
+    eq_(v, ripl.sample("x"))
+    eq_(True, ripl.continuous_inference_status()['running'])
+    eq_([engine.get_directive_id("x")],
+        ripl.continuous_inference_status()['snapshots']['directive_ids'])
+  finally:
+    ripl.stop_continuous_inference() # Don't want to leave active threads lying around
+  eq_(None, engine.continuous_inference_snapshot())
+
+@on_inf_prim("loop")
+@flaky # Because sometimes it doesn't wait long enough for the other thread to go
+def testStaleSnapshotsAreNotRead():
+  ripl = get_ripl()
+  ripl.assume("x", "(normal 0 1)")
+  try:
+    ripl.start_continuous_inference("(resimulation_mh default one 1)",
+                                    publish_trace=True, interval=1000,
+                                    max_staleness=0)
+    assertInferring(ripl)
+  finally:
+    ripl.stop_continuous_inference() # Don't want to leave active threads lying around
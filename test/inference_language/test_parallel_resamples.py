@@ -88,3 +88,51 @@ def testSerializingTracesWithRandomSPs():
   r.infer("(resample_serializing 2)")
   r.assume("foo", "(categorical (simplex 0.5 0.5) (array (lambda () 1) (lambda () 2)))")
   r.infer("(resample_serializing 2)")
+
+@gen_on_inf_prim("resample")
+def testResamplingKeepsWorkers():
+  for mode in ["", "_serializing", "_threaded", "_thread_ser", "_multiprocess"]:
+    yield checkResamplingKeepsWorkers, mode
+
+def checkResamplingKeepsWorkers(mode):
+  # Resampling again in the same mode reuses the worker pool, and
+  # every new particle is a copy of one of the old ones.
+  r = get_ripl()
+  r.assume("x", "(normal 0 1)")
+  r.infer("(resample%s 6)" % (mode,))
+  r.infer("(likelihood_weight)")
+  model = r.sivm.core_sivm.engine.model
+  pool = model.traces
+  xs = r.sample_all("x")
+  eq_(6, len(set(xs)))
+  r.observe("(normal x 1)", 2)
+  r.infer("(incorporate)")
+  r.infer("(resample%s 6)" % (mode,))
+  assert model.traces is pool
+  new_xs = r.sample_all("x")
+  eq_(6, len(new_xs))
+  assert set(new_xs) <= set(xs)
+  # The copies are independent of one another.
+  r.infer("(resimulation_mh default one 5)")
+  r.infer("(on_particle 2 (resimulation_mh default one 5))")
+  assert model.traces is pool
+  eq_(6, len(r.sample_all("x")))
+
+@on_inf_prim("resample")
+def testResampleSchemes():
+  for scheme in ["multinomial", "stratified", "systematic", "residual"]:
+    r = get_ripl()
+    r.infer("(resample 4 (quote %s))" % scheme)
+    eq_(4, r.sivm.core_sivm.engine.num_traces())
+
+@on_inf_prim("resample")
+def testResampleIfNeeded():
+  r = get_ripl()
+  r.infer("(resample 4)")
+  # Even weights: the effective sample size is the particle count.
+  eq_(False, r.sivm.core_sivm.engine.resample_if_needed(2))
+  eq_(4, r.sivm.core_sivm.engine.num_traces())
+  r.sivm.core_sivm.engine.model.log_weights = [0, float("-inf"),
+                                               float("-inf"), float("-inf")]
+  r.infer("(resample_if_needed 2)")
+  eq_(2, r.sivm.core_sivm.engine.num_traces())
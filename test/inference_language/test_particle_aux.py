@@ -0,0 +1,65 @@
+# Copyright (c) 2016 MIT Probabilistic Computing Project.
+#
+# This file is part of Venture.
+#
+# Venture is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Venture is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Venture.  If not, see <http://www.gnu.org/licenses/>.
+
+from nose import SkipTest
+from nose.tools import eq_
+
+from venture.lite.particle import Particle
+from venture.test.config import backend_name
+from venture.test.config import get_ripl
+from venture.test.config import on_inf_prim
+
+@on_inf_prim("none")
+def testParticleAuxCopyOnWrite():
+  if backend_name() != "lite": raise SkipTest("Particles are Lite only")
+  ripl = get_ripl()
+  ripl.assume("crp", "(make_crp 1)")
+  for _ in range(5):
+    ripl.predict("(crp)")
+  trace = ripl.sivm.core_sivm.engine.getDistinguishedTrace().trace
+  maker = trace.valueAt(trace.globalEnv.findSymbol("crp")).makerNode
+  base_aux = trace.madeSPAuxAt(maker)
+
+  parent = Particle(trace)
+  parent_aux = parent.madeSPAuxAt(maker)
+  assert parent_aux is not base_aux
+  assert parent_aux is parent.madeSPAuxAt(maker)
+
+  # Forking shares the auxes until one of the particles asks for one
+  child = Particle(parent)
+  assert child.madeSPAuxs is parent.madeSPAuxs
+  child_aux = child.madeSPAuxAt(maker)
+  assert child_aux is not parent_aux
+  child_aux.numCustomers += 1
+  eq_(base_aux.numCustomers, parent.madeSPAuxAt(maker).numCustomers)
+  eq_(base_aux.numCustomers + 1, child.madeSPAuxAt(maker).numCustomers)
+
+@on_inf_prim("func_pgibbs")
+def testFuncPGibbsCRPAux():
+  # The aux the committed particle leaves behind must account for
+  # every customer exactly once.
+  if backend_name() != "lite": raise SkipTest("Particles are Lite only")
+  ripl = get_ripl()
+  ripl.assume("crp", "(make_crp 1)")
+  for i in range(4):
+    ripl.predict("(tag 'c %d (crp))" % i)
+  ripl.infer("(func_pgibbs 'c ordered 3 2)")
+  trace = ripl.sivm.core_sivm.engine.getDistinguishedTrace().trace
+  maker = trace.valueAt(trace.globalEnv.findSymbol("crp")).makerNode
+  aux = trace.madeSPAuxAt(maker)
+  eq_(4, aux.numCustomers)
+  eq_(4, sum(aux.tableCounts.values()))
@@ -0,0 +1,57 @@
+# Copyright (c) 2016 MIT Probabilistic Computing Project.
+#
+# This file is part of Venture.
+#
+# Venture is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Venture is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Venture.  If not, see <http://www.gnu.org/licenses/>.
+
+from nose import SkipTest
+from nose.tools import eq_
+
+from venture.test.config import backend_name
+from venture.test.config import get_ripl
+from venture.test.config import on_inf_prim
+
+def lite_trace(ripl):
+  return ripl.sivm.core_sivm.engine.getDistinguishedTrace().trace
+
+@on_inf_prim("mh")
+def testScaffoldCacheFixedStructure():
+  # Resimulation MH on a model whose structure does not change should
+  # construct each block's scaffold only once.
+  if backend_name() != "lite": raise SkipTest("Scaffold cache is Lite only")
+  ripl = get_ripl()
+  ripl.assume("f", "(lambda (m) (normal m 1))")
+  ripl.assume("x", "(normal 0 1)")
+  ripl.assume("y", "(f x)")
+  ripl.observe("(f y)", 2)
+  ripl.infer("(resimulation_mh default one 10)")
+  trace = lite_trace(ripl)
+  key = trace.structureKey()
+  ripl.infer("(resimulation_mh default one 50)")
+  eq_(key, trace.structureKey())
+  eq_(2, len(trace.scaffoldCache.entries))
+
+@on_inf_prim("mh")
+def testScaffoldCacheInvalidation():
+  # Changing the structure of the trace discards the cached scaffolds.
+  if backend_name() != "lite": raise SkipTest("Scaffold cache is Lite only")
+  ripl = get_ripl()
+  ripl.assume("x", "(normal 0 1)")
+  ripl.infer("(resimulation_mh default one 5)")
+  trace = lite_trace(ripl)
+  key = trace.structureKey()
+  ripl.assume("y", "(normal x 1)")
+  assert key != trace.structureKey()
+  ripl.infer("(resimulation_mh default one 5)")
+  eq_(2, len(trace.scaffoldCache.entries))
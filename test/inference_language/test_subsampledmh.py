@@ -19,7 +19,11 @@ import numpy as np
 import scipy.stats as stats
 from nose.plugins.attrib import attr
 
+from venture.lite.infer.subsampled_mh import SubsampledBlockScaffoldIndexer
+from venture.lite.infer.subsampled_mh import sequentialBatchTest
 from venture.lite.infer.subsampled_mh import sequentialTest
+from venture.lite.orderedset import OrderedSet
+from venture.lite.scaffold import constructScaffold
 from venture.test.config import broken_in
 from venture.test.config import collectSamples
 from venture.test.config import get_ripl
@@ -59,6 +63,42 @@ def testSequentialTest():
     assert n == ns_expect[i]
     assert abs(tstat - tstats_expect[i]) < 1e-5
 
+@in_backend("none")
+def testSequentialBatchTest():
+  # Minibatches are requested whole and in order, and agree with the
+  # one-at-a-time interface.
+  ys = [0.3, -0.1, 0.5, 0.2, -0.4, 0.6, 0.1, 0.0, 0.2]
+  batches = []
+  def dllh_batch(start, end):
+    batches.append((start, end))
+    return ys[start:end]
+  ans = sequentialBatchTest(0.05, 2, 4, len(ys), 0, dllh_batch)
+  assert batches == [(0, 4), (4, 8), (8, 9)]
+  assert ans == sequentialTest(0.05, 2, 4, len(ys), 0, lambda j: ys[j])
+
+@broken_in('puma', "Subsampled MH only implemented in Lite.")
+@on_inf_prim("subsampled_mh")
+def testLocalSectionTemplates():
+  # The scaffolds of identical local sections are built from one
+  # template, and agree with constructing them afresh.
+  ripl = get_ripl()
+  ripl.assume("mu", "(normal 10.0 3.0)")
+  for i in range(5):
+    ripl.observe("(normal (+ mu 0) 1.0)", 10 + i)
+  trace = ripl.sivm.core_sivm.engine.getDistinguishedTrace().trace
+  indexer = SubsampledBlockScaffoldIndexer("default", "one")
+  global_index = indexer.sampleGlobalIndex(trace)
+  assert len(global_index.local_roots) == 5
+  for local_root in global_index.local_roots:
+    local_index = indexer.sampleLocalIndex(
+      trace, local_root, global_index.globalBorder)
+    expected = constructScaffold(trace, [OrderedSet([local_root])])
+    assert local_index.regenCounts == expected.regenCounts
+    assert list(local_index.absorbing) == list(expected.absorbing)
+    assert local_index.border == expected.border
+    assert list(local_index.drg) == list(expected.drg)
+  assert [1] == [len(ts) for ts in indexer.localTemplates.values()]
+
 # In the following two tests, the sample distribution is an approximation to
 # cdf with the accuracy controlled by epsilon, the fifth argument.
 @attr('slow')
@@ -81,12 +121,24 @@ def testNormalWithObserves2(seed):
   predictions = collectSamples(ripl,"pid",infer="(subsampled_mh default one 2 3 0.01 true %f false 50)" % post_std)
   return reportKnownContinuous(cdf, predictions, "N(%f,%f^2)" % (post_mean, post_std))
 
-def setupNormalWithObserves(N, sigma, seed):
+@attr('slow')
+@broken_in('puma', "Subsampled MH only implemented in Lite.")
+@statisticalTest
+@on_inf_prim("subsampled_mh")
+def testNormalWithObservesThroughDeterministic(seed):
+  # The local sections run through a deterministic application before
+  # reaching the observations, and are still evaluated in batches.
+  ripl, post_mean, post_std, cdf = setupNormalWithObserves(
+    100, 3.0, seed, "(normal (+ mu 0) 1.0)")
+  predictions = collectSamples(ripl,"pid",infer="(subsampled_mh default one 10 3 0.01 false 0 false 50)")
+  return reportKnownContinuous(cdf, predictions, "N(%f,%f^2)" % (post_mean, post_std))
+
+def setupNormalWithObserves(N, sigma, seed, observation="(normal mu 1.0)"):
   ripl = get_ripl(seed=seed)
   ripl.assume("mu", "(normal 10.0 %f)" % sigma, label="pid")
   x = np.random.normal(10,1,N)
   for i in range(len(x)):
-    ripl.observe("(normal mu 1.0)", x[i])
+    ripl.observe(observation, x[i])
 
   sigma2 = sigma**2
   post_mean = (sigma2 * sum(x) + 10.0) / float(sigma2 * N + 1.0)
@@ -15,12 +15,10 @@
 # You should have received a copy of the GNU General Public License
 # along with Venture.  If not, see <http://www.gnu.org/licenses/>.
 
-from venture.test.config import broken_in
 from venture.test.config import get_ripl
 from venture.test.config import on_inf_prim
 
 @on_inf_prim("none")
-@broken_in("puma", "Puma does not support proposal profiling.")
 def testProfilerSmoke():
   ripl = get_ripl()
   ripl.execute_program("""
@@ -39,3 +37,20 @@ def testProfilerSmoke():
   data = ripl.profile_data()
 
   assert len(data) == 11
+
+@on_inf_prim("none")
+def testProfilerOperators():
+  ripl = get_ripl()
+  ripl.assume('x', '(tag (quote x) 0 (flip 0.5))')
+  ripl.observe('(flip (if x 0.9 0.1))', True)
+  ripl.profiler_enable()
+  ripl.infer('(resimulation_mh default one 3)')
+  ripl.infer("(gibbs 'x one 1)")
+  ripl.profiler_disable()
+  ripl.infer('(resimulation_mh default one 3)')
+
+  data = ripl.profile_data()
+
+  assert list(data.operator) == ["resimulation MH"] * 3 + ["enumerative gibbs"]
+  assert all(accepted in [True, False] for accepted in data.accepted)
+  assert all(time >= 0 for time in data.time)
@@ -71,3 +71,35 @@ def test_profiling_likelihoodfree():
   [INFER (resimulation_mh default one 10)]'''
   ripl.profiler_enable()
   ripl.execute_program(prog)
+
+@broken_in('puma', "Phase profiling only implemented for Lite")
+@on_inf_prim("none") # Does not test inference quality of anything
+def test_phase_profiling():
+  ripl = get_ripl()
+  ripl.assume('mu', '(normal 0 1)')
+  for i in range(3):
+    ripl.observe('(normal mu 1)', i)
+  ripl.phase_profiler_enable()
+  ripl.infer('(resimulation_mh default one 10)')
+  ripl.phase_profiler_disable()
+  ripl.infer('(resimulation_mh default one 10)')
+
+  data = ripl.profile_data(phases=True)
+  times = data[data.category == 'time'].set_index('name')
+  assert times.loc['scaffold', 'count'] == 10
+  assert times.loc['detach', 'count'] == 10
+  assert times.loc['regen', 'count'] == 10
+  accepts = times['count'].get('accept', 0)
+  rejects = times['count'].get('reject', 0)
+  assert accepts + rejects == 10
+  sizes = data[data.category == 'size'].set_index('name')
+  # Each observation absorbs at both its output node and the request
+  # node of its (request-free) SP
+  assert sizes.loc['absorbing', 'max'] == 6
+  calls = data[data.category == 'psp']
+  absorbs = calls[calls.operation == 'absorb']
+  requests = absorbs[absorbs.name == 'NullRequestPSP']
+  # Once for each absorbing node on each proposal, and again on each
+  # rejection
+  assert requests['count'].sum() == 3 * (10 + rejects)
+  assert absorbs['count'].sum() == 6 * (10 + rejects)
@@ -21,6 +21,7 @@ import math
 import random
 
 import numpy.random as npr
+from numpy.testing import assert_allclose
 
 from nose.tools import eq_
 from venture.test.flaky import flaky
@@ -243,3 +244,27 @@ def propDeterministicWhenFixed(args_lists, name, sp):
     with randomness:
       answer_ = simulate_fully_uncurried(name, sp, args_lists, py_rng, np_rng)
       eq_(answer, answer_)
+
+@gen_in_backend("none")
+def testLogDensityBatch():
+  for (name,sp) in relevantSPs():
+    if sp.outputPSP.canBatchLogDensity():
+      yield checkLogDensityBatch, name, sp
+
+def checkLogDensityBatch(name, sp):
+  # Several applications, each with its own arguments and value
+  sp_type = sp.venture_type()
+  checkTypedProperty(propLogDensityBatch,
+    [[sp_args_type(sp_type), final_return_type(sp_type)] for _ in range(4)],
+    name, sp)
+
+def propLogDensityBatch(applications, _name, sp):
+  aux = carefully(sp.constructSPAux)
+  values = [value for (_, value) in applications]
+  argsList = [MockArgs(args, aux) for (args, _) in applications]
+  expected = [carefully(sp.outputPSP.logDensity, value, args)
+              for (value, args) in zip(values, argsList)]
+  if any(math.isnan(w) for w in expected):
+    raise ArgumentsNotAppropriate("Log density turned out to be NaN")
+  answer = carefully(sp.outputPSP.logDensityBatch, values, argsList)
+  assert_allclose(expected, answer)
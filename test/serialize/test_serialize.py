@@ -312,3 +312,88 @@ def check_foreign_sp(mode):
     # Make sure that the restored trace still has the foreign SP's
     eq_(v.sample('(test_binomial 1 1)'), test_binomial_result)
     eq_(v.sample('(test_sym_dir_cat 1 1)'), test_sym_dir_result)
+
+@on_inf_prim("mh")
+def test_copy_independence():
+    v = get_ripl()
+    v.assume('x', '(normal 0 1)', label='x')
+    v.observe('(normal x 1)', 2)
+    v.infer('(incorporate)')
+    engine = v.sivm.core_sivm.engine
+    did = engine.model.get_directive_id('x')
+    trace1 = engine.getDistinguishedTrace()
+    before = trace1.report_value(did)
+    trace2 = engine.model.copy_trace(trace1)
+    engine.model.create_trace_pool([trace2])
+    v.infer('(resimulation_mh default one 20)')
+    assert trace2.report_value(did) != before
+    eq_(before, trace1.report_value(did))
+    if hasattr(trace1.trace, 'checkInvariants'):
+        trace1.trace.checkInvariants()
+        trace2.trace.checkInvariants()
+
+@on_inf_prim("none")
+def test_copy_long_chain():
+    # Copying must not recurse along chains of nodes
+    v = get_ripl()
+    v.assume('x0', '(normal 0 1)')
+    for i in range(1, 2000):
+        v.assume('x%d' % i, '(normal x%d 1)' % (i - 1))
+    engine = v.sivm.core_sivm.engine
+    trace1 = engine.getDistinguishedTrace()
+    trace2 = engine.model.copy_trace(trace1)
+    eq_(trace1.dids(), trace2.dids())
+
+@on_inf_prim("none")
+def test_serialize_snapshot():
+    # All the particles of a model round-trip through the binary
+    # snapshot, with and without compression.
+    v = get_ripl()
+    v.infer('(resample 3)')
+    v.assume('x', '(normal 0 1)')
+    v.assume('n', '(poisson 4)')
+    v.assume('b', '(flip)')
+    v.assume('s', '(categorical (simplex 0.5 0.5) (array (quote a) (quote b)))')
+    v.assume('xs', '(array (normal 0 1) (normal 0 1))')
+    v.observe('(normal x 1)', 2)
+    v.infer('(incorporate)')
+    engine = v.sivm.core_sivm.engine
+    expected = [v.sample_all(name) for name in ['x', 'n', 'b', 's', 'xs']]
+    weights = list(engine.model.log_weights)
+    for compress in [False, True]:
+        string = v.saves(compress=compress)
+        v2 = get_ripl()
+        v2.loads(string)
+        eq_(expected, [v2.sample_all(name) for name in ['x', 'n', 'b', 's', 'xs']])
+        eq_(weights, list(v2.sivm.core_sivm.engine.model.log_weights))
+
+@on_inf_prim("none")
+def test_snapshot_streams_traces():
+    # Saving dumps the traces one at a time rather than all up front.
+    v = get_ripl()
+    v.assume('x', '(normal 0 1)')
+    v.infer('(resample 3)')
+    model = v.sivm.core_sivm.engine.model
+    def all_at_once():
+        assert False, "Saving should not dump every trace at once"
+    model.retrieve_dumps = all_at_once
+    v2 = get_ripl()
+    v2.loads(v.saves())
+    eq_(v.sample_all('x'), v2.sample_all('x'))
+
+@on_inf_prim("none")
+def test_load_pickled_model():
+    # Models saved in the pickle format before snapshots still load.
+    import cPickle
+    v = get_ripl()
+    v.assume('x', '(normal 0 1)', label='x')
+    engine = v.sivm.core_sivm.engine
+    data = engine.model.saveable()
+    data['directiveCounter'] = engine.directiveCounter
+    data['extra'] = {'marker': 1}
+    string = cPickle.dumps((data, '0.2'))
+    engine2 = get_ripl().sivm.core_sivm.engine
+    eq_({'marker': 1}, engine2.loads(string))
+    did = engine.model.get_directive_id('x')
+    eq_(engine.getDistinguishedTrace().report_value(did),
+        engine2.getDistinguishedTrace().report_value(did))
@@ -15,8 +15,11 @@
 # You should have received a copy of the GNU General Public License
 # along with Venture.  If not, see <http://www.gnu.org/licenses/>.
 
+from nose.tools import assert_raises
 from nose.tools import eq_
+import numpy as np
 
+from venture.exception import VentureException
 from venture.test.config import get_ripl
 from venture.test.config import on_inf_prim
 
@@ -31,3 +34,41 @@ def testBulkObserve1():
   eq_(ripl.report("pid_2"),33)
   n_after = len(ripl.list_directives())
   eq_(n_after, n_before + 3)
+
+@on_inf_prim("none")
+def testBulkObserveNumpy():
+  ripl = get_ripl()
+  n_before = len(ripl.list_directives())
+  data = np.array([[0, 1, 0.5], [2, 3, 2.5], [4, 5, 4.5]])
+  dids = ripl.observe_dataset("uniform_continuous", data, label="u")
+  eq_(len(dids), 3)
+  eq_(ripl.report("u_1"), 2.5)
+  eq_(len(ripl.list_directives()), n_before + 3)
+  ripl.forget("u_0")
+  eq_(len(ripl.list_directives()), n_before + 2)
+
+@on_inf_prim("none")
+def testBulkObserveSameExpression():
+  ripl = get_ripl()
+  ripl.assume("x", "(normal 0 1)")
+  dids = ripl.bulk_observe("(normal x 1)", [1, 2, 3], label="obs")
+  eq_(len(dids), 3)
+  eq_(ripl.report("obs_2"), 3)
+
+@on_inf_prim("none")
+def testBulkObserveFailureLeavesNothing():
+  # A row that cannot be evaluated aborts the whole batch, including
+  # the rows before it.
+  ripl = get_ripl()
+  ripl.assume("x", "(normal 0 1)")
+  n_before = len(ripl.list_directives())
+  n_recorded = len(ripl.directive_id_to_stringable_instruction)
+  with assert_raises(VentureException):
+    ripl.observe_dataset("normal", [(0, 1, 0.5), (0, 1, 2, 0.5), (0, 1, 1.5)],
+                         label="bad")
+  eq_(len(ripl.list_directives()), n_before)
+  eq_(n_recorded, len(ripl.directive_id_to_stringable_instruction))
+  ripl.infer(1)
+  dids = ripl.observe_dataset("normal", [(0, 1, 0.5)], label="good")
+  eq_(len(dids), 1)
+  eq_(len(ripl.list_directives()), n_before + 1)
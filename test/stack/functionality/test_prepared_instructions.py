@@ -0,0 +1,77 @@
+# Copyright (c) 2014, 2015 MIT Probabilistic Computing Project.
+#
+# This file is part of Venture.
+#
+# Venture is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Venture is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Venture.  If not, see <http://www.gnu.org/licenses/>.
+
+from nose.tools import assert_raises
+from nose.tools import eq_
+
+from venture.exception import VentureException
+from venture.sivm import macro_system
+from venture.test.config import get_ripl
+from venture.test.config import on_inf_prim
+from venture.test.errors import assert_ripl_annotation_succeeds
+import venture.value.dicts as v
+
+def prepare(ripl, instruction, expression, **fields):
+  parsed = ripl._ensure_parsed_expression(expression)
+  ans = {'instruction':instruction,
+         'expression':macro_system.expand(parsed).desugared()}
+  for (key, val) in fields.iteritems():
+    ans[key] = val
+  return ans
+
+@on_inf_prim("none")
+def testPreparedDirectives():
+  ripl = get_ripl()
+  n_before = len(ripl.list_directives())
+  dids = ripl.execute_prepared([
+    prepare(ripl, 'labeled_assume', '(normal 0 1)',
+            symbol=v.symbol('x'), label=v.symbol('x')),
+    prepare(ripl, 'observe', '(normal x 1)', value=v.number(2)),
+    prepare(ripl, 'labeled_predict', '(+ x 1)', label=v.symbol('y')),
+  ])
+  eq_(3, len(dids))
+  eq_(n_before + 3, len(ripl.list_directives()))
+  eq_(ripl.report('x') + 1, ripl.report('y'))
+  eq_(2, ripl.report(dids[1]))
+
+@on_inf_prim("none")
+def testPreparedDirectiveErrorsAnnotated():
+  ripl = get_ripl()
+  ripl.execute_prepared([
+    prepare(ripl, 'assume', '(lambda (x) (+ x (no_such_symbol)))',
+            symbol=v.symbol('f'))])
+  # The error's stack trace passes through the prepared directive,
+  # whose syntax is only recorded at this point.
+  assert_ripl_annotation_succeeds(ripl.predict, '(f 1)')
+  assert_ripl_annotation_succeeds(ripl.execute_prepared, [
+    prepare(ripl, 'predict', '(+ 1 (no_such_symbol))')])
+
+@on_inf_prim("none")
+def testPreparedDirectiveFailureForgetsTail():
+  # Only the directives up to the failing one are recorded; the rest
+  # never got ids.
+  ripl = get_ripl()
+  first = ripl.sivm.core_sivm.engine.predictNextDirectiveId()
+  with assert_raises(VentureException):
+    ripl.execute_prepared([
+      prepare(ripl, 'assume', '(normal 0 1)', symbol=v.symbol('x')),
+      prepare(ripl, 'predict', '(+ 1 (no_such_symbol))'),
+      prepare(ripl, 'predict', '(+ x 1)'),
+    ])
+  assert first + 1 in ripl.directive_id_to_stringable_instruction
+  assert first + 2 not in ripl.directive_id_to_stringable_instruction
+  assert first + 2 not in ripl.directive_id_to_mode
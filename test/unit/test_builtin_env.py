@@ -0,0 +1,69 @@
+# Copyright (c) 2016 MIT Probabilistic Computing Project.
+#
+# This file is part of Venture.
+#
+# Venture is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Venture is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Venture.  If not, see <http://www.gnu.org/licenses/>.
+
+from nose.tools import assert_raises
+from nose.tools import eq_
+
+from venture.lite.builtin import builtInBindings
+from venture.lite.exception import VentureError
+from venture.lite.stop_and_copy import stop_and_copy
+from venture.lite.trace import Trace
+from venture.lite.value import SPRef
+
+def test_builtins_bound_on_lookup():
+  trace = Trace(1)
+  builtins = trace.globalEnv.outerEnv
+  eq_(0, len(builtins.frame))
+  assert trace.boundInGlobalEnv("normal")
+  eq_(0, len(builtins.frame))
+  node = trace.globalEnv.findSymbol("normal")
+  assert isinstance(trace.valueAt(node), SPRef)
+  eq_(["normal"], builtins.frame.keys())
+  assert node is trace.globalEnv.findSymbol("normal")
+  assert not trace.boundInGlobalEnv("no_such_builtin")
+  with assert_raises(VentureError):
+    trace.globalEnv.findSymbol("no_such_builtin")
+
+def test_builtin_table_shared():
+  (t1, t2) = (Trace(1), Trace(2))
+  assert builtInBindings() is t1.globalEnv.outerEnv.builtins
+  assert t1.globalEnv.outerEnv.builtins is t2.globalEnv.outerEnv.builtins
+  # Each trace still gets its own node
+  assert t1.globalEnv.findSymbol("flip") is not t2.globalEnv.findSymbol("flip")
+
+def test_unbind_builtin():
+  trace = Trace(1)
+  trace.unbindInGlobalEnv("flip")
+  assert not trace.boundInGlobalEnv("flip")
+  with assert_raises(VentureError):
+    trace.globalEnv.findSymbol("flip")
+  with assert_raises(VentureError):
+    trace.unbindInGlobalEnv("flip")
+
+def test_copy_keeps_builtins():
+  trace = Trace(1)
+  node = trace.globalEnv.findSymbol("normal")
+  copied = stop_and_copy(trace)
+  builtins = copied.globalEnv.outerEnv
+  assert builtins.trace is copied
+  assert builtins.builtins is trace.globalEnv.outerEnv.builtins
+  node2 = copied.globalEnv.findSymbol("normal")
+  assert node2 is not node
+  eq_(node.address, node2.address)
+  # Builtins first looked up in the copy belong to the copy
+  assert copied.globalEnv.findSymbol("flip") is not \
+    trace.globalEnv.findSymbol("flip")
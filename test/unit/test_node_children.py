@@ -0,0 +1,57 @@
+# Copyright (c) 2016 MIT Probabilistic Computing Project.
+#
+# This file is part of Venture.
+#
+# Venture is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Venture is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Venture.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import random
+
+from nose.tools import assert_raises
+from nose.tools import eq_
+
+from venture.lite.address import emptyAddress
+from venture.lite.node import ConstantNode
+from venture.lite.node import addChild
+from venture.lite.node import childrenOf
+from venture.lite.node import iterChildren
+from venture.lite.node import removeChild
+from venture.lite.orderedset import OrderedSet
+
+def test_children_match_ordered_set():
+  # The compact representations must behave like the OrderedSet they
+  # replace, through every promotion and demotion.
+  prng = random.Random(0)
+  node = ConstantNode(emptyAddress, 0)
+  pool = [ConstantNode(emptyAddress, i) for i in range(20)]
+  expected = []
+  for _ in range(500):
+    child = prng.choice(pool)
+    if prng.random() < 0.6:
+      eq_(child not in expected, addChild(node, child))
+      if child not in expected:
+        expected.append(child)
+    elif child in expected:
+      removeChild(node, child)
+      expected.remove(child)
+    else:
+      with assert_raises(KeyError):
+        removeChild(node, child)
+    eq_(expected, list(childrenOf(node)))
+    eq_(expected, list(iterChildren(node)))
+    eq_(len(expected), len(childrenOf(node)))
+    if not expected:
+      assert node.children is None
+    if len(expected) <= 8:
+      assert not isinstance(node.children, OrderedSet)
@@ -0,0 +1,69 @@
+# Copyright (c) 2016 MIT Probabilistic Computing Project.
+#
+# This file is part of Venture.
+#
+# Venture is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Venture is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Venture.  If not, see <http://www.gnu.org/licenses/>.
+
+import math
+
+import numpy as np
+import numpy.random as npr
+from nose.tools import assert_raises
+from nose.tools import eq_
+
+from venture.lite.utils import effectiveSampleSize
+from venture.lite.utils import resampleLogWeights
+
+SCHEMES = ['multinomial', 'stratified', 'systematic', 'residual']
+
+def test_resample_shape():
+  logs = [math.log(w) for w in [0.1, 0.2, 0.3, 0.4]]
+  for scheme in SCHEMES:
+    for n in [1, 4, 17]:
+      parents = resampleLogWeights(logs, n, npr.RandomState(1), scheme)
+      eq_(n, len(parents))
+      eq_(sorted(parents), parents)
+      assert all(0 <= p < 4 for p in parents)
+
+def test_resample_avoids_impossible():
+  logs = [float('-inf'), 0, float('-inf'), 0]
+  for scheme in SCHEMES:
+    parents = resampleLogWeights(logs, 50, npr.RandomState(2), scheme)
+    assert all(p in [1, 3] for p in parents)
+
+def test_resample_all_impossible():
+  logs = [float('-inf')] * 3
+  for scheme in SCHEMES:
+    parents = resampleLogWeights(logs, 6, npr.RandomState(3), scheme)
+    eq_(6, len(parents))
+
+def test_low_variance_counts():
+  ws = np.array([0.05, 0.15, 0.3, 0.5])
+  n = 20
+  for scheme in ['systematic', 'residual']:
+    for seed in range(10):
+      parents = resampleLogWeights(np.log(ws), n, npr.RandomState(seed),
+                                   scheme)
+      counts = np.bincount(parents, minlength=len(ws))
+      assert np.all(counts >= np.floor(n * ws))
+      if scheme == 'systematic':
+        assert np.all(counts <= np.ceil(n * ws))
+
+def test_unknown_scheme():
+  with assert_raises(ValueError):
+    resampleLogWeights([0, 0], 2, npr.RandomState(4), 'bogus')
+
+def test_effective_sample_size():
+  assert abs(effectiveSampleSize([0, 0, 0, 0]) - 4) < 1e-12
+  assert abs(effectiveSampleSize([0, float('-inf')]) - 1) < 1e-12